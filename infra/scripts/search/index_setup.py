@@ -61,6 +61,8 @@ fields = [
     SearchField(name="title", type=SearchFieldDataType.String),
     SearchField(name="chunk_id", type=SearchFieldDataType.String, key=True, sortable=True, filterable=True, facetable=True, analyzer_name="keyword"),
     SearchField(name="chunk", type=SearchFieldDataType.String, sortable=False, filterable=False, facetable=False),
+    # Stamped on each ingestion (RAG_CACHE_INDEX_VERSION_FIELD in the backend):
+    SearchField(name="last_modified", type=SearchFieldDataType.DateTimeOffset, sortable=True, filterable=True),
     SearchField(name="text_vector", type=SearchFieldDataType.Collection(SearchFieldDataType.Single), vector_search_dimensions=embedding_model_dimensions, vector_search_profile_name="hnswSearch")
     ]
 
@@ -149,6 +151,7 @@ index_projections = SearchIndexerIndexProjection(
                 InputFieldMappingEntry(name="chunk", source="/document/pages/*"),
                 InputFieldMappingEntry(name="text_vector", source="/document/pages/*/text_vector"),
                 InputFieldMappingEntry(name="title", source="/document/metadata_storage_name"),
+                InputFieldMappingEntry(name="last_modified", source="/document/metadata_storage_last_modified"),
             ],
         ),
     ],
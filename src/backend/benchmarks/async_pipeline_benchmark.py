@@ -0,0 +1,75 @@
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT License.
+import argparse
+import json
+import statistics
+import time
+import stubs
+
+"""
+Latency benchmark: sequential vs concurrent per-utterance orchestration.
+
+Runs server.orchestrate_chat and server.orchestrate_chat_async against
+local stubs (TA, router, search, AOAI) and reports per-message latency.
+"""
+
+
+def summarize(latencies: list[float]) -> dict:
+    return {
+        "mean_ms": round(statistics.mean(latencies) * 1000, 1),
+        "p50_ms": round(statistics.median(latencies) * 1000, 1),
+        "max_ms": round(max(latencies) * 1000, 1)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--messages", type=int, default=10)
+    parser.add_argument("--utterances", type=int, default=3)
+    parser.add_argument("--aoai-latency", type=float, default=0.3)
+    parser.add_argument("--search-latency", type=float, default=0.1)
+    parser.add_argument("--language-latency", type=float, default=0.05)
+    parser.add_argument("--router-latency", type=float, default=0.1)
+    parser.add_argument("--max-concurrent-utterances", type=int, default=4)
+    args = parser.parse_args()
+
+    stubs.setup_environment(
+        MAX_CONCURRENT_UTTERANCES=str(args.max_concurrent_utterances)
+    )
+    import server
+    from utils import run_coroutine
+
+    message = " and ".join(f"question {i}" for i in range(args.utterances))
+    results = {}
+
+    stub_latencies = stubs.StubLatencies(
+        aoai=args.aoai_latency,
+        search=args.search_latency,
+        language=args.language_latency,
+        router=args.router_latency
+    )
+
+    stubs.configure_server(server, stub_latencies)
+    latencies = []
+    for i in range(args.messages):
+        start = time.perf_counter()
+        server.orchestrate_chat(message, chat_id=str(i))
+        latencies.append(time.perf_counter() - start)
+    results["sequential"] = summarize(latencies)
+
+    stubs.configure_server(server, stub_latencies, is_async=True)
+    latencies = []
+    for i in range(args.messages):
+        start = time.perf_counter()
+        run_coroutine(server.orchestrate_chat_async(message, chat_id=str(i)))
+        latencies.append(time.perf_counter() - start)
+    results["concurrent"] = summarize(latencies)
+
+    results["speedup"] = round(
+        results["sequential"]["mean_ms"] / results["concurrent"]["mean_ms"], 2
+    )
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
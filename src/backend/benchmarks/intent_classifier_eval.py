@@ -0,0 +1,95 @@
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT License.
+import argparse
+import json
+import os
+import stubs
+
+"""
+Train and evaluate the local intent pre-classifier.
+
+Trains on the CLU/CQA project exports, then reports per threshold the
+coverage (utterances routed locally, i.e. remote calls skipped) and the
+accuracy of local decisions on labelled fixtures. Fixture label
+"fallback" means the utterance should end up in the fallback, locally
+or after the remote router. With --save-model, writes the trained model
+for INTENT_CLASSIFIER_MODEL.
+"""
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "..", "infra", "data")
+CLU_IMPORT = os.path.join(DATA_DIR, "clu_import.json")
+CQA_IMPORT = os.path.join(DATA_DIR, "cqa_import.json")
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "intent_fixtures.json")
+
+
+def evaluate(
+    classifier,
+    fixtures: list[dict],
+    threshold: float
+) -> dict:
+    """
+    Coverage and accuracy of confident local decisions at threshold.
+    """
+    classifier.threshold = threshold
+    local = correct = 0
+    errors = []
+    for fixture in fixtures:
+        label, confidence, margin = classifier.predict(fixture["text"])
+        if label is None or not classifier.is_confident(confidence, margin):
+            continue
+        local += 1
+        if label == fixture["label"]:
+            correct += 1
+        else:
+            errors.append({"text": fixture["text"], "label": fixture["label"], "predicted": label})
+
+    return {
+        "threshold": threshold,
+        "local": local,
+        "coverage": round(local / len(fixtures), 3),
+        "accuracy": round(correct / local, 3) if local else None,
+        "errors": errors
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--clu", default=CLU_IMPORT)
+    parser.add_argument("--cqa", default=CQA_IMPORT)
+    parser.add_argument("--fixtures", default=FIXTURES)
+    parser.add_argument("--thresholds", type=float, nargs="+", default=[0.4, 0.5, 0.6, 0.7, 0.8])
+    parser.add_argument("--save-model")
+    args = parser.parse_args()
+
+    # Resolve paths before setup_environment changes directory:
+    clu_path, cqa_path, fixtures_path = map(os.path.abspath, (args.clu, args.cqa, args.fixtures))
+    save_path = os.path.abspath(args.save_model) if args.save_model else None
+
+    stubs.setup_environment()
+    from intent_classifier import IntentClassifier, train
+
+    with open(clu_path, "r") as fp:
+        clu_project = json.load(fp)
+    with open(cqa_path, "r") as fp:
+        cqa_project = json.load(fp)
+    with open(fixtures_path, "r") as fp:
+        fixtures = json.load(fp)
+
+    model = train(clu_project, cqa_project)
+    if save_path:
+        with open(save_path, "w") as fp:
+            json.dump(model, fp)
+
+    classifier = IntentClassifier(model)
+    results = {
+        "examples": len(model["examples"]),
+        "labels": len(model["labels"]),
+        "fixtures": len(fixtures),
+        "margin": classifier.margin,
+        "thresholds": [evaluate(classifier, fixtures, threshold) for threshold in args.thresholds]
+    }
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
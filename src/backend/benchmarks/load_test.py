@@ -0,0 +1,108 @@
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT License.
+import argparse
+import json
+import time
+import uuid
+import threading
+import requests
+import stubs
+from concurrent.futures import ThreadPoolExecutor
+
+"""
+Load test: throughput and tail latency of /chat under concurrent clients.
+
+Serve the app with stubbed Azure dependencies, e.g.:
+    gunicorn -c ../src/gunicorn.conf.py 'load_test:create_stub_app()'
+then run:
+    python load_test.py --url http://localhost:7000 --concurrency 32 --requests 1000
+"""
+
+
+def create_stub_app(
+    aoai_latency: float = 0.3,
+    search_latency: float = 0.1,
+    language_latency: float = 0.05,
+    router_latency: float = 0.1
+):
+    """
+    Create Flask app with stubbed clients (gunicorn app factory).
+    """
+    stubs.setup_environment()
+    import server
+
+    stubs.configure_server(
+        server,
+        stubs.StubLatencies(
+            aoai=aoai_latency,
+            search=search_latency,
+            language=language_latency,
+            router=router_latency,
+            jitter=0.2 * aoai_latency
+        ),
+        is_async=server.ASYNC_PIPELINE_ENABLED
+    )
+    return server.app
+
+
+def percentile(
+    values: list[float],
+    p: float
+) -> float:
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--url", default="http://localhost:7000")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--utterances", type=int, default=2)
+    args = parser.parse_args()
+
+    message = " and ".join(f"question {i}" for i in range(args.utterances))
+    sessions = threading.local()
+    latencies = []
+    errors = 0
+    lock = threading.Lock()
+
+    def send(_) -> None:
+        nonlocal errors
+        if not hasattr(sessions, "session"):
+            sessions.session = requests.Session()
+
+        start = time.perf_counter()
+        try:
+            response = sessions.session.post(
+                f"{args.url}/chat",
+                json={"message": message, "conversation_id": str(uuid.uuid4())}
+            )
+            response.raise_for_status()
+        except requests.RequestException:
+            with lock:
+                errors += 1
+            return
+
+        with lock:
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+        list(executor.map(send, range(args.requests)))
+    elapsed = time.perf_counter() - start
+
+    results = {
+        "requests": args.requests,
+        "errors": errors,
+        "concurrency": args.concurrency,
+        "throughput_rps": round(len(latencies) / elapsed, 2),
+        "p50_ms": round(percentile(latencies, 50) * 1000, 1) if latencies else None,
+        "p99_ms": round(percentile(latencies, 99) * 1000, 1) if latencies else None
+    }
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
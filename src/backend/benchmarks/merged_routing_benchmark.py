@@ -0,0 +1,160 @@
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT License.
+import argparse
+import asyncio
+import json
+import statistics
+import time
+import stubs
+
+"""
+Benchmark: per-utterance vs. merged function-calling routing.
+
+Per-utterance mode makes one extraction completion plus one function-calling
+completion per utterance; merged mode makes one tool-calling completion per
+message and routes its tool calls concurrently. Both run against local stubs
+(AOAI, CLU/CQA runtimes, TA, search) and report LLM calls per message and
+end-to-end latency.
+"""
+
+
+def summarize(latencies: list[float]) -> dict:
+    return {
+        "mean_ms": round(statistics.mean(latencies) * 1000, 1),
+        "p50_ms": round(statistics.median(latencies) * 1000, 1),
+        "max_ms": round(max(latencies) * 1000, 1)
+    }
+
+
+def configure_function_calling(
+    server,
+    latencies: stubs.StubLatencies,
+    merged: bool,
+    is_async: bool
+) -> list:
+    """
+    Configure server with a stubbed FUNCTION_CALLING router.
+
+    Returns the stub completions of every AOAI client (for call counts).
+    """
+    from aoai_client import AOAIClient
+    from router.function_calling_router import (
+        create_function_calling_router, create_merged_function_calling_router,
+        create_router_hook, create_tool_call_recorder, get_tools
+    )
+    from router.router_type import RouterType
+    from router.router_utils import create_threaded_router
+
+    stubs.configure_server(server, latencies, is_async=is_async)
+    clu_router = stubs.create_stub_router(latencies.router, result={
+        "kind": "clu_result",
+        "error": None,
+        "intent": "OrderStatus",
+        "entities": [{"category": "OrderId", "text": "12345678"}]
+    })
+    cqa_router = stubs.create_stub_router(latencies.router, result={
+        "kind": "cqa_result",
+        "error": None,
+        "answer": "Stub knowledge base answer.",
+        "question": "Stub question"
+    })
+
+    if merged:
+        tool_names = ["get_clu", "get_cqa", "get_fallback"]
+        functions = {name: create_tool_call_recorder(name) for name in tool_names}
+        responder = stubs.split_and_route
+    else:
+        tool_names = ["get_clu", "get_cqa"]
+        functions = {
+            "get_clu": create_router_hook(clu_router),
+            "get_cqa": create_router_hook(cqa_router)
+        }
+        responder = stubs.route_utterance
+
+    routing_client = AOAIClient(
+        endpoint=stubs.STUB_ENVIRONMENT["AOAI_ENDPOINT"],
+        deployment="stub",
+        system_message="route",
+        function_calling=True,
+        tools=get_tools(names=tool_names),
+        functions=functions,
+        return_functions=True
+    )
+    routing_client.chat = stubs.create_stub_chat(latencies.aoai, responder)
+
+    orchestrator = server.orchestrator.get()
+    orchestrator.router_type = RouterType.FUNCTION_CALLING
+    if merged:
+        router = create_merged_function_calling_router(
+            aoai_client=routing_client,
+            clu_router=clu_router,
+            cqa_router=cqa_router
+        )
+        orchestrator.merged_routing = True
+        orchestrator.merged_router = create_threaded_router(router) if is_async else router
+    else:
+        router = create_function_calling_router(aoai_client=routing_client)
+        orchestrator.router = create_threaded_router(router) if is_async else router
+
+    return [
+        routing_client.chat.completions,
+        server.extract_client.get().chat.completions,
+        server.rag_client.get().chat.completions
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--messages", type=int, default=10)
+    parser.add_argument(
+        "--message",
+        default="where is order 12345678 and what is your refund policy and which tent is best for winter"
+    )
+    parser.add_argument("--aoai-latency", type=float, default=0.3)
+    parser.add_argument("--search-latency", type=float, default=0.1)
+    parser.add_argument("--language-latency", type=float, default=0.05)
+    parser.add_argument("--router-latency", type=float, default=0.1)
+    parser.add_argument("--async-pipeline", action="store_true")
+    args = parser.parse_args()
+
+    stubs.setup_environment(
+        ASYNC_PIPELINE_ENABLED="true" if args.async_pipeline else "false"
+    )
+    import server
+
+    stub_latencies = stubs.StubLatencies(
+        aoai=args.aoai_latency,
+        search=args.search_latency,
+        language=args.language_latency,
+        router=args.router_latency
+    )
+
+    results = {"message": args.message, "async_pipeline": args.async_pipeline}
+    for mode in ("per_utterance", "merged"):
+        completions = configure_function_calling(
+            server,
+            stub_latencies,
+            merged=mode == "merged",
+            is_async=args.async_pipeline
+        )
+
+        latencies = []
+        for i in range(args.messages):
+            start = time.perf_counter()
+            if args.async_pipeline:
+                responses = asyncio.run(server.orchestrate_chat_async(args.message, chat_id=str(i)))
+            else:
+                responses = server.orchestrate_chat(args.message, chat_id=str(i))
+            latencies.append(time.perf_counter() - start)
+
+        results[mode] = {
+            **summarize(latencies),
+            "responses": len(responses),
+            "llm_calls_per_message": sum(c.calls for c in completions) / args.messages
+        }
+
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
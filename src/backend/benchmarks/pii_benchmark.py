@@ -0,0 +1,107 @@
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT License.
+import argparse
+import json
+import random
+import timeit
+import stubs
+
+"""
+Micro-benchmark: PII redaction/reconstruction on long transcripts.
+
+Compares the compiled single-pass RedactionMapping with the previous
+per-entity str.replace loop.
+"""
+
+FIRST_NAMES = ["John", "Maria", "Wei", "Aisha", "Lars", "Priya", "Diego", "Yuki"]
+LAST_NAMES = ["Smith", "Garcia", "Chen", "Okafor", "Berg", "Patel", "Lopez", "Sato"]
+FILLER = "I ordered the trail boots last week and would like to know when they arrive."
+
+
+def create_mapping(
+    entities: int
+) -> dict[str, str]:
+    """
+    Create mapping with overlapping entities ("John" and "John Smith").
+    """
+    mapping = {}
+    for i in range(entities):
+        first = FIRST_NAMES[i % len(FIRST_NAMES)]
+        last = LAST_NAMES[(i // len(FIRST_NAMES)) % len(LAST_NAMES)]
+        entity = f"{first} {last} {i}" if i % 2 else f"{first}{i}"
+        mapping[f"{{PII_PERSON_{i + 1}}}"] = entity
+    return mapping
+
+
+def create_transcript(
+    mapping: dict[str, str],
+    length: int
+) -> str:
+    entities = list(mapping.values())
+    parts = []
+    while sum(len(p) for p in parts) < length:
+        parts.append(FILLER)
+        parts.append(random.choice(entities))
+    return " ".join(parts)
+
+
+def apply_mapping_replace(
+    text: str,
+    mapping: dict[str, str],
+    redact: bool = True
+) -> str:
+    """
+    Previous implementation: one str.replace per entity.
+    """
+    for redaction, entity in mapping.items():
+        if redact:
+            text = text.replace(entity, redaction)
+        else:
+            text = text.replace(redaction, entity)
+    return text
+
+
+def time_per_call(
+    func,
+    number: int
+) -> float:
+    return min(timeit.repeat(func, number=number, repeat=5)) / number * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--entities", type=int, nargs="+", default=[5, 50, 500])
+    parser.add_argument("--length", type=int, nargs="+", default=[1000, 20000, 200000])
+    parser.add_argument("--number", type=int, default=20)
+    args = parser.parse_args()
+
+    stubs.setup_environment()
+    from pii_redacter import RedactionMapping
+
+    random.seed(0)
+    results = []
+    for entities in args.entities:
+        mapping = create_mapping(entities)
+        for length in args.length:
+            text = create_transcript(mapping, length)
+            compiled = RedactionMapping(mapping)
+            redacted = compiled.redact(text)
+            assert compiled.reconstruct(redacted) == text
+
+            results.append({
+                "entities": entities,
+                "length": len(text),
+                "compile_us": round(time_per_call(lambda: RedactionMapping(mapping), args.number), 1),
+                "redact_us": round(time_per_call(lambda: compiled.redact(text), args.number), 1),
+                "redact_replace_us": round(time_per_call(
+                    lambda: apply_mapping_replace(text, mapping, redact=True), args.number), 1),
+                "reconstruct_us": round(time_per_call(lambda: compiled.reconstruct(redacted), args.number), 1),
+                "reconstruct_replace_us": round(time_per_call(
+                    lambda: apply_mapping_replace(redacted, mapping, redact=False), args.number), 1)
+            })
+
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
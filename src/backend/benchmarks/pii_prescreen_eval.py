@@ -0,0 +1,108 @@
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT License.
+import argparse
+import json
+import os
+import stubs
+
+"""
+Evaluate the local PII pre-screen on a labelled fixture set.
+
+Reports the remote-call skip rate, unsafe skips (skipped texts that
+contain labelled entities) and precision/recall of local detection per
+pattern category. With --remote, labels come from Azure AI Language
+instead of the fixture file (requires LANGUAGE_ENDPOINT and credentials).
+"""
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "pii_fixtures.json")
+
+
+def load_labels(
+    fixtures: list[dict],
+    categories: list[str],
+    remote: bool
+) -> list[set]:
+    """
+    Labelled (category, text) entities per fixture.
+    """
+    if not remote:
+        return [
+            {(e["category"], e["text"]) for e in f["entities"] if e["category"] in categories}
+            for f in fixtures
+        ]
+
+    from pii_redacter import recognize_remotely
+    labels = []
+    for f in fixtures:
+        result = recognize_remotely(f["text"], "en")
+        labels.append({
+            (e.category.upper(), e.text) for e in result.entities
+            if e.category.upper() in categories
+        })
+    return labels
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--fixtures", default=FIXTURES)
+    parser.add_argument(
+        "--categories",
+        default="PERSON,ORGANIZATION,EMAIL,PHONENUMBER,CREDITCARDNUMBER,ORDERID"
+    )
+    parser.add_argument("--remote", action="store_true")
+    args = parser.parse_args()
+
+    if args.remote:
+        # Keep real endpoints from the environment:
+        stubs.setup_environment(**{k: os.environ[k] for k in stubs.STUB_ENVIRONMENT if k in os.environ})
+    else:
+        stubs.setup_environment()
+    from pii_prescreen import PATTERN_DETECTORS, is_clean, recognize_locally
+
+    categories = args.categories.upper().split(",")
+    with open(args.fixtures, "r") as fp:
+        fixtures = json.load(fp)
+    labels = load_labels(fixtures, categories, args.remote)
+
+    skipped = 0
+    unsafe_skips = []
+    counts = {c: {"tp": 0, "fp": 0, "fn": 0} for c in PATTERN_DETECTORS if c in categories}
+    for fixture, expected in zip(fixtures, labels):
+        text = fixture["text"]
+        if is_clean(text, categories):
+            skipped += 1
+            if expected:
+                unsafe_skips.append(text)
+
+        detected = {(e.category, e.text) for e in recognize_locally(text, categories).entities}
+        for category in counts:
+            found = {e for e in detected if e[0] == category}
+            wanted = {e for e in expected if e[0] == category}
+            counts[category]["tp"] += len(found & wanted)
+            counts[category]["fp"] += len(found - wanted)
+            counts[category]["fn"] += len(wanted - found)
+
+    detection = {}
+    for category, c in counts.items():
+        detected = c["tp"] + c["fp"]
+        labelled = c["tp"] + c["fn"]
+        detection[category] = {
+            **c,
+            "precision": round(c["tp"] / detected, 3) if detected else None,
+            "recall": round(c["tp"] / labelled, 3) if labelled else None
+        }
+
+    results = {
+        "fixtures": len(fixtures),
+        "labels": "remote" if args.remote else "fixture",
+        "categories": categories,
+        "skipped": skipped,
+        "skip_rate": round(skipped / len(fixtures), 3),
+        "unsafe_skips": unsafe_skips,
+        "local_detection": detection
+    }
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,275 @@
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT License.
+import argparse
+import datetime
+import json
+import os
+import platform
+import random
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import stubs
+from load_test import percentile
+
+"""
+Offline replay benchmark: end-to-end /chat performance per router type.
+
+Starts local HTTPS stand-ins for every Azure dependency (see
+stub_servers) and replays a conversation corpus through server.app
+(in-process Flask test clients; conversations concurrently, turns in
+order) once per ROUTER_TYPE. Reports throughput, p50/p95/p99 latency,
+remote calls and AOAI tokens per message and per-stage latency (tracing
+spans), as JSON (--output) for comparing runs over time.
+
+The corpus is a JSON lines file of {"conversation_id", "message"}
+records (e.g. recorded from logs), or synthetic: messages of one to
+three utterances from data/intent_fixtures.json joined with " and ".
+CLU/CQA authoring (only used at FUNCTION_CALLING startup) stays in-process.
+"""
+
+ROUTER_TYPES = ["BYPASS", "CLU", "CQA", "ORCHESTRATION", "FUNCTION_CALLING", "TRIAGE_AGENT"]
+
+
+def load_corpus(
+    path: str
+) -> list[list[str]]:
+    """
+    Conversations (messages in order) from a JSON lines corpus.
+    """
+    conversations = {}
+    with open(path, "r") as fp:
+        for line in fp:
+            if line.strip():
+                record = json.loads(line)
+                conversations.setdefault(record["conversation_id"], []).append(record["message"])
+    return list(conversations.values())
+
+
+def create_corpus(
+    conversations: int,
+    turns: int,
+    seed: int = 0
+) -> list[list[str]]:
+    """
+    Synthetic conversations from the labelled intent fixtures.
+    """
+    with open(os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "intent_fixtures.json"), "r") as fp:
+        texts = [fixture["text"] for fixture in json.load(fp)]
+    rng = random.Random(seed)
+    return [
+        [" and ".join(rng.sample(texts, rng.randint(1, 3))) for _ in range(turns)]
+        for _ in range(conversations)
+    ]
+
+
+def create_servers(args):
+    """
+    Start stub services (after trusting their certificate, before aiohttp is imported).
+    """
+    cert_path, key_path = stubs.create_certificate(tempfile.mkdtemp())
+    import stub_servers
+    from aoai_client import get_prompt
+
+    def latency(mean: float) -> stubs.Latency:
+        return stubs.Latency(mean, jitter=args.jitter * mean, sigma=args.sigma)
+
+    servers = stub_servers.StubServers(
+        [
+            stub_servers.create_aoai_service(
+                latency(args.aoai_latency),
+                stub_servers.create_aoai_responder(get_prompt("extract_utterances.txt"))
+            ),
+            stub_servers.create_search_service(latency(args.search_latency)),
+            stub_servers.create_language_service(
+                latency(args.language_latency),
+                orchestration_project=os.environ["ORCHESTRATION_PROJECT_NAME"]
+            ),
+            stub_servers.create_agents_service(latency(args.agents_latency), latency(args.run_latency))
+        ],
+        cert_path,
+        key_path
+    ).start()
+    os.environ.update(servers.get_environment())
+    return servers
+
+
+def configure_router(
+    server,
+    router_type: str,
+    args
+) -> None:
+    """
+    Fresh clients and orchestrator for router type (as in a new worker).
+    """
+    from router import function_calling_router
+    from router.router_type import RouterType
+
+    if router_type == "FUNCTION_CALLING":
+        authoring_latency = stubs.Latency(args.language_latency)
+        function_calling_router.project_snapshot = None
+        function_calling_router.create_clu_authoring_client = lambda: stubs.StubAuthoringClient(
+            authoring_latency, authoring_latency, project="clu"
+        )
+        function_calling_router.create_cqa_authoring_client = lambda: stubs.StubAuthoringClient(
+            authoring_latency, authoring_latency, project="cqa"
+        )
+
+    server.router_type = RouterType(router_type)
+    server.rag_client.set(server.create_rag_client())
+    server.extract_client.set(server.create_extract_client())
+    server.orchestrator.set(server.create_orchestrator())
+
+
+def replay(
+    app,
+    conversations: list[list[str]],
+    concurrency: int,
+    prefix: str
+) -> tuple[list[float], int, float]:
+    """
+    Replay conversations; returns message latencies, errors and elapsed time.
+    """
+    latencies = []
+    errors = 0
+    lock = threading.Lock()
+
+    def converse(item: tuple[int, list[str]]) -> None:
+        nonlocal errors
+        index, messages = item
+        client = app.test_client()
+        for message in messages:
+            start = time.perf_counter()
+            response = client.post("/chat", json={"message": message, "conversation_id": f"{prefix}-{index}"})
+            with lock:
+                if response.status_code != 200:
+                    errors += 1
+                else:
+                    latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(converse, enumerate(conversations)))
+    return latencies, errors, time.perf_counter() - start
+
+
+def summarize(
+    latencies: list[float],
+    errors: int,
+    elapsed: float,
+    servers,
+    stages: dict
+) -> dict:
+    messages = len(latencies) + errors
+    services = servers.get_metrics()
+    calls = {name: sum(metrics["calls"].values()) for name, metrics in services.items()}
+    tokens = services["aoai"]["tokens"]
+
+    def ms(seconds: float) -> float:
+        return round(seconds * 1000, 1)
+
+    def per_message(value: float) -> float:
+        return round(value / messages, 2) if messages else 0.0
+
+    return {
+        "messages": messages,
+        "errors": errors,
+        "throughput_msg_s": round(len(latencies) / elapsed, 2),
+        "latency_ms": {
+            "mean": ms(sum(latencies) / len(latencies)),
+            "p50": ms(percentile(latencies, 50)),
+            "p95": ms(percentile(latencies, 95)),
+            "p99": ms(percentile(latencies, 99)),
+            "max": ms(max(latencies))
+        } if latencies else None,
+        "remote_calls_per_message": {
+            "total": per_message(sum(calls.values())),
+            **{name: per_message(count) for name, count in calls.items()}
+        },
+        "tokens_per_message": {
+            "prompt": per_message(tokens.get("prompt_tokens", 0)),
+            "completion": per_message(tokens.get("completion_tokens", 0)),
+            "total": per_message(sum(tokens.values()))
+        },
+        "calls": {name: metrics["calls"] for name, metrics in services.items()},
+        "stages_ms": {
+            # Histogram estimates (bucket bounds):
+            name: {"count": stage["count"], "p50": round(stage["p50_ms"], 1), "p95": round(stage["p95_ms"], 1)}
+            for name, stage in stages.items()
+        }
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--router-types", nargs="+", default=ROUTER_TYPES, choices=ROUTER_TYPES)
+    parser.add_argument("--corpus", help="JSON lines of {conversation_id, message} (default: synthetic)")
+    parser.add_argument("--conversations", type=int, default=20)
+    parser.add_argument("--turns", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--warmup", type=int, default=2, help="conversations replayed before measuring")
+    parser.add_argument("--aoai-latency", type=float, default=0.3)
+    parser.add_argument("--search-latency", type=float, default=0.1)
+    parser.add_argument("--language-latency", type=float, default=0.05)
+    parser.add_argument("--agents-latency", type=float, default=0.05)
+    parser.add_argument("--run-latency", type=float, default=1.0)
+    parser.add_argument("--jitter", type=float, default=0.0, help="uniform jitter, fraction of the mean")
+    parser.add_argument("--sigma", type=float, default=0.0, help="lognormal latency sigma (overrides --jitter)")
+    parser.add_argument("--async-pipeline", action="store_true")
+    parser.add_argument("--output", help="write results JSON to this path")
+    args = parser.parse_args()
+    # Relative to the working directory (setup_environment changes it):
+    corpus_path = os.path.abspath(args.corpus) if args.corpus else None
+    output_path = os.path.abspath(args.output) if args.output else None
+
+    stubs.setup_environment(
+        ASYNC_PIPELINE_ENABLED=str(args.async_pipeline).lower(),
+        TRIAGE_AGENT_ID="stub-agent",
+        PROJECT_SNAPSHOT_PATH=os.path.join(tempfile.mkdtemp(), "snapshot.json")
+    )
+    servers = create_servers(args)
+    import client_registry
+    import server
+    import tracing
+    import stub_servers
+
+    # Static tokens instead of Azure identity:
+    client_registry.get_azure_credential = stub_servers.StubCredential
+    client_registry.get_azure_credential_async = stub_servers.AsyncStubCredential
+    client_registry.credential.set(client_registry.CachedTokenCredential(stub_servers.StubCredential()))
+    client_registry.credential_async.set(client_registry.AsyncCachedTokenCredential(stub_servers.AsyncStubCredential()))
+
+    if corpus_path:
+        corpus = load_corpus(corpus_path)
+    else:
+        corpus = create_corpus(args.conversations + args.warmup, args.turns, args.seed)
+    warmup, corpus = corpus[:args.warmup], corpus[args.warmup:]
+
+    results = {
+        "timestamp": datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "settings": vars(args),
+        "router_types": {}
+    }
+    for router_type in args.router_types:
+        configure_router(server, router_type, args)
+        replay(server.app, warmup, args.concurrency, f"warmup-{router_type}")
+        servers.reset()
+        tracing.histograms.reset()
+        latencies, errors, elapsed = replay(server.app, corpus, args.concurrency, router_type)
+        results["router_types"][router_type] = summarize(
+            latencies, errors, elapsed, servers, tracing.histograms.get_metrics()
+        )
+
+    output = json.dumps(results, indent=2)
+    if output_path:
+        with open(output_path, "w") as fp:
+            fp.write(output)
+    print(output)
+    servers.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT License.
+import argparse
+import json
+import os
+import tempfile
+import time
+import stubs
+
+"""
+Benchmark: function-calling router startup with and without the project snapshot.
+
+Times worker startups (creating the function-calling AOAI client, which
+needs the CLU intents and CQA questions) against stub authoring clients
+whose export jobs take --export-latency seconds:
+
+- no_snapshot: PROJECT_SNAPSHOT_ENABLED=false, every worker exports.
+- cold: no snapshot on disk yet, the first worker exports and writes it.
+- warm: workers start from the snapshot (version checked in the background).
+- changed: the projects changed since the snapshot; workers still start
+  from it, and the refreshed prompt is in place after refresh_ms.
+"""
+
+
+def start_worker(
+    function_calling_router,
+    enabled: bool = True
+) -> float:
+    """
+    Time one worker startup (module state reset as in a new process).
+    """
+    function_calling_router.PROJECT_SNAPSHOT_ENABLED = enabled
+    function_calling_router.project_snapshot = None
+    start = time.perf_counter()
+    function_calling_router.create_function_calling_client(
+        prompt_template=function_calling_router.FUNCTION_CALLING_PROMPT,
+        tools=function_calling_router.get_tools(names=["get_clu", "get_cqa"]),
+        functions={}
+    )
+    return time.perf_counter() - start
+
+
+def wait_refreshed(
+    function_calling_router,
+    timeout: float = 60.0
+) -> float:
+    """
+    Time until the background refresh has replaced the snapshot.
+    """
+    start = time.perf_counter()
+    snapshot = function_calling_router.project_snapshot
+    while snapshot.metrics.get_metrics()["refreshes"] == 0 and time.perf_counter() - start < timeout:
+        time.sleep(0.01)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--export-latency", type=float, default=5.0)
+    parser.add_argument("--authoring-latency", type=float, default=0.05)
+    args = parser.parse_args()
+
+    snapshot_path = os.path.join(tempfile.mkdtemp(), "snapshot.json")
+    stubs.setup_environment(
+        PROJECT_SNAPSHOT_PATH=snapshot_path,
+        PROJECT_SNAPSHOT_REFRESH_INTERVAL="0"
+    )
+    from router import function_calling_router
+
+    export_latency = stubs.Latency(args.export_latency)
+    latency = stubs.Latency(args.authoring_latency)
+    clu_client = stubs.StubAuthoringClient(export_latency, latency, project="clu")
+    cqa_client = stubs.StubAuthoringClient(export_latency, latency, project="cqa")
+    function_calling_router.create_clu_authoring_client = lambda: clu_client
+    function_calling_router.create_cqa_authoring_client = lambda: cqa_client
+
+    def ms(seconds: float) -> float:
+        return round(seconds * 1000, 1)
+
+    results = {"export_latency_s": args.export_latency, "workers": args.workers}
+    results["no_snapshot"] = [
+        ms(start_worker(function_calling_router, enabled=False)) for _ in range(args.workers)
+    ]
+    results["cold"] = [ms(start_worker(function_calling_router)) for _ in range(args.workers)]
+    results["warm"] = [ms(start_worker(function_calling_router)) for _ in range(args.workers)]
+
+    clu_client.version = "2024-02-01T00:00:00Z"
+    results["changed"] = {
+        "startup_ms": ms(start_worker(function_calling_router)),
+        "refresh_ms": ms(wait_refreshed(function_calling_router))
+    }
+    results["exports"] = clu_client.exports + cqa_client.exports
+    results["snapshot"] = function_calling_router.get_snapshot_metrics()
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
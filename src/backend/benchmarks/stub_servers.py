@@ -0,0 +1,582 @@
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT License.
+import os
+import re
+import ssl
+import json
+import time
+import asyncio
+import hashlib
+import socket
+import threading
+from collections import Counter
+from typing import Awaitable, Callable
+from aiohttp import web
+from azure.core.credentials import AccessToken
+import stubs
+
+"""
+Local HTTPS stand-ins for the Azure services: AOAI, AI Search, AI Language
+(Text Analytics, CLU, CQA runtime) and the agents API.
+
+Unlike the in-process stubs, the real SDK clients (with the shared
+credential, transports and tracing) call these over the network. Each
+service answers after a sample of its latency distribution with a canned
+response (CLU intents by keyword, CQA answers from infra/data), and
+counts calls per operation and AOAI tokens. Servers share one
+self-signed certificate (Azure SDK clients refuse bearer tokens over
+plain HTTP), see stubs.create_certificate.
+"""
+
+# Default answer (no match), as returned by CQA:
+CQA_NO_ANSWER = "No answer found"
+CQA_MIN_SCORE = 0.3
+ORDER_ID_PATTERN = re.compile(r"\b\d{8}\b")
+EMAIL_PATTERN = re.compile(r"\b[\w.+-]+@[\w-]+\.[\w.]+\b")
+
+
+class StubCredential():
+    """
+    Credential returning a static token (sync and async).
+    """
+
+    def get_token(self, *scopes: str, **kwargs) -> AccessToken:
+        return AccessToken("stub-token", int(time.time()) + 3600)
+
+    def close(self) -> None:
+        pass
+
+
+class AsyncStubCredential(StubCredential):
+    async def get_token(self, *scopes: str, **kwargs) -> AccessToken:
+        return AccessToken("stub-token", int(time.time()) + 3600)
+
+    async def close(self) -> None:
+        pass
+
+
+class StubService():
+    """
+    HTTPS service dispatching (method, path pattern) routes, counting calls.
+
+    Handlers take the request, the path match and the JSON body (None if
+    empty) and return a JSON-serializable response or a web.StreamResponse.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        latency: stubs.Latency
+    ):
+        self.name = name
+        self.latency = latency
+        self.routes = []
+        self.calls = Counter()
+        self.tokens = Counter()
+        self.lock = threading.Lock()
+        self.url = None
+
+    def route(
+        self,
+        method: str,
+        pattern: str,
+        operation: str | None,
+        handler: Callable
+    ) -> None:
+        self.routes.append((method, re.compile(pattern + "$"), operation, handler))
+
+    def count(
+        self,
+        operation: str,
+        amount: int = 1
+    ) -> None:
+        with self.lock:
+            self.calls[operation] += amount
+
+    def count_tokens(
+        self,
+        prompt_tokens: int,
+        completion_tokens: int
+    ) -> None:
+        with self.lock:
+            self.tokens["prompt_tokens"] += prompt_tokens
+            self.tokens["completion_tokens"] += completion_tokens
+
+    def reset(self) -> None:
+        with self.lock:
+            self.calls = Counter()
+            self.tokens = Counter()
+
+    def get_metrics(self) -> dict:
+        with self.lock:
+            return {
+                "calls": dict(self.calls),
+                "tokens": dict(self.tokens)
+            }
+
+    async def handle(
+        self,
+        request: web.Request
+    ) -> web.StreamResponse:
+        for method, pattern, operation, handler in self.routes:
+            match = pattern.match(request.path)
+            if request.method == method and match:
+                if operation is not None:
+                    self.count(operation)
+                body = await request.json() if request.can_read_body else None
+                await self.latency.wait_async()
+                response = await handler(request, match, body)
+                if isinstance(response, web.StreamResponse):
+                    return response
+                return web.json_response(response)
+        return web.json_response(
+            {"error": {"code": "NotFound", "message": f"{request.method} {request.path}"}},
+            status=404
+        )
+
+    def create_app(self) -> web.Application:
+        app = web.Application(client_max_size=16 * 1024 * 1024)
+        app.router.add_route("*", "/{path:.*}", self.handle)
+        return app
+
+
+def create_completion_body(
+    content: str | list[tuple[str, dict]],
+    usage: dict
+) -> dict:
+    message = {"role": "assistant", "content": None}
+    finish_reason = "stop"
+    if isinstance(content, list):
+        message["tool_calls"] = [
+            {
+                "id": f"call_{i}",
+                "type": "function",
+                "function": {"name": name, "arguments": json.dumps(arguments)}
+            }
+            for i, (name, arguments) in enumerate(content)
+        ]
+        finish_reason = "tool_calls"
+    else:
+        message["content"] = content
+    return {
+        "id": "chatcmpl-stub",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": "stub",
+        "choices": [{"index": 0, "finish_reason": finish_reason, "message": message}],
+        "usage": usage
+    }
+
+
+def create_aoai_responder(
+    extract_prompt: str
+) -> Callable[[dict], str | list[tuple[str, dict]]]:
+    """
+    Respond by request kind: utterance extraction (system prompt),
+    merged or per-utterance function calling (tools), else a RAG answer.
+    """
+    def respond(body: dict) -> str | list[tuple[str, dict]]:
+        messages = body["messages"]
+        tools = [tool["function"]["name"] for tool in body.get("tools") or []]
+        if "get_fallback" in tools:
+            return stubs.split_and_route(messages)
+        if tools:
+            return stubs.route_utterance(messages)
+        if messages[0]["role"] == "system" and messages[0]["content"] == extract_prompt:
+            return stubs.split_utterances(messages)
+        return stubs.echo_answer(messages)
+
+    return respond
+
+
+def create_aoai_service(
+    latency: stubs.Latency,
+    responder: Callable[[dict], str | list[tuple[str, dict]]]
+) -> StubService:
+    """
+    Chat completions (optionally streamed) and embeddings.
+    """
+    service = StubService("aoai", latency)
+
+    async def chat_completions(request, match, body):
+        content = responder(body)
+        usage = {
+            "prompt_tokens": sum(stubs.count_words(message) for message in body["messages"]),
+            "completion_tokens": len(content.split()) if isinstance(content, str) else 10 * len(content)
+        }
+        usage["total_tokens"] = usage["prompt_tokens"] + usage["completion_tokens"]
+        service.count_tokens(usage["prompt_tokens"], usage["completion_tokens"])
+        if not body.get("stream"):
+            return create_completion_body(content, usage)
+
+        # Server-sent chunks (latency already waited counts as time to first token):
+        response = web.StreamResponse(headers={"Content-Type": "text/event-stream"})
+        await response.prepare(request)
+        tokens = [t + " " for t in content.split(" ")]
+        for token in tokens:
+            chunk = {
+                "id": "chatcmpl-stub",
+                "object": "chat.completion.chunk",
+                "created": int(time.time()),
+                "model": "stub",
+                "choices": [{"index": 0, "delta": {"content": token}, "finish_reason": None}]
+            }
+            await response.write(f"data: {json.dumps(chunk)}\n\n".encode())
+            await asyncio.sleep(latency.mean * (1 - stubs.TIME_TO_FIRST_TOKEN_FRACTION) / len(tokens))
+        await response.write(b"data: [DONE]\n\n")
+        await response.write_eof()
+        return response
+
+    async def embeddings(request, match, body):
+        inputs = body["input"] if isinstance(body["input"], list) else [body["input"]]
+        tokens = sum(len(str(text).split()) for text in inputs)
+        service.count_tokens(tokens, 0)
+        return {
+            "object": "list",
+            "data": [
+                {"object": "embedding", "index": i, "embedding": [b / 255 for b in hashlib.sha256(str(text).encode()).digest()[:16]]}
+                for i, text in enumerate(inputs)
+            ],
+            "model": "stub",
+            "usage": {"prompt_tokens": tokens, "total_tokens": tokens}
+        }
+
+    service.route("POST", r"/openai/deployments/[^/]+/chat/completions", "chat.completions", chat_completions)
+    service.route("POST", r"/openai/deployments/[^/]+/embeddings", "embeddings", embeddings)
+    return service
+
+
+def create_search_service(
+    latency: stubs.Latency,
+    documents: list[dict] = None
+) -> StubService:
+    """
+    Index search and document count.
+    """
+    service = StubService("search", latency)
+    documents = documents or stubs.SEARCH_DOCUMENTS
+
+    async def search(request, match, body):
+        return {"value": [{"@search.score": 1.0, **doc} for doc in documents[:body.get("top", 5)]]}
+
+    async def count(request, match, body):
+        return len(documents)
+
+    service.route("POST", r"/indexes\('[^']+'\)/docs/search\.post\.search", "search", search)
+    service.route("GET", r"/indexes\('[^']+'\)/docs/\$count", "count", count)
+    return service
+
+
+def load_qnas() -> list[dict]:
+    with open(os.path.join(stubs.DATA_DIR, "cqa_import.json"), "r") as fp:
+        return json.load(fp)["assets"]["qnas"]
+
+
+def get_words(text: str) -> set[str]:
+    return set(re.findall(r"[a-z0-9]+", text.lower()))
+
+
+def answer_question(
+    question: str,
+    qnas: list[dict]
+) -> dict:
+    """
+    Best QnA by question word overlap (default answer below CQA_MIN_SCORE).
+    """
+    words = get_words(question)
+    best, best_score = None, 0.0
+    for qna in qnas:
+        for candidate in qna["questions"]:
+            candidate_words = get_words(candidate)
+            score = len(words & candidate_words) / len(words | candidate_words) if words else 0.0
+            if score > best_score:
+                best, best_score = qna, score
+    if best is None or best_score < CQA_MIN_SCORE:
+        return {"questions": [], "answer": CQA_NO_ANSWER, "confidenceScore": 0.0, "id": -1, "source": None, "metadata": {}}
+    return {
+        "questions": best["questions"],
+        "answer": best["answer"],
+        "confidenceScore": round(0.5 + best_score / 2, 4),
+        "id": int(best["id"]),
+        "source": "stub",
+        "metadata": {}
+    }
+
+
+def predict_intent(
+    text: str
+) -> dict:
+    """
+    CLU prediction by keyword (OrderId entities for 8-digit numbers).
+    """
+    lowered = text.lower()
+    if "cancel" in lowered:
+        intent = "CancelOrder"
+    elif "refund" in lowered and "policy" not in lowered:
+        intent = "RefundStatus"
+    elif "order" in lowered or ORDER_ID_PATTERN.search(text):
+        intent = "OrderStatus"
+    else:
+        intent = "None"
+    confidence = 0.95 if intent != "None" else 0.3
+    return {
+        "topIntent": intent,
+        "projectKind": "Conversation",
+        "intents": [{"category": intent, "confidenceScore": confidence}],
+        "entities": [
+            {"category": "OrderId", "text": m.group(), "offset": m.start(), "length": len(m.group()), "confidenceScore": 1.0}
+            for m in ORDER_ID_PATTERN.finditer(text)
+        ]
+    }
+
+
+def create_language_service(
+    latency: stubs.Latency,
+    orchestration_project: str,
+    language: str = "en"
+) -> StubService:
+    """
+    Text Analytics (language detection, PII), CLU/orchestration and CQA runtimes.
+    """
+    service = StubService("language", latency)
+    qnas = load_qnas()
+
+    async def analyze_text(request, match, body):
+        kind = body["kind"]
+        documents = body["analysisInput"]["documents"]
+        service.count(f"analyze_text.{kind}")
+        if kind == "LanguageDetection":
+            results = [
+                {"id": doc["id"], "detectedLanguage": {"name": language, "iso6391Name": language, "confidenceScore": 1.0}, "warnings": []}
+                for doc in documents
+            ]
+        elif kind == "PiiEntityRecognition":
+            results = [
+                {
+                    "id": doc["id"],
+                    "redactedText": doc["text"],
+                    "entities": [
+                        {"text": m.group(), "category": "Email", "offset": m.start(), "length": len(m.group()), "confidenceScore": 0.95}
+                        for m in EMAIL_PATTERN.finditer(doc["text"])
+                    ],
+                    "warnings": []
+                }
+                for doc in documents
+            ]
+        else:
+            return web.json_response({"error": {"code": "InvalidArgument", "message": kind}}, status=400)
+        return {
+            "kind": f"{kind}Results",
+            "results": {"documents": results, "errors": [], "modelVersion": "stub"}
+        }
+
+    async def analyze_conversations(request, match, body):
+        text = body["analysisInput"]["conversationItem"]["text"]
+        prediction = predict_intent(text)
+        if body["parameters"]["projectName"] == orchestration_project:
+            # Orchestration: CLU if an intent matched, else CQA:
+            if prediction["topIntent"] != "None":
+                target = {
+                    "targetProjectKind": "Conversation",
+                    "confidenceScore": 0.95,
+                    "result": {"query": text, "prediction": prediction}
+                }
+                top = "clu"
+            else:
+                answer = answer_question(text, qnas)
+                target = {
+                    "targetProjectKind": "QuestionAnswering",
+                    "confidenceScore": max(answer["confidenceScore"], 0.1),
+                    "result": {"answers": [answer]}
+                }
+                top = "cqa"
+            prediction = {"topIntent": top, "projectKind": "Orchestration", "intents": {top: target}}
+        return {"kind": "ConversationResult", "result": {"query": text, "prediction": prediction}}
+
+    async def query_knowledgebases(request, match, body):
+        return {"answers": [answer_question(body["question"], qnas)][:body.get("top", 1)]}
+
+    # Counted per task kind:
+    service.route("POST", r"/language/:analyze-text", None, analyze_text)
+    service.route("POST", r"/language/:analyze-conversations", "analyze_conversations", analyze_conversations)
+    service.route("POST", r"/language/:query-knowledgebases", "query_knowledgebases", query_knowledgebases)
+    return service
+
+
+def create_agents_service(
+    latency: stubs.Latency,
+    run_latency: stubs.Latency
+) -> StubService:
+    """
+    Agents API threads, runs (completing after run_latency) and messages.
+
+    Replies "Detected Intent: <intent>" to CLU utterances, else a CQA answer.
+    """
+    service = StubService("agents", latency)
+    qnas = load_qnas()
+    threads = {}
+    runs = {}
+    ids = Counter()
+
+    def next_id(prefix: str) -> str:
+        ids[prefix] += 1
+        return f"{prefix}_{ids[prefix]}"
+
+    def create_message(thread_id: str, role: str, content: str, run_id: str = None) -> dict:
+        return {
+            "id": next_id("msg"),
+            "object": "thread.message",
+            "created_at": int(time.time()),
+            "thread_id": thread_id,
+            "role": role,
+            "content": [{"type": "text", "text": {"value": content, "annotations": []}}],
+            "run_id": run_id,
+            "attachments": [],
+            "metadata": {}
+        }
+
+    def get_run(thread_id: str, run_id: str, status: str = None) -> dict:
+        run = runs[run_id]
+        if status is None:
+            status = run["status"] or ("completed" if time.monotonic() >= run["done"] else "in_progress")
+        return {
+            "id": run_id,
+            "object": "thread.run",
+            "thread_id": thread_id,
+            "assistant_id": run["agent_id"],
+            "status": status,
+            "created_at": int(time.time()),
+            "last_error": None,
+            "metadata": {}
+        }
+
+    def start_run(thread_id: str, agent_id: str) -> dict:
+        run_id = next_id("run")
+        runs[run_id] = {"agent_id": agent_id, "done": time.monotonic() + run_latency.sample(), "status": None}
+        utterance = threads[thread_id][-1]["content"][0]["text"]["value"]
+        prediction = predict_intent(utterance)
+        if prediction["topIntent"] != "None":
+            reply = f"Detected Intent: {prediction['topIntent']}"
+        else:
+            reply = answer_question(utterance, qnas)["answer"]
+        threads[thread_id].append(create_message(thread_id, "assistant", reply, run_id))
+        return get_run(thread_id, run_id)
+
+    def add_messages(thread_id: str, messages: list | None) -> None:
+        for message in messages or []:
+            threads[thread_id].append(create_message(thread_id, message["role"], message["content"]))
+
+    async def create_thread_and_run(request, match, body):
+        thread_id = next_id("thread")
+        threads[thread_id] = []
+        add_messages(thread_id, (body.get("thread") or {}).get("messages"))
+        return start_run(thread_id, body["assistant_id"])
+
+    async def create_run(request, match, body):
+        thread_id = match.group("thread")
+        add_messages(thread_id, body.get("additional_messages"))
+        return start_run(thread_id, body["assistant_id"])
+
+    async def retrieve_run(request, match, body):
+        return get_run(match.group("thread"), match.group("run"))
+
+    async def cancel_run(request, match, body):
+        runs[match.group("run")]["status"] = "cancelled"
+        return get_run(match.group("thread"), match.group("run"))
+
+    async def list_messages(request, match, body):
+        messages = threads.get(match.group("thread"), [])
+        run_id = request.query.get("run_id")
+        messages = [m for m in messages if run_id is None or m["run_id"] == run_id]
+        if request.query.get("order", "desc") == "desc":
+            messages = list(reversed(messages))
+        messages = messages[:int(request.query.get("limit", "20"))]
+        return {
+            "object": "list",
+            "data": messages,
+            "first_id": messages[0]["id"] if messages else None,
+            "last_id": messages[-1]["id"] if messages else None,
+            "has_more": False
+        }
+
+    async def delete_thread(request, match, body):
+        threads.pop(match.group("thread"), None)
+        return {"id": match.group("thread"), "object": "thread.deleted", "deleted": True}
+
+    service.route("POST", r"/threads/runs", "create_thread_and_run", create_thread_and_run)
+    service.route("POST", r"/threads/(?P<thread>[^/]+)/runs", "runs.create", create_run)
+    service.route("GET", r"/threads/(?P<thread>[^/]+)/runs/(?P<run>[^/]+)", "runs.get", retrieve_run)
+    service.route("POST", r"/threads/(?P<thread>[^/]+)/runs/(?P<run>[^/]+)/cancel", "runs.cancel", cancel_run)
+    service.route("GET", r"/threads/(?P<thread>[^/]+)/messages", "messages.list", list_messages)
+    service.route("DELETE", r"/threads/(?P<thread>[^/]+)", "threads.delete", delete_thread)
+    return service
+
+
+class StubServers():
+    """
+    Run stub services on local HTTPS ports (on a background event loop).
+    """
+
+    def __init__(
+        self,
+        services: list[StubService],
+        cert_path: str,
+        key_path: str
+    ):
+        self.services = {service.name: service for service in services}
+        self.ssl_context = ssl.create_default_context(ssl.Purpose.CLIENT_AUTH)
+        self.ssl_context.load_cert_chain(cert_path, key_path)
+        self.loop = asyncio.new_event_loop()
+        self.runners = []
+        threading.Thread(target=self.loop.run_forever, name="stub-servers", daemon=True).start()
+
+    async def serve(
+        self,
+        service: StubService
+    ) -> None:
+        runner = web.AppRunner(service.create_app(), access_log=None)
+        await runner.setup()
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.bind(("127.0.0.1", 0))
+        site = web.SockSite(runner, sock, ssl_context=self.ssl_context)
+        await site.start()
+        service.url = f"https://127.0.0.1:{sock.getsockname()[1]}"
+        self.runners.append(runner)
+
+    def run(
+        self,
+        coro: Awaitable
+    ):
+        return asyncio.run_coroutine_threadsafe(coro, self.loop).result()
+
+    def start(self) -> "StubServers":
+        for service in self.services.values():
+            self.run(self.serve(service))
+        return self
+
+    def stop(self) -> None:
+        for runner in self.runners:
+            self.run(runner.cleanup())
+        self.loop.call_soon_threadsafe(self.loop.stop)
+
+    def get_environment(self) -> dict:
+        """
+        Backend endpoint settings pointing at the services.
+        """
+        environment = {}
+        if "aoai" in self.services:
+            environment["AOAI_ENDPOINT"] = self.services["aoai"].url
+        if "search" in self.services:
+            environment["SEARCH_ENDPOINT"] = self.services["search"].url
+        if "language" in self.services:
+            environment["LANGUAGE_ENDPOINT"] = self.services["language"].url
+        if "agents" in self.services:
+            environment["AGENTS_PROJECT_ENDPOINT"] = self.services["agents"].url
+        return environment
+
+    def reset(self) -> None:
+        for service in self.services.values():
+            service.reset()
+
+    def get_metrics(self) -> dict:
+        return {name: service.get_metrics() for name, service in self.services.items()}
@@ -0,0 +1,637 @@
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT License.
+import os
+import sys
+import json
+import math
+import time
+import random
+import asyncio
+import datetime
+import ipaddress
+from collections import Counter
+from types import SimpleNamespace
+from typing import Callable
+from cryptography import x509
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import ec
+from cryptography.x509.oid import NameOID
+
+"""
+Local stand-ins for Azure dependencies used by benchmarks.
+
+Each stub sleeps for a configurable latency and returns a canned response
+shaped like the corresponding SDK response.
+"""
+
+SRC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src")
+
+STUB_ENVIRONMENT = {
+    "AOAI_ENDPOINT": "https://stub.openai.azure.com",
+    "AOAI_DEPLOYMENT": "stub-deployment",
+    "SEARCH_ENDPOINT": "https://stub.search.windows.net",
+    "SEARCH_INDEX_NAME": "stub-index",
+    "LANGUAGE_ENDPOINT": "https://stub.cognitiveservices.azure.com",
+    "CLU_PROJECT_NAME": "stub-clu",
+    "CLU_DEPLOYMENT_NAME": "stub",
+    "CQA_PROJECT_NAME": "stub-cqa",
+    "CQA_DEPLOYMENT_NAME": "production",
+    "ORCHESTRATION_PROJECT_NAME": "stub-orchestration",
+    "ORCHESTRATION_DEPLOYMENT_NAME": "stub",
+}
+
+
+def setup_environment(
+    **overrides: str
+) -> None:
+    """
+    Point backend at stub endpoints and make src importable.
+    """
+    for key, value in {**STUB_ENVIRONMENT, **overrides}.items():
+        os.environ.setdefault(key, value)
+    os.chdir(SRC_DIR)
+    if SRC_DIR not in sys.path:
+        sys.path.insert(0, SRC_DIR)
+
+
+def create_certificate(
+    directory: str
+) -> tuple[str, str]:
+    """
+    Self-signed certificate for localhost/127.0.0.1 (returns cert and key paths),
+    trusted by clients through SSL_CERT_FILE/REQUESTS_CA_BUNDLE.
+
+    Call before aiohttp is imported (it loads the trusted CAs on import).
+    """
+    key = ec.generate_private_key(ec.SECP256R1())
+    name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, "localhost")])
+    now = datetime.datetime.now(datetime.timezone.utc)
+    certificate = (
+        x509.CertificateBuilder()
+        .subject_name(name)
+        .issuer_name(name)
+        .public_key(key.public_key())
+        .serial_number(x509.random_serial_number())
+        .not_valid_before(now - datetime.timedelta(days=1))
+        .not_valid_after(now + datetime.timedelta(days=1))
+        .add_extension(x509.SubjectAlternativeName([
+            x509.DNSName("localhost"),
+            x509.IPAddress(ipaddress.ip_address("127.0.0.1"))
+        ]), critical=False)
+        .add_extension(x509.BasicConstraints(ca=True, path_length=None), critical=True)
+        .sign(key, hashes.SHA256())
+    )
+    cert_path = os.path.join(directory, "stub_cert.pem")
+    key_path = os.path.join(directory, "stub_key.pem")
+    with open(cert_path, "wb") as fp:
+        fp.write(certificate.public_bytes(serialization.Encoding.PEM))
+    with open(key_path, "wb") as fp:
+        fp.write(key.private_bytes(
+            serialization.Encoding.PEM,
+            serialization.PrivateFormat.PKCS8,
+            serialization.NoEncryption()
+        ))
+    os.environ["SSL_CERT_FILE"] = cert_path
+    os.environ["REQUESTS_CA_BUNDLE"] = cert_path
+    return cert_path, key_path
+
+
+class Latency():
+    """
+    Stub latency distribution (in seconds): mean with uniform jitter, or
+    lognormal with the given mean if sigma > 0 (long tail, as measured
+    against real services).
+    """
+
+    def __init__(
+        self,
+        mean: float,
+        jitter: float = 0.0,
+        sigma: float = 0.0
+    ):
+        self.mean = mean
+        self.jitter = jitter
+        self.sigma = sigma
+
+    def sample(self) -> float:
+        if self.sigma > 0 and self.mean > 0:
+            return random.lognormvariate(math.log(self.mean) - self.sigma ** 2 / 2, self.sigma)
+        return max(0.0, self.mean + random.uniform(-self.jitter, self.jitter))
+
+    def wait(self) -> None:
+        time.sleep(self.sample())
+
+    async def wait_async(self) -> None:
+        await asyncio.sleep(self.sample())
+
+
+def split_utterances(
+    messages: list
+) -> str:
+    """
+    Extract-utterances responder: split last user message on ' and '.
+    """
+    content = messages[-1]["content"]
+    return json.dumps([u.strip() for u in content.split(" and ")])
+
+
+def echo_answer(
+    messages: list
+) -> str:
+    """
+    RAG responder: canned grounded answer.
+    """
+    return "Stub answer grounded in product documentation."
+
+
+def route_utterance(
+    messages: list
+) -> list[tuple[str, dict]]:
+    """
+    Function-calling responder: get_clu for orders, get_cqa for policies, else no call.
+    """
+    utterance = messages[-1]["content"]
+    if "order" in utterance:
+        return [("get_clu", {"utterance": utterance})]
+    if "policy" in utterance:
+        return [("get_cqa", {"question": utterance})]
+    return []
+
+
+def split_and_route(
+    messages: list
+) -> list[tuple[str, dict]]:
+    """
+    Merged responder: one tool call per utterance (split on ' and ').
+    """
+    tool_calls = []
+    for utterance in messages[-1]["content"].split(" and "):
+        routed = route_utterance([{"content": utterance.strip()}])
+        tool_calls.extend(routed or [("get_fallback", {"utterance": utterance.strip()})])
+    return tool_calls
+
+
+class StubMessage(SimpleNamespace):
+    """
+    Chat message serializable like the SDK's (model_dump).
+    """
+
+    def model_dump(self, exclude_none: bool = True) -> dict:
+        def to_dict(value):
+            if isinstance(value, SimpleNamespace):
+                return {k: to_dict(v) for k, v in vars(value).items() if v is not None}
+            if isinstance(value, list):
+                return [to_dict(v) for v in value]
+            return value
+        return to_dict(self)
+
+
+def count_words(
+    message: dict | SimpleNamespace
+) -> int:
+    content = message.get("content") if isinstance(message, dict) else getattr(message, "content", None)
+    return len(str(content or "").split())
+
+
+def create_completion(
+    content: str | list[tuple[str, dict]],
+    messages: list = ()
+) -> SimpleNamespace:
+    """
+    Completion with text content, or tool calls given as (name, arguments).
+
+    Token usage is approximated by word counts.
+    """
+    usage = SimpleNamespace(
+        prompt_tokens=sum(count_words(message) for message in messages),
+        completion_tokens=len(content.split()) if isinstance(content, str) else 10 * len(content)
+    )
+    tool_calls = None
+    if isinstance(content, list):
+        tool_calls = [
+            SimpleNamespace(
+                id=f"call_{i}",
+                type="function",
+                function=SimpleNamespace(name=name, arguments=json.dumps(arguments))
+            )
+            for i, (name, arguments) in enumerate(content)
+        ]
+        content = None
+    message = StubMessage(role="assistant", content=content, tool_calls=tool_calls)
+    return SimpleNamespace(choices=[SimpleNamespace(message=message)], usage=usage)
+
+
+def create_completion_chunk(
+    token: str
+) -> SimpleNamespace:
+    return SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=token))])
+
+
+# Share of completion latency spent before the first streamed token:
+TIME_TO_FIRST_TOKEN_FRACTION = 0.3
+
+
+class StubCompletions():
+    def __init__(
+        self,
+        latency: Latency,
+        responder: Callable[[list], str]
+    ):
+        self.latency = latency
+        self.responder = responder
+        self.calls = 0
+
+    def stream(self, content: str, total: float):
+        tokens = [t + " " for t in content.split(" ")]
+        time.sleep(total * TIME_TO_FIRST_TOKEN_FRACTION)
+        for token in tokens:
+            yield create_completion_chunk(token)
+            time.sleep(total * (1 - TIME_TO_FIRST_TOKEN_FRACTION) / len(tokens))
+
+    def create(self, model: str, messages: list, stream: bool = False, **kwargs):
+        self.calls += 1
+        if stream:
+            return self.stream(self.responder(messages), self.latency.sample())
+        self.latency.wait()
+        return create_completion(self.responder(messages), messages)
+
+
+class AsyncStubCompletions(StubCompletions):
+    async def stream_async(self, content: str, total: float):
+        tokens = [t + " " for t in content.split(" ")]
+        await asyncio.sleep(total * TIME_TO_FIRST_TOKEN_FRACTION)
+        for token in tokens:
+            yield create_completion_chunk(token)
+            await asyncio.sleep(total * (1 - TIME_TO_FIRST_TOKEN_FRACTION) / len(tokens))
+
+    async def create(self, model: str, messages: list, stream: bool = False, **kwargs):
+        self.calls += 1
+        if stream:
+            return self.stream_async(self.responder(messages), self.latency.sample())
+        await self.latency.wait_async()
+        return create_completion(self.responder(messages), messages)
+
+
+def create_stub_chat(
+    latency: Latency,
+    responder: Callable[[list], str],
+    is_async: bool = False
+) -> SimpleNamespace:
+    """
+    Create stub for AOAI client `chat` attribute.
+    """
+    completions_type = AsyncStubCompletions if is_async else StubCompletions
+    return SimpleNamespace(completions=completions_type(latency, responder))
+
+
+def create_language_result(
+    language: str
+) -> SimpleNamespace:
+    return SimpleNamespace(
+        is_error=False,
+        primary_language=SimpleNamespace(iso6391_name=language)
+    )
+
+
+class StubTextAnalyticsClient():
+    def __init__(
+        self,
+        latency: Latency,
+        language: str = "en"
+    ):
+        self.latency = latency
+        self.language = language
+        self.calls = 0
+
+    def detect_language(self, documents: list, **kwargs) -> list:
+        self.calls += 1
+        self.latency.wait()
+        return [create_language_result(self.language) for _ in documents]
+
+
+class AsyncStubTextAnalyticsClient(StubTextAnalyticsClient):
+    async def detect_language(self, documents: list, **kwargs) -> list:
+        self.calls += 1
+        await self.latency.wait_async()
+        return [create_language_result(self.language) for _ in documents]
+
+
+SEARCH_DOCUMENTS = [
+    {"title": f"product_info_{i}.md", "chunk": f"Stub product information chunk {i}."}
+    for i in range(1, 6)
+]
+
+
+class StubSearchClient():
+    def __init__(
+        self,
+        latency: Latency,
+        documents: list[dict] = None
+    ):
+        self.latency = latency
+        self.documents = documents or SEARCH_DOCUMENTS
+        self.calls = 0
+
+    def search(self, search_text: str, top: int = 5, **kwargs) -> list[dict]:
+        self.calls += 1
+        self.latency.wait()
+        return self.documents[:top]
+
+    def get_document_count(self) -> int:
+        return len(self.documents)
+
+
+class AsyncStubSearchResults():
+    def __init__(
+        self,
+        documents: list[dict]
+    ):
+        self.documents = documents
+
+    async def __aiter__(self):
+        for doc in self.documents:
+            yield doc
+
+
+class AsyncStubSearchClient(StubSearchClient):
+    async def search(self, search_text: str, top: int = 5, **kwargs) -> AsyncStubSearchResults:
+        self.calls += 1
+        await self.latency.wait_async()
+        return AsyncStubSearchResults(self.documents[:top])
+
+    async def get_document_count(self) -> int:
+        return len(self.documents)
+
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "..", "infra", "data")
+
+
+class StubExportPoller():
+    def __init__(
+        self,
+        latency: Latency
+    ):
+        self.latency = latency
+
+    def result(self) -> dict:
+        self.latency.wait()
+        return {"resultUrl": "https://stub.cognitiveservices.azure.com/export"}
+
+
+class StubExportResponse():
+    def __init__(
+        self,
+        exported_project: dict
+    ):
+        self.exported_project = exported_project
+
+    def json(self) -> dict:
+        return self.exported_project
+
+
+class StubAuthoringClient():
+    """
+    CLU/CQA authoring client: export jobs (slow) and project details (fast).
+
+    Exports come from infra/data; CQA exports use the service's
+    capitalized export format.
+    """
+
+    def __init__(
+        self,
+        export_latency: Latency,
+        latency: Latency,
+        project: str = "clu",
+        version: str = "2024-01-01T00:00:00Z"
+    ):
+        self.export_latency = export_latency
+        self.latency = latency
+        self.version = version
+        self.exports = 0
+        with open(os.path.join(DATA_DIR, f"{project}_import.json"), "r") as fp:
+            exported_project = json.load(fp)
+        if project == "cqa":
+            exported_project = {"Assets": {"Qnas": [
+                {"Questions": qna["questions"]} for qna in exported_project["assets"]["qnas"]
+            ]}}
+        self.exported_project = exported_project
+
+    def begin_export_project(self, **kwargs) -> StubExportPoller:
+        self.exports += 1
+        return StubExportPoller(self.export_latency)
+
+    begin_export = begin_export_project
+
+    def send_request(self, request, **kwargs) -> StubExportResponse:
+        self.latency.wait()
+        return StubExportResponse(self.exported_project)
+
+    def get_project(self, project_name: str, **kwargs) -> dict:
+        self.latency.wait()
+        return {"projectName": project_name, "lastModifiedDateTime": self.version}
+
+    get_project_details = get_project
+
+
+class AsyncStubMessages():
+    def __init__(
+        self,
+        messages: list
+    ):
+        self.messages = messages
+
+    async def __aiter__(self):
+        for message in self.messages:
+            yield message
+
+
+def create_agent_message(
+    role: str,
+    content: str,
+    run_id: str = None
+) -> SimpleNamespace:
+    text = SimpleNamespace(text=SimpleNamespace(value=content))
+    return SimpleNamespace(role=role, run_id=run_id, content=content, text_messages=[text])
+
+
+class AsyncStubAgentsClient():
+    """
+    Agents API: threads, messages and runs completing after run_latency.
+
+    Replies "Detected Intent: OrderStatus" to order utterances, else a
+    canned CQA answer. Every API call waits latency and is counted.
+    """
+
+    def __init__(
+        self,
+        run_latency: Latency,
+        latency: Latency
+    ):
+        self.run_latency = run_latency
+        self.latency = latency
+        self.calls = Counter()
+        self.threads_messages = {}
+        self.runs_done = {}
+        self.threads = SimpleNamespace(create=self.create_thread, delete=self.delete_thread)
+        self.messages = SimpleNamespace(create=self.create_message, list=self.list_messages)
+        self.runs = SimpleNamespace(create=self.create_run, get=self.get_run, cancel=self.cancel_run)
+
+    async def call(self, name: str) -> None:
+        self.calls[name] += 1
+        await self.latency.wait_async()
+
+    async def create_thread(self, messages: list = None, **kwargs) -> SimpleNamespace:
+        await self.call("threads.create")
+        thread_id = f"thread_{len(self.threads_messages)}"
+        self.threads_messages[thread_id] = [
+            create_agent_message("user", message.content) for message in messages or []
+        ]
+        return SimpleNamespace(id=thread_id)
+
+    async def delete_thread(self, thread_id: str, **kwargs) -> None:
+        await self.call("threads.delete")
+        self.threads_messages.pop(thread_id, None)
+
+    async def create_message(self, thread_id: str, role: str, content: str, **kwargs) -> SimpleNamespace:
+        await self.call("messages.create")
+        message = create_agent_message(role, content)
+        self.threads_messages[thread_id].append(message)
+        return message
+
+    def list_messages(self, thread_id: str, run_id: str = None, limit: int = None, **kwargs) -> AsyncStubMessages:
+        self.calls["messages.list"] += 1
+        messages = [
+            m for m in reversed(self.threads_messages[thread_id])
+            if run_id is None or m.run_id == run_id
+        ]
+        return AsyncStubMessages(messages[:limit])
+
+    def start_run(self, thread_id: str) -> SimpleNamespace:
+        run_id = f"run_{len(self.runs_done)}"
+        self.runs_done[run_id] = time.monotonic() + self.run_latency.sample()
+        utterance = self.threads_messages[thread_id][-1].content
+        reply = "Detected Intent: OrderStatus" if "order" in utterance else "Stub knowledge base answer."
+        self.threads_messages[thread_id].append(create_agent_message("assistant", reply, run_id))
+        return SimpleNamespace(id=run_id, thread_id=thread_id, status="queued", last_error=None)
+
+    async def create_run(self, thread_id: str, additional_messages: list = None, **kwargs) -> SimpleNamespace:
+        await self.call("runs.create")
+        for message in additional_messages or []:
+            self.threads_messages[thread_id].append(create_agent_message("user", message.content))
+        return self.start_run(thread_id)
+
+    async def create_thread_and_run(self, thread=None, **kwargs) -> SimpleNamespace:
+        await self.call("create_thread_and_run")
+        thread_id = f"thread_{len(self.threads_messages)}"
+        self.threads_messages[thread_id] = [
+            create_agent_message("user", message.content) for message in thread.messages
+        ]
+        return self.start_run(thread_id)
+
+    async def get_run(self, thread_id: str, run_id: str, **kwargs) -> SimpleNamespace:
+        await self.call("runs.get")
+        status = "completed" if time.monotonic() >= self.runs_done[run_id] else "in_progress"
+        return SimpleNamespace(id=run_id, thread_id=thread_id, status=status, last_error=None)
+
+    async def cancel_run(self, thread_id: str, run_id: str, **kwargs) -> SimpleNamespace:
+        await self.call("runs.cancel")
+        return SimpleNamespace(id=run_id, thread_id=thread_id, status="cancelled", last_error=None)
+
+
+def create_stub_router(
+    latency: Latency,
+    result: dict = None,
+    is_async: bool = False
+) -> Callable:
+    """
+    Create stub router (defaults to a low-confidence result, i.e. fallback).
+    """
+    def routing_result() -> dict:
+        if result is None:
+            return {"kind": "clu_result", "error": "CLU confidence threshold not met"}
+        return dict(result)
+
+    def router(message: str, language: str, id: str, pii_context=None) -> dict:
+        latency.wait()
+        return routing_result()
+
+    async def async_router(message: str, language: str, id: str, pii_context=None) -> dict:
+        await latency.wait_async()
+        return routing_result()
+
+    return async_router if is_async else router
+
+
+class StubLatencies():
+    """
+    Mean latency (seconds) per stubbed dependency.
+    """
+
+    def __init__(
+        self,
+        aoai: float = 0.3,
+        search: float = 0.1,
+        language: float = 0.05,
+        router: float = 0.1,
+        jitter: float = 0.0
+    ):
+        self.aoai = Latency(aoai, jitter)
+        self.search = Latency(search, jitter)
+        self.language = Latency(language, jitter)
+        self.router = Latency(router, jitter)
+
+
+def configure_server(
+    server,
+    latencies: StubLatencies,
+    is_async: bool = False
+) -> None:
+    """
+    Replace server clients and orchestrator dependencies with stubs.
+    """
+    from aoai_client import AOAIClient, AsyncAOAIClient
+    from response_cache import RAG_CACHE_ENABLED, ResponseCache
+    from unified_conversation_orchestrator import UnifiedConversationOrchestrator
+    from router.router_cache import ROUTER_CACHE_ENABLED, RouterCache, create_cached_router, create_cached_router_async
+    from router.router_type import RouterType
+
+    client_type = AsyncAOAIClient if is_async else AOAIClient
+    search_type = AsyncStubSearchClient if is_async else StubSearchClient
+    language_type = AsyncStubTextAnalyticsClient if is_async else StubTextAnalyticsClient
+
+    extract_client = client_type(
+        endpoint=STUB_ENVIRONMENT["AOAI_ENDPOINT"],
+        deployment="stub",
+        system_message="extract"
+    )
+    extract_client.chat = create_stub_chat(latencies.aoai, split_utterances, is_async)
+    server.extract_client.set(extract_client)
+
+    rag_client = client_type(
+        endpoint=STUB_ENVIRONMENT["AOAI_ENDPOINT"],
+        deployment="stub",
+        use_rag=True,
+        search_client=search_type(latencies.search),
+        response_cache=ResponseCache() if RAG_CACHE_ENABLED else None
+    )
+    rag_client.chat = create_stub_chat(latencies.aoai, echo_answer, is_async)
+    server.rag_client.set(rag_client)
+
+    orchestrator = UnifiedConversationOrchestrator(
+        router_type=RouterType.BYPASS,
+        fallback_function=server.fallback_function_async if is_async else server.fallback_function,
+        use_async=is_async
+    )
+    orchestrator.ta_client = language_type(latencies.language)
+    if orchestrator.ta_batcher is not None:
+        orchestrator.ta_batcher.client = orchestrator.ta_client
+    orchestrator.router = create_stub_router(latencies.router, is_async=is_async)
+    if ROUTER_CACHE_ENABLED:
+        orchestrator.router_cache = RouterCache(
+            router_type=RouterType.CLU,
+            project_name=STUB_ENVIRONMENT["CLU_PROJECT_NAME"],
+            deployment_name=STUB_ENVIRONMENT["CLU_DEPLOYMENT_NAME"]
+        )
+        wrap = create_cached_router_async if is_async else create_cached_router
+        orchestrator.router = wrap(orchestrator.router, orchestrator.router_cache)
+    server.orchestrator.set(orchestrator)
@@ -0,0 +1,114 @@
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT License.
+import argparse
+import asyncio
+import json
+import statistics
+import time
+import stubs
+
+"""
+Benchmark: TRIAGE_AGENT router latency and agents API calls per utterance.
+
+Runs conversations of several utterances against a local stub of the
+agents API (runs complete after --run-latency seconds):
+
+- per_utterance_thread: the previous flow, a new thread per utterance,
+  two messages (the second a hardcoded "Where is my order?") each with
+  a run polled every second (the SDK's create_and_process default).
+- pooled: the router, one thread per conversation, one run request per
+  utterance, polled with adaptive backoff.
+"""
+
+
+def summarize(latencies: list[float]) -> dict:
+    return {
+        "mean_ms": round(statistics.mean(latencies) * 1000, 1),
+        "p50_ms": round(statistics.median(latencies) * 1000, 1),
+        "max_ms": round(max(latencies) * 1000, 1)
+    }
+
+
+async def route_per_utterance_thread(
+    agents_client: stubs.AsyncStubAgentsClient,
+    utterance: str
+) -> None:
+    thread = await agents_client.threads.create()
+    for content in (utterance, "Where is my order?"):
+        await agents_client.messages.create(thread_id=thread.id, role="user", content=content)
+        run = await agents_client.runs.create(thread_id=thread.id, agent_id="stub")
+        while run.status not in ("completed", "failed", "cancelled", "expired"):
+            await asyncio.sleep(1.0)
+            run = await agents_client.runs.get(thread_id=thread.id, run_id=run.id)
+    async for _ in agents_client.messages.list(thread_id=thread.id):
+        pass
+
+
+async def run_conversations(
+    route,
+    conversations: int,
+    utterances: list[str]
+) -> list[float]:
+    """
+    Run conversations concurrently, utterances in order; returns latencies.
+    """
+    latencies = []
+
+    async def converse(id: str) -> None:
+        for utterance in utterances:
+            start = time.perf_counter()
+            await route(utterance, "en", id)
+            latencies.append(time.perf_counter() - start)
+
+    await asyncio.gather(*(converse(str(i)) for i in range(conversations)))
+    return latencies
+
+
+async def benchmark(args) -> dict:
+    from router.triage_agent_router import create_triage_agent_router_async, metrics
+
+    utterances = [
+        "where is order 12345678",
+        "what is your refund policy",
+        "cancel order 12345678"
+    ][:args.utterances]
+    total = args.conversations * len(utterances)
+    results = {"run_latency_s": args.run_latency, "utterances": total}
+
+    agents_client = stubs.AsyncStubAgentsClient(stubs.Latency(args.run_latency), stubs.Latency(args.api_latency))
+    latencies = await run_conversations(
+        lambda utterance, language, id: route_per_utterance_thread(agents_client, utterance),
+        args.conversations,
+        utterances
+    )
+    results["per_utterance_thread"] = {
+        **summarize(latencies),
+        "api_calls_per_utterance": sum(agents_client.calls.values()) / total
+    }
+
+    agents_client = stubs.AsyncStubAgentsClient(stubs.Latency(args.run_latency), stubs.Latency(args.api_latency))
+    router = create_triage_agent_router_async(agents_client=agents_client)
+    latencies = await run_conversations(router, args.conversations, utterances)
+    results["pooled"] = {
+        **summarize(latencies),
+        "api_calls_per_utterance": sum(agents_client.calls.values()) / total,
+        "api_calls": dict(agents_client.calls),
+        "router": metrics.get_metrics()
+    }
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--conversations", type=int, default=10)
+    parser.add_argument("--utterances", type=int, default=3)
+    parser.add_argument("--run-latency", type=float, default=1.2)
+    parser.add_argument("--api-latency", type=float, default=0.05)
+    args = parser.parse_args()
+
+    stubs.setup_environment(TRIAGE_AGENT_ID="stub-agent")
+    print(json.dumps(asyncio.run(benchmark(args)), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,14 +1,38 @@
 # Copyright (c) Microsoft Corporation.
 # Licensed under the MIT License.
+import time
+import asyncio
 import logging
 import json
-from typing import Callable
-from openai import AzureOpenAI
+import threading
+import contextvars
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from typing import AsyncIterator, Awaitable, Callable, Iterator
+from openai import AzureOpenAI, AsyncAzureOpenAI
 from azure.core.credentials import TokenCredential
+from azure.core.credentials_async import AsyncTokenCredential
 from azure.identity import get_bearer_token_provider
+from azure.identity.aio import get_bearer_token_provider as get_bearer_token_provider_async
 from azure.search.documents import SearchClient
+from azure.search.documents.aio import SearchClient as AsyncSearchClient
 from azure.search.documents.models import VectorizableTextQuery
-from utils import get_azure_credential
+from cache import TTLCache
+from response_cache import ResponseCache
+from retrieval import StageTimings, create_search_cache, create_search_key, get_search_settings
+import tool_calls
+import tracing
+import resilience
+from source_packing import RAG_SOURCE_PACKING, PackingMetrics, format_rag_source, pack_sources
+from session_store import SessionStore, create_session_store, get_message_size
+from token_budget import (
+    HISTORY_COMPACTION,
+    compact_history,
+    count_tokens,
+    create_summary_message,
+    create_summary_messages,
+    get_token_budget
+)
+from client_registry import get_credential, get_credential_async, get_http_client, get_http_client_async
 
 def get_prompt(
     prompt: str,
@@ -22,10 +46,560 @@ def get_prompt(
     return content
 
 
+def format_rag_sources(
+    search_results: list[dict]
+) -> str:
+    """
+    Format search results as RAG grounding sources.
+    """
+    return "=================\n".join(
+        [format_rag_source(doc) for doc in search_results]
+    )
+
+
+def parse_tool_call(
+    tool_call: object
+) -> tuple[str, object]:
+    """
+    Function name and input (all functions take a single extracted parameter).
+    """
+    function_args = json.loads(tool_call.function.arguments)
+    return tool_call.function.name, next(iter(function_args.values()), None)
+
+
+def create_tool_message(
+    tool_call: object,
+    func_response: object
+) -> dict:
+    return {
+        "tool_call_id": tool_call.id,
+        "role": "tool",
+        "name": tool_call.function.name,
+        "content": str(func_response)
+    }
+
+
 RAG_GROUNDING_PROMPT = get_prompt("rag_grounding.txt")
+SUMMARIZE_HISTORY_PROMPT = get_prompt("summarize_history.txt")
+
+
+def record_usage(
+    response
+) -> None:
+    """
+    Add completion token usage to the current span.
+    """
+    usage = getattr(response, "usage", None)
+    if usage is not None:
+        tracing.increment("prompt_tokens", usage.prompt_tokens)
+        tracing.increment("completion_tokens", usage.completion_tokens)
+
+
+def get_stream_token(
+    chunk: object
+) -> str | None:
+    """
+    Content token of a streamed chat completion chunk.
+    """
+    # Content-filter results may arrive without choices:
+    if not chunk.choices:
+        return None
+    return chunk.choices[0].delta.content
+
+
+def get_message_content(
+    message: object
+) -> str | None:
+    if isinstance(message, dict):
+        return message.get("content")
+    return message.content
+
+
+def to_message_dict(
+    message: object
+) -> dict:
+    """
+    Convert chat API message to a serializable dict.
+    """
+    if isinstance(message, dict):
+        return message
+    if hasattr(message, "model_dump"):
+        return message.model_dump(exclude_none=True)
+    return {k: v for k, v in vars(message).items() if v is not None}
+
+
+class ChatSessionMixin():
+    """
+    Per-conversation chat history and prompt-size metrics for AOAI clients.
+
+    When a token budget is set, the oldest history turns are dropped
+    (or summarized) so the prompt fits the budget.
+    """
+
+    def init_session(
+        self,
+        system_message: str = None,
+        session_store: SessionStore = None,
+        session_namespace: str = None,
+        token_budget: int = None,
+        history_compaction: str = HISTORY_COMPACTION
+    ) -> None:
+        """
+        Initialize system message, session store and token budget.
+
+        session_namespace keys history in a shared store, so it must be
+        stable across workers and restarts and distinct per client role
+        (e.g. "rag:<deployment>"); defaults to the deployment name.
+        """
+        self.system_messages = []
+        if system_message:
+            # Prepend system message:
+            self.system_messages = [{"role": "system", "content": system_message}]
+
+        if session_store is None:
+            session_store = create_session_store(
+                namespace=session_namespace or self.deployment
+            )
+        self.session_store = session_store
+
+        # Token budget (None for no budget):
+        self.token_budget = token_budget or get_token_budget(self.deployment)
+        self.history_compaction = history_compaction
+
+        self.prompt_metrics_lock = threading.Lock()
+        self.prompt_metrics = {
+            "calls": 0,
+            "prompt_messages": 0,
+            "prompt_bytes": 0,
+            "max_prompt_bytes": 0,
+            "prompt_tokens": 0,
+            "max_prompt_tokens": 0,
+            "compactions": 0,
+            "dropped_messages": 0,
+            "summaries": 0
+        }
+
+    def set_system_message(
+        self,
+        system_message: str
+    ) -> None:
+        """
+        Replace system message (e.g. after the prompt's data was refreshed).
+        """
+        self.system_messages = [{"role": "system", "content": system_message}]
+
+    def get_session_messages(
+        self,
+        id: str
+    ) -> list:
+        """
+        Get system message(s) and bounded session history window.
+        """
+        if id is None:
+            return list(self.system_messages)
+        return self.system_messages + self.session_store.get(str(id))
+
+    def save_session_messages(
+        self,
+        id: str,
+        messages: list
+    ) -> None:
+        """
+        Append turn messages to session history.
+        """
+        if id is None:
+            return
+        self.session_store.append(
+            str(id),
+            [to_message_dict(m) for m in messages]
+        )
+
+    def save_turn(
+        self,
+        id: str,
+        message: str,
+        turn: list
+    ) -> None:
+        """
+        Append turn to session history with the user's message in place of
+        its prompt (RAG sources are not carried into later turns).
+        """
+        self.save_session_messages(id, [{"role": "user", "content": message}] + turn[1:])
+
+    def start_turn(
+        self,
+        id: str,
+        messages: list,
+        prompt: str
+    ) -> tuple[list, list]:
+        """
+        Add the user's prompt to the session messages and fit the token budget.
+
+        Returns messages and dropped history messages (to summarize).
+        """
+        turn_start = len(messages)
+        messages = messages + [{"role": "user", "content": prompt}]
+        return self.fit_token_budget(id, messages, turn_start)
+
+    def finish_turn(
+        self,
+        id: str,
+        message: str,
+        language: str,
+        turn: list,
+        response_message: object,
+        lookup: tuple | None = None
+    ) -> str:
+        """
+        Save the turn ending in the model's response and cache the response
+        (lookup is the response-cache lookup state, None if not cached).
+
+        Returns response content.
+        """
+        self.logger.info(f"Model response: {response_message}")
+        self.save_turn(id, message, turn + [response_message])
+        content = get_message_content(response_message)
+        if lookup is not None:
+            self.cache_response(message, language, content, *lookup)
+        return content
+
+    def add_tool_messages(
+        self,
+        messages: list,
+        calls: list,
+        function_responses: list
+    ) -> None:
+        """
+        Append tool messages with function responses (in call order).
+        """
+        for tool_call, func_response in zip(calls, function_responses):
+            self.logger.info(f"Function response: {str(func_response)}")
+            messages.append(create_tool_message(tool_call, func_response))
+
+    def create_completion_request(
+        self,
+        messages: list,
+        **kwargs
+    ) -> dict:
+        """
+        Chat API arguments for messages (recording prompt-size metrics).
+        """
+        self.record_prompt(messages)
+        return {"model": self.deployment, "messages": messages, **kwargs}
+
+    def fit_token_budget(
+        self,
+        id: str,
+        messages: list,
+        turn_start: int
+    ) -> tuple[list, list]:
+        """
+        Drop oldest session history turns so messages fit the token budget.
+
+        System message(s) and the current turn are always kept.
+        Returns messages and dropped history messages.
+        """
+        if self.token_budget is None or id is None:
+            return messages, []
+
+        system_end = len(self.system_messages)
+        system = messages[:system_end]
+        history = messages[system_end:turn_start]
+        turn = messages[turn_start:]
+
+        budget = self.token_budget - count_tokens(system) - count_tokens(turn)
+        history, dropped = compact_history(history, max(budget, 0))
+        if not dropped:
+            return messages, []
+
+        self.logger.info(f"Dropped {len(dropped)} history messages over token budget")
+        self.session_store.set(str(id), history)
+        with self.prompt_metrics_lock:
+            self.prompt_metrics["compactions"] += 1
+            self.prompt_metrics["dropped_messages"] += len(dropped)
+
+        return system + history + turn, dropped
+
+    def insert_summary(
+        self,
+        id: str,
+        messages: list,
+        turn_start: int,
+        summary: str
+    ) -> list:
+        """
+        Insert conversation summary ahead of session history.
+        """
+        system_end = len(self.system_messages)
+        system = messages[:system_end]
+        history = [create_summary_message(summary)] + messages[system_end:turn_start]
+        turn = messages[turn_start:]
+
+        self.session_store.set(str(id), history)
+        with self.prompt_metrics_lock:
+            self.prompt_metrics["summaries"] += 1
 
+        return system + history + turn
 
-class AOAIClient(AzureOpenAI):
+    def record_prompt(
+        self,
+        messages: list
+    ) -> None:
+        """
+        Record prompt-size metrics for a chat API call.
+        """
+        message_dicts = [to_message_dict(m) for m in messages]
+        prompt_bytes = sum(get_message_size(m) for m in message_dicts)
+        prompt_tokens = count_tokens(message_dicts)
+        with self.prompt_metrics_lock:
+            self.prompt_metrics["calls"] += 1
+            self.prompt_metrics["prompt_messages"] += len(messages)
+            self.prompt_metrics["prompt_bytes"] += prompt_bytes
+            self.prompt_metrics["max_prompt_bytes"] = max(
+                self.prompt_metrics["max_prompt_bytes"], prompt_bytes
+            )
+            self.prompt_metrics["prompt_tokens"] += prompt_tokens
+            self.prompt_metrics["max_prompt_tokens"] = max(
+                self.prompt_metrics["max_prompt_tokens"], prompt_tokens
+            )
+
+    def get_metrics(self) -> dict:
+        """
+        Get session store and prompt-size metrics.
+        """
+        with self.prompt_metrics_lock:
+            prompt_metrics = dict(self.prompt_metrics)
+        calls = max(prompt_metrics["calls"], 1)
+        prompt_metrics["avg_prompt_messages"] = prompt_metrics["prompt_messages"] / calls
+        prompt_metrics["avg_prompt_bytes"] = prompt_metrics["prompt_bytes"] / calls
+        prompt_metrics["avg_prompt_tokens"] = prompt_metrics["prompt_tokens"] / calls
+
+        return {
+            "deployment": self.deployment,
+            "token_budget": self.token_budget,
+            "sessions": self.session_store.get_metrics(),
+            "prompts": prompt_metrics
+        }
+
+
+class ResponseCacheMixin():
+    """
+    RAG response cache for AOAI clients.
+
+    Repeated queries are answered from cache, skipping search and
+    chat completion.
+    """
+
+    def init_response_cache(
+        self,
+        response_cache: ResponseCache = None,
+        embedding_deployment: str = None
+    ) -> None:
+        """
+        Initialize response cache (None to disable).
+
+        With embedding_deployment, misses fall back to the semantic tier.
+        """
+        self.response_cache = response_cache
+        self.embedding_deployment = embedding_deployment
+
+    def use_response_cache(
+        self,
+        messages: list
+    ) -> bool:
+        """
+        Whether to look up and store this turn's response.
+
+        Function-calling responses depend on tool results, and cached
+        responses are shared across conversations, so only a conversation's
+        first turn (messages holding no history) is cached.
+        """
+        return (
+            self.response_cache is not None
+            and self.use_rag
+            and not self.function_calling
+            and len(messages) == len(self.system_messages)
+        )
+
+    def save_cached_turn(
+        self,
+        id: str,
+        message: str,
+        response: str
+    ) -> str:
+        """
+        Append cache-answered turn to session history; returns response.
+        """
+        tracing.set_attributes(cached=True)
+        self.save_session_messages(id, [
+            {"role": "user", "content": message},
+            {"role": "assistant", "content": response}
+        ])
+        return response
+
+    def cache_response(
+        self,
+        message: str,
+        language: str,
+        response: str,
+        start: float,
+        embedding: list[float] = None
+    ) -> None:
+        """
+        Cache generated response (with generation latency since start).
+        """
+        if not response:
+            return
+        self.response_cache.set(
+            message,
+            language,
+            response,
+            latency=time.perf_counter() - start,
+            embedding=embedding
+        )
+
+    def get_response_cache_metrics(self) -> dict | None:
+        if self.response_cache is None:
+            return None
+        return self.response_cache.get_metrics()
+
+
+class RetrievalMixin():
+    """
+    Search settings, search-result cache and stage timings for RAG clients.
+    """
+
+    def init_retrieval(
+        self,
+        search_settings: dict = None,
+        search_cache: TTLCache = None
+    ) -> None:
+        """
+        Initialize k/top (per-deployment default) and search-result cache.
+        """
+        self.search_settings = search_settings or get_search_settings(self.deployment)
+        if search_cache is None and self.use_rag:
+            search_cache = create_search_cache()
+        self.search_cache = search_cache
+        self.stage_timings = StageTimings()
+        self.packing_metrics = PackingMetrics()
+
+    def invalidate_caches(self) -> None:
+        """
+        Drop cached search results and responses (e.g. after re-indexing).
+        """
+        if self.search_cache is not None:
+            self.search_cache.clear()
+        if self.response_cache is not None:
+            self.response_cache.invalidate()
+
+    def update_index_version(
+        self,
+        version: object
+    ) -> None:
+        """
+        Record search index version, dropping cached results if it changed.
+        """
+        if self.response_cache.update_index_version(version) and self.search_cache is not None:
+            self.search_cache.clear()
+
+    def get_cached_search(
+        self,
+        query: str
+    ) -> tuple[tuple, list[dict] | None]:
+        """
+        Search cache key and cached results for query (None on miss).
+        """
+        key = create_search_key(query, self.search_settings["k"], self.search_settings["top"])
+        search_results = self.search_cache.get(key) if self.search_cache is not None else None
+        tracing.set_attributes(cached=search_results is not None)
+        return key, search_results
+
+    def create_search_request(
+        self,
+        query: str
+    ) -> dict:
+        """
+        Hybrid (text and vector) search arguments for query.
+        """
+        vector_query = VectorizableTextQuery(
+            text=query,
+            k_nearest_neighbors=self.search_settings["k"],
+            fields="text_vector"
+        )
+        return {
+            "search_text": query,
+            "vector_queries": [vector_query],
+            "select": ["title", "chunk"],
+            "top": self.search_settings["top"]
+        }
+
+    def cache_search_results(
+        self,
+        key: tuple,
+        search_results: list[dict],
+        start: float
+    ) -> None:
+        """
+        Record search time since start and cache results.
+        """
+        search_time = time.perf_counter() - start
+        self.stage_timings.record("search", search_time)
+        if self.search_cache is not None:
+            self.search_cache.set(key, search_results, latency=search_time)
+
+    def format_rag_prompt(
+        self,
+        query: str,
+        search_results: list[dict]
+    ) -> str:
+        """
+        RAG grounding prompt with search results packed into the source token budget.
+        """
+        search_results = self.pack_search_results(search_results)
+        tracing.set_attributes(sources=len(search_results))
+
+        start = time.perf_counter()
+        prompt = RAG_GROUNDING_PROMPT.format(
+            query=query,
+            sources=format_rag_sources(search_results)
+        )
+        self.stage_timings.record("format", time.perf_counter() - start)
+        return prompt
+
+    def pack_search_results(
+        self,
+        search_results: list[dict]
+    ) -> list[dict]:
+        """
+        Deduplicate/rank search results into the source token budget.
+        """
+        if not RAG_SOURCE_PACKING:
+            return search_results
+
+        start = time.perf_counter()
+        packed, stats = pack_sources(
+            search_results,
+            token_budget=self.search_settings["source_tokens"]
+        )
+        self.stage_timings.record("pack", time.perf_counter() - start)
+        self.packing_metrics.record(stats)
+        self.logger.info(
+            f"Packed {len(packed)}/{len(search_results)} sources, saved {stats['tokens_saved']} tokens"
+        )
+        return packed
+
+    def get_retrieval_metrics(self) -> dict:
+        return {
+            "search_settings": self.search_settings,
+            "search_cache": self.search_cache.get_metrics() if self.search_cache else None,
+            "response_cache": self.get_response_cache_metrics(),
+            "packing": self.packing_metrics.get_metrics(),
+            "stages": self.stage_timings.get_metrics()
+        }
+
+
+class AOAIClient(AzureOpenAI, ChatSessionMixin, ResponseCacheMixin, RetrievalMixin):
     """
     Chat-only AOAI Client.
 
@@ -45,17 +619,26 @@ class AOAIClient(AzureOpenAI):
         functions: dict[str, Callable] = None,
         return_functions: bool = False,
         use_rag: bool = False,
-        search_client: SearchClient = None
+        search_client: SearchClient = None,
+        session_store: SessionStore = None,
+        session_namespace: str = None,
+        token_budget: int = None,
+        response_cache: ResponseCache = None,
+        embedding_deployment: str = None,
+        search_settings: dict = None,
+        search_cache: TTLCache = None
     ) -> None:
         self.logger = logging.getLogger(self.__class__.__name__)
         if not azure_credential:
-            azure_credential = get_azure_credential()
+            azure_credential = get_credential()
         token_provider = get_bearer_token_provider(azure_credential, scope)
         AzureOpenAI.__init__(
             self,
             api_version=api_version,
             azure_ad_token_provider=token_provider,
-            azure_endpoint=endpoint
+            azure_endpoint=endpoint,
+            http_client=get_http_client(),
+            max_retries=resilience.get_client_max_retries()
         )
 
         # Function-calling:
@@ -72,122 +655,726 @@ class AOAIClient(AzureOpenAI):
         self.deployment = self.model_name = deployment
         self.api_version = api_version
         self.chat_api = True
-        self.messages = []
 
-        if system_message:
-            # Prepend system message:
-            self.messages = [{"role": "system", "content": system_message}]
+        # Per-conversation history:
+        self.init_session(
+            system_message=system_message,
+            session_store=session_store,
+            session_namespace=session_namespace,
+            token_budget=token_budget
+        )
+
+        # RAG response cache:
+        self.init_response_cache(
+            response_cache=response_cache,
+            embedding_deployment=embedding_deployment
+        )
+
+        # Retrieval settings and search-result cache:
+        self.init_retrieval(
+            search_settings=search_settings,
+            search_cache=search_cache
+        )
+
+    def execute_tool_calls(
+        self,
+        calls: list,
+        language: str,
+        id: str,
+        function_kwargs: dict = None
+    ) -> list:
+        """
+        Run tool calls concurrently on the shared tool executor.
+
+        Each call gets its tool's timeout (measured from submission); a
+        timed-out call yields an error response and, if already running,
+        keeps its worker until it returns (counted as detached).
+        """
+        executor = tool_calls.tool_executor.get()
+        tool_calls.metrics.record_batch(len(calls))
+        submitted = time.perf_counter()
+
+        futures = []
+        for tool_call in calls:
+            function_name, func_input = parse_tool_call(tool_call)
+            self.logger.info(f"Function call: {function_name}")
+            self.logger.info(f"Function input: {func_input}")
+            if function_name not in self.functions:
+                futures.append(None)
+                continue
+            # Run with the caller's context variables (e.g. tracing span):
+            futures.append(executor.submit(
+                contextvars.copy_context().run,
+                self.functions[function_name],
+                func_input,
+                language,
+                id,
+                **(function_kwargs or {})
+            ))
+
+        function_responses = []
+        for tool_call, future in zip(calls, futures):
+            function_name = tool_call.function.name
+            if future is None:
+                function_responses.append(json.dumps({"error": "Unknown function"}))
+                continue
+
+            timeout = tool_calls.get_tool_timeout(function_name)
+            remaining = None
+            if timeout is not None:
+                remaining = max(0.0, submitted + timeout - time.perf_counter())
+            try:
+                func_response = future.result(timeout=remaining)
+                timed_out = False
+            except FutureTimeoutError:
+                self.logger.warning(f"Function call {function_name} timed out")
+                if not future.cancel():
+                    tool_calls.metrics.record_detached(future)
+                func_response = tool_calls.create_timeout_response(function_name, timeout)
+                timed_out = True
+            tool_calls.metrics.record(function_name, time.perf_counter() - submitted, timed_out)
+            function_responses.append(func_response)
+
+        return function_responses
 
     def call_functions(
         self,
+        messages: list,
         language: str,
-        id: str
+        id: str,
+        function_kwargs: dict = None
     ) -> list:
         """
         AOAI function calling.
 
+        Appends model and tool messages to messages.
         Returns function-call responses.
         """
         # Call chat API with function-calling enabled:
-        response = self.chat.completions.create(
-            model=self.deployment,
-            messages=self.messages,
-            tools=self.tools,
-            tool_choice="auto",
-        )
+        with tracing.span("aoai.completion", deployment=self.deployment, purpose="function_calling"):
+            response = resilience.get_policy("aoai").call(
+                self.chat.completions.create,
+                **self.create_completion_request(messages, tools=self.tools, tool_choice="auto")
+            )
+            record_usage(response)
 
         # Process model's response:
         response_message = response.choices[0].message
-        self.messages.append(response_message)
+        messages.append(response_message)
         self.logger.info(f"Model response: {response_message}")
-
-        # Handle function calls:
-        function_responses = []
-        if response_message.tool_calls:
-            for tool_call in response_message.tool_calls:
-                function_name = tool_call.function.name
-                function_args = json.loads(tool_call.function.arguments)
-                self.logger.info(f"Function call: {function_name}")
-                self.logger.info(f"Function arguments: {function_args}")
-
-                if function_name in self.functions:
-                    # All functions require single extracted parameter:
-                    func_input = next(iter(function_args.values()))
-                    func = self.functions[function_name]
-                    func_response = func(func_input, language, id)
-                else:
-                    func_response = json.dumps({"error": "Unknown function"})
-
-                function_responses.append(func_response)
-                self.logger.info(f"Function response: {str(func_response)}")
-                self.messages.append({
-                    "tool_call_id": tool_call.id,
-                    "role": "tool",
-                    "name": function_name,
-                    "content": str(func_response)
-                })
-        else:
+        if not response_message.tool_calls:
             self.logger.info("No tool calls made by model.")
+            return []
 
+        # Handle function calls (concurrently, responses in call order):
+        function_responses = self.execute_tool_calls(
+            response_message.tool_calls,
+            language=language,
+            id=id,
+            function_kwargs=function_kwargs
+        )
+        self.add_tool_messages(messages, response_message.tool_calls, function_responses)
         return function_responses
 
+    def summarize_history(
+        self,
+        dropped: list
+    ) -> str:
+        """
+        Summarize dropped history (folding in any earlier summary).
+        """
+        summary_messages = create_summary_messages(SUMMARIZE_HISTORY_PROMPT, dropped)
+        with tracing.span("aoai.completion", deployment=self.deployment, purpose="summary"):
+            response = resilience.get_policy("aoai").call(
+                self.chat.completions.create,
+                **self.create_completion_request(summary_messages)
+            )
+            record_usage(response)
+        return response.choices[0].message.content
+
+    def check_search_index(self) -> None:
+        """
+        Invalidate response cache if the search index changed.
+
+        The index version is the document count and, if configured, the
+        latest value of the version field stamped by ingestion.
+        """
+        if not self.response_cache.is_index_check_due():
+            return
+        try:
+            document_count = self.search_client.get_document_count()
+            request = self.response_cache.create_index_version_request()
+            latest = self.search_documents(**request) if request is not None else None
+            version = self.response_cache.create_index_version(document_count, latest)
+        except Exception as e:
+            self.logger.warning(f"Search index check failed: {e}")
+            version = self.response_cache.index_version
+        self.update_index_version(version)
+
+    def lookup_response(
+        self,
+        message: str,
+        language: str
+    ) -> tuple[str | None, tuple]:
+        """
+        Look up cached response (exact, then semantic tier).
+
+        Returns response (None on miss) and the lookup state (start time
+        and query embedding, if computed) for caching the generated response.
+        """
+        start = time.perf_counter()
+        self.check_search_index()
+        response = self.response_cache.get(message, language)
+        if response is not None or not self.embedding_deployment:
+            return response, (start, None)
+
+        try:
+            result = resilience.get_policy("aoai").call(
+                self.embeddings.create,
+                model=self.embedding_deployment,
+                input=[message]
+            )
+        except Exception as e:
+            self.logger.warning(f"Query embedding failed: {e}")
+            return None, (start, None)
+        embedding = result.data[0].embedding
+        response = self.response_cache.get_similar(language, embedding)
+        return response, (start, embedding)
+
+    def search_documents(
+        self,
+        **kwargs
+    ) -> list[dict]:
+        """
+        All search results (pages are requested while iterating).
+        """
+        return list(self.search_client.search(**kwargs))
+
+    @tracing.traced("rag.search")
+    def retrieve(
+        self,
+        query: str
+    ) -> list[dict]:
+        """
+        Search results for query (cached by query, k and top).
+        """
+        key, search_results = self.get_cached_search(query)
+        if search_results is None:
+            self.logger.info("Calling search client")
+            start = time.perf_counter()
+            search_results = resilience.get_policy("search").call(
+                self.search_documents,
+                **self.create_search_request(query)
+            )
+            self.cache_search_results(key, search_results, start)
+
+        return search_results
+
+    @tracing.traced("rag.generate_prompt")
     def generate_rag_prompt(
         self,
         query: str
     ) -> str:
         """
         Generates RAG grounding prompt given query and search client.
+
+        Search results are packed into the source token budget.
         """
-        self.logger.info("Calling search client")
-        vector_query = VectorizableTextQuery(
-            text=query,
-            k_nearest_neighbors=50,
-            fields="text_vector"
+        return self.format_rag_prompt(query, self.retrieve(query))
+
+    @tracing.traced("aoai.chat_completion")
+    def chat_completion(
+        self,
+        message: str,
+        language: str = None,
+        id: str = None,
+        function_kwargs: dict = None
+    ) -> str:
+        """
+        AOAI chat completion.
+
+        History is kept per conversation id (none if id is None).
+        function_kwargs are passed to called functions (e.g. the request
+        PII context).
+        """
+        messages = self.get_session_messages(id)
+        lookup = None
+        if self.use_response_cache(messages):
+            cached, lookup = self.lookup_response(message, language)
+            if cached is not None:
+                return self.save_cached_turn(id, message, cached)
+
+        # Add user message, compacting history over token budget:
+        prompt = self.generate_rag_prompt(message) if self.use_rag else message
+        messages, dropped = self.start_turn(id, messages, prompt)
+        if dropped and self.history_compaction == "summarize":
+            summary = self.summarize_history(dropped)
+            messages = self.insert_summary(id, messages, len(messages) - 1, summary)
+        turn_start = len(messages) - 1
+
+        if self.function_calling:
+            function_results = self.call_functions(
+                messages=messages,
+                language=language,
+                id=id,
+                function_kwargs=function_kwargs
+            )
+            if self.return_functions:
+                # Return function-call results directly:
+                self.save_turn(id, message, messages[turn_start:])
+                return function_results
+
+        # Call chat API:
+        with tracing.span("aoai.completion", deployment=self.deployment, purpose="chat"):
+            response = resilience.get_policy("aoai").call(
+                self.chat.completions.create,
+                **self.create_completion_request(messages)
+            )
+            record_usage(response)
+        return self.finish_turn(
+            id,
+            message,
+            language,
+            messages[turn_start:],
+            response.choices[0].message,
+            lookup
         )
-        search_results = self.search_client.search(
-            search_text=query,
-            vector_queries=[vector_query],
-            select=["title", "chunk"],
-            top=5
+
+    def chat_completion_stream(
+        self,
+        message: str,
+        language: str = None,
+        id: str = None
+    ) -> Iterator[str]:
+        """
+        Streaming AOAI chat completion (without function calling).
+
+        Yields content tokens as they are generated;
+        history is saved once the completion finishes.
+        """
+        messages = self.get_session_messages(id)
+        lookup = None
+        if self.use_response_cache(messages):
+            cached, lookup = self.lookup_response(message, language)
+            if cached is not None:
+                yield self.save_cached_turn(id, message, cached)
+                return
+
+        # Add user message, compacting history over token budget:
+        prompt = self.generate_rag_prompt(message) if self.use_rag else message
+        messages, dropped = self.start_turn(id, messages, prompt)
+        if dropped and self.history_compaction == "summarize":
+            summary = self.summarize_history(dropped)
+            messages = self.insert_summary(id, messages, len(messages) - 1, summary)
+        turn_start = len(messages) - 1
+
+        # Call chat API (span covers the request up to the response headers):
+        with tracing.span("aoai.completion", deployment=self.deployment, purpose="chat_stream"):
+            stream = resilience.get_policy("aoai").call(
+                self.chat.completions.create,
+                **self.create_completion_request(messages, stream=True)
+            )
+
+        content = []
+        for chunk in stream:
+            token = get_stream_token(chunk)
+            if token:
+                content.append(token)
+                yield token
+
+        self.finish_turn(
+            id,
+            message,
+            language,
+            messages[turn_start:],
+            {"role": "assistant", "content": "".join(content)},
+            lookup
         )
 
-        sources_formatted = "=================\n".join(
-            [f'TITLE: {doc["title"]}, CONTENT: {doc["chunk"]}' for doc in search_results]
+
+class AsyncAOAIClient(AsyncAzureOpenAI, ChatSessionMixin, ResponseCacheMixin, RetrievalMixin):
+    """
+    Async chat-only AOAI Client.
+
+    AsyncAzureOpenAI wrapper with function-calling and RAG support.
+    Functions may be sync or async; sync functions run in worker threads.
+    """
+
+    def __init__(
+        self,
+        endpoint: str,
+        deployment: str,
+        api_version: str = "2023-12-01-preview",
+        scope: str = "https://cognitiveservices.azure.com/.default",
+        azure_credential: AsyncTokenCredential = None,
+        system_message: str = None,
+        function_calling: bool = False,
+        tools: list = None,
+        functions: dict[str, Callable[..., Awaitable | object]] = None,
+        return_functions: bool = False,
+        use_rag: bool = False,
+        search_client: AsyncSearchClient = None,
+        session_store: SessionStore = None,
+        session_namespace: str = None,
+        token_budget: int = None,
+        response_cache: ResponseCache = None,
+        embedding_deployment: str = None,
+        search_settings: dict = None,
+        search_cache: TTLCache = None
+    ) -> None:
+        self.logger = logging.getLogger(self.__class__.__name__)
+        if not azure_credential:
+            azure_credential = get_credential_async()
+        token_provider = get_bearer_token_provider_async(azure_credential, scope)
+        AsyncAzureOpenAI.__init__(
+            self,
+            api_version=api_version,
+            azure_ad_token_provider=token_provider,
+            azure_endpoint=endpoint,
+            http_client=get_http_client_async(),
+            max_retries=resilience.get_client_max_retries()
         )
 
-        prompt = RAG_GROUNDING_PROMPT.format(
-            query=query,
-            sources=sources_formatted
+        # Function-calling:
+        self.function_calling = function_calling
+        self.tools = tools
+        self.functions = functions
+        self.return_functions = return_functions
+
+        # RAG:
+        self.use_rag = use_rag
+        self.search_client = search_client
+
+        # General:
+        self.deployment = self.model_name = deployment
+        self.api_version = api_version
+        self.chat_api = True
+
+        # Per-conversation history:
+        self.init_session(
+            system_message=system_message,
+            session_store=session_store,
+            session_namespace=session_namespace,
+            token_budget=token_budget
         )
 
-        return prompt
+        # RAG response cache:
+        self.init_response_cache(
+            response_cache=response_cache,
+            embedding_deployment=embedding_deployment
+        )
 
-    def chat_completion(
+        # Retrieval settings and search-result cache:
+        self.init_retrieval(
+            search_settings=search_settings,
+            search_cache=search_cache
+        )
+
+    async def execute_tool_call(
+        self,
+        tool_call: object,
+        language: str,
+        id: str,
+        semaphore: asyncio.Semaphore,
+        function_kwargs: dict = None
+    ) -> object:
+        """
+        Run one tool call with its tool's timeout.
+        """
+        function_name, func_input = parse_tool_call(tool_call)
+        self.logger.info(f"Function call: {function_name}")
+        self.logger.info(f"Function input: {func_input}")
+        if function_name not in self.functions:
+            return json.dumps({"error": "Unknown function"})
+
+        func = self.functions[function_name]
+        function_kwargs = function_kwargs or {}
+        timeout = tool_calls.get_tool_timeout(function_name)
+        start = time.perf_counter()
+        async with semaphore:
+            if asyncio.iscoroutinefunction(func):
+                call = func(func_input, language, id, **function_kwargs)
+            else:
+                call = asyncio.to_thread(func, func_input, language, id, **function_kwargs)
+            try:
+                func_response = await asyncio.wait_for(call, timeout)
+                timed_out = False
+            except asyncio.TimeoutError:
+                self.logger.warning(f"Function call {function_name} timed out")
+                func_response = tool_calls.create_timeout_response(function_name, timeout)
+                timed_out = True
+        tool_calls.metrics.record(function_name, time.perf_counter() - start, timed_out)
+        return func_response
+
+    async def execute_tool_calls(
+        self,
+        calls: list,
+        language: str,
+        id: str,
+        function_kwargs: dict = None
+    ) -> list:
+        """
+        Run tool calls concurrently (at most TOOL_CALL_WORKERS at a time).
+        """
+        tool_calls.metrics.record_batch(len(calls))
+        semaphore = asyncio.Semaphore(tool_calls.TOOL_CALL_WORKERS)
+        # gather preserves call order:
+        return list(await asyncio.gather(*[
+            self.execute_tool_call(tool_call, language, id, semaphore, function_kwargs)
+            for tool_call in calls
+        ]))
+
+    async def call_functions(
+        self,
+        messages: list,
+        language: str,
+        id: str,
+        function_kwargs: dict = None
+    ) -> list:
+        """
+        AOAI function calling.
+
+        Appends model and tool messages to messages.
+        Returns function-call responses.
+        """
+        # Call chat API with function-calling enabled:
+        with tracing.span("aoai.completion", deployment=self.deployment, purpose="function_calling"):
+            response = await resilience.get_policy("aoai").call_async(
+                self.chat.completions.create,
+                **self.create_completion_request(messages, tools=self.tools, tool_choice="auto")
+            )
+            record_usage(response)
+
+        # Process model's response:
+        response_message = response.choices[0].message
+        messages.append(response_message)
+        self.logger.info(f"Model response: {response_message}")
+        if not response_message.tool_calls:
+            self.logger.info("No tool calls made by model.")
+            return []
+
+        # Handle function calls (concurrently, responses in call order):
+        function_responses = await self.execute_tool_calls(
+            response_message.tool_calls,
+            language=language,
+            id=id,
+            function_kwargs=function_kwargs
+        )
+        self.add_tool_messages(messages, response_message.tool_calls, function_responses)
+        return function_responses
+
+    async def summarize_history(
+        self,
+        dropped: list
+    ) -> str:
+        """
+        Summarize dropped history (folding in any earlier summary).
+        """
+        summary_messages = create_summary_messages(SUMMARIZE_HISTORY_PROMPT, dropped)
+        with tracing.span("aoai.completion", deployment=self.deployment, purpose="summary"):
+            response = await resilience.get_policy("aoai").call_async(
+                self.chat.completions.create,
+                **self.create_completion_request(summary_messages)
+            )
+            record_usage(response)
+        return response.choices[0].message.content
+
+    async def check_search_index(self) -> None:
+        """
+        Invalidate response cache if the search index changed.
+
+        The index version is the document count and, if configured, the
+        latest value of the version field stamped by ingestion.
+        """
+        if not self.response_cache.is_index_check_due():
+            return
+        try:
+            document_count = await self.search_client.get_document_count()
+            request = self.response_cache.create_index_version_request()
+            latest = await self.search_documents(**request) if request is not None else None
+            version = self.response_cache.create_index_version(document_count, latest)
+        except Exception as e:
+            self.logger.warning(f"Search index check failed: {e}")
+            version = self.response_cache.index_version
+        self.update_index_version(version)
+
+    async def lookup_response(
+        self,
+        message: str,
+        language: str
+    ) -> tuple[str | None, tuple]:
+        """
+        Look up cached response (exact, then semantic tier).
+
+        Returns response (None on miss) and the lookup state (start time
+        and query embedding, if computed) for caching the generated response.
+        """
+        start = time.perf_counter()
+        await self.check_search_index()
+        response = self.response_cache.get(message, language)
+        if response is not None or not self.embedding_deployment:
+            return response, (start, None)
+
+        try:
+            result = await resilience.get_policy("aoai").call_async(
+                self.embeddings.create,
+                model=self.embedding_deployment,
+                input=[message]
+            )
+        except Exception as e:
+            self.logger.warning(f"Query embedding failed: {e}")
+            return None, (start, None)
+        embedding = result.data[0].embedding
+        # Matrix scan off the event loop:
+        response = await asyncio.to_thread(self.response_cache.get_similar, language, embedding)
+        return response, (start, embedding)
+
+    async def search_documents(
+        self,
+        **kwargs
+    ) -> list[dict]:
+        """
+        All search results (pages are requested while iterating).
+        """
+        return [doc async for doc in await self.search_client.search(**kwargs)]
+
+    @tracing.traced("rag.search")
+    async def retrieve(
+        self,
+        query: str
+    ) -> list[dict]:
+        """
+        Search results for query (cached by query, k and top).
+        """
+        key, search_results = self.get_cached_search(query)
+        if search_results is None:
+            self.logger.info("Calling search client")
+            start = time.perf_counter()
+            search_results = await resilience.get_policy("search").call_async(
+                self.search_documents,
+                **self.create_search_request(query)
+            )
+            self.cache_search_results(key, search_results, start)
+
+        return search_results
+
+    @tracing.traced("rag.generate_prompt")
+    async def generate_rag_prompt(
+        self,
+        query: str
+    ) -> str:
+        """
+        Generates RAG grounding prompt given query and search client.
+
+        Search results are packed into the source token budget.
+        """
+        return self.format_rag_prompt(query, await self.retrieve(query))
+
+    @tracing.traced("aoai.chat_completion")
+    async def chat_completion(
         self,
         message: str,
         language: str = None,
-        id: str = None
+        id: str = None,
+        function_kwargs: dict = None
     ) -> str:
         """
         AOAI chat completion.
+
+        History is kept per conversation id (none if id is None).
+        function_kwargs are passed to called functions (e.g. the request
+        PII context).
         """
-        # Add user message:
-        prompt = self.generate_rag_prompt(message) if self.use_rag else message
-        self.messages.append({"role": "user", "content": prompt})
+        messages = self.get_session_messages(id)
+        lookup = None
+        if self.use_response_cache(messages):
+            cached, lookup = await self.lookup_response(message, language)
+            if cached is not None:
+                return self.save_cached_turn(id, message, cached)
+
+        # Add user message, compacting history over token budget:
+        prompt = await self.generate_rag_prompt(message) if self.use_rag else message
+        messages, dropped = self.start_turn(id, messages, prompt)
+        if dropped and self.history_compaction == "summarize":
+            summary = await self.summarize_history(dropped)
+            messages = self.insert_summary(id, messages, len(messages) - 1, summary)
+        turn_start = len(messages) - 1
 
         if self.function_calling:
-            function_results = self.call_functions(language=language, id=id)
+            function_results = await self.call_functions(
+                messages=messages,
+                language=language,
+                id=id,
+                function_kwargs=function_kwargs
+            )
             if self.return_functions:
                 # Return function-call results directly:
+                self.save_turn(id, message, messages[turn_start:])
                 return function_results
 
         # Call chat API:
-        response = self.chat.completions.create(
-            model=self.deployment,
-            messages=self.messages
+        with tracing.span("aoai.completion", deployment=self.deployment, purpose="chat"):
+            response = await resilience.get_policy("aoai").call_async(
+                self.chat.completions.create,
+                **self.create_completion_request(messages)
+            )
+            record_usage(response)
+        return self.finish_turn(
+            id,
+            message,
+            language,
+            messages[turn_start:],
+            response.choices[0].message,
+            lookup
         )
-        response_message = response.choices[0].message
-        self.logger.info(f"Model response: {response_message}")
-        self.messages.append(response_message)
 
-        return response_message.content
+    async def chat_completion_stream(
+        self,
+        message: str,
+        language: str = None,
+        id: str = None
+    ) -> AsyncIterator[str]:
+        """
+        Streaming AOAI chat completion (without function calling).
+
+        Yields content tokens as they are generated;
+        history is saved once the completion finishes.
+        """
+        messages = self.get_session_messages(id)
+        lookup = None
+        if self.use_response_cache(messages):
+            cached, lookup = await self.lookup_response(message, language)
+            if cached is not None:
+                yield self.save_cached_turn(id, message, cached)
+                return
+
+        # Add user message, compacting history over token budget:
+        prompt = await self.generate_rag_prompt(message) if self.use_rag else message
+        messages, dropped = self.start_turn(id, messages, prompt)
+        if dropped and self.history_compaction == "summarize":
+            summary = await self.summarize_history(dropped)
+            messages = self.insert_summary(id, messages, len(messages) - 1, summary)
+        turn_start = len(messages) - 1
+
+        # Call chat API (span covers the request up to the response headers):
+        with tracing.span("aoai.completion", deployment=self.deployment, purpose="chat_stream"):
+            stream = await resilience.get_policy("aoai").call_async(
+                self.chat.completions.create,
+                **self.create_completion_request(messages, stream=True)
+            )
+
+        content = []
+        async for chunk in stream:
+            token = get_stream_token(chunk)
+            if token:
+                content.append(token)
+                yield token
+
+        self.finish_turn(
+            id,
+            message,
+            language,
+            messages[turn_start:],
+            {"role": "assistant", "content": "".join(content)},
+            lookup
+        )
@@ -0,0 +1,115 @@
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT License.
+import re
+import time
+import threading
+from collections import OrderedDict
+from typing import Any, Hashable
+
+"""
+Thread-safe TTL/LRU cache with hit/miss accounting.
+"""
+
+_MISSING = object()
+
+
+def normalize_text(
+    text: str
+) -> str:
+    """
+    Normalize text for cache keys (case, whitespace, trailing punctuation).
+    """
+    text = re.sub(r"\s+", " ", text.strip().lower())
+    return text.strip(" .!?")
+
+
+class TTLCache():
+    """
+    Size-bounded LRU cache whose entries expire after ttl seconds.
+
+    Tracks hits/misses and, when callers report it, the latency
+    saved by hits (estimated from the average latency of misses).
+    """
+
+    def __init__(
+        self,
+        maxsize: int,
+        ttl: float = None
+    ):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.miss_latency = 0.0
+
+    def get(
+        self,
+        key: Hashable,
+        default: Any = None
+    ) -> Any:
+        """
+        Get cached value (default if missing or expired).
+        """
+        now = time.monotonic()
+        with self.lock:
+            entry = self.entries.get(key, _MISSING)
+            if entry is not _MISSING:
+                expires, value = entry
+                if expires is None or expires > now:
+                    self.entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                self.entries.pop(key)
+                self.evictions += 1
+            self.misses += 1
+            return default
+
+    def set(
+        self,
+        key: Hashable,
+        value: Any,
+        latency: float = None
+    ) -> None:
+        """
+        Cache value; latency is the cost of computing it (for savings).
+        """
+        expires = time.monotonic() + self.ttl if self.ttl else None
+        with self.lock:
+            self.entries[key] = (expires, value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+            if latency is not None:
+                self.miss_latency += latency
+
+    def delete(
+        self,
+        key: Hashable
+    ) -> None:
+        with self.lock:
+            self.entries.pop(key, None)
+
+    def clear(self) -> None:
+        with self.lock:
+            self.entries.clear()
+
+    def get_metrics(self) -> dict:
+        """
+        Get hit ratio and estimated latency saved.
+        """
+        with self.lock:
+            lookups = self.hits + self.misses
+            avg_miss_latency = self.miss_latency / self.misses if self.misses else 0.0
+            return {
+                "size": len(self.entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "avg_miss_latency_ms": avg_miss_latency * 1000,
+                "latency_saved_ms": self.hits * avg_miss_latency * 1000
+            }
@@ -0,0 +1,460 @@
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT License.
+import os
+import time
+import asyncio
+import logging
+import threading
+import importlib.util
+import aiohttp
+import openai
+import requests
+from collections import Counter
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from azure.core.credentials import AccessToken
+from azure.core.pipeline.transport import AioHttpTransport, RequestsTransport
+import tracing
+from utils import Lazy, get_azure_credential, get_azure_credential_async
+
+"""
+Shared credentials and HTTP connection pools for all Azure clients.
+
+One credential per process (sync and async) with a token cache, so each
+scope's token is acquired once and refreshed shortly before it expires,
+instead of per client. Azure SDK clients share one pooled requests
+session (sync) or aiohttp session (async); AOAI clients share one httpx
+client (HTTP/2 when the h2 package is installed). Connection reuse and
+token acquisition are counted per transport.
+"""
+
+CLIENT_SHARING_ENABLED = os.environ.get("CLIENT_SHARING_ENABLED", "true").lower() == "true"
+# Connections kept alive per host:
+HTTP_POOL_SIZE = int(os.environ.get("HTTP_POOL_SIZE", "100"))
+# Hosts with a connection pool (requests):
+HTTP_POOL_HOSTS = int(os.environ.get("HTTP_POOL_HOSTS", "16"))
+HTTP_KEEPALIVE_TIMEOUT = float(os.environ.get("HTTP_KEEPALIVE_TIMEOUT", "60"))
+HTTP2_ENABLED = os.environ.get("HTTP2_ENABLED", "true").lower() == "true"
+# Refresh tokens this many seconds before they expire:
+TOKEN_REFRESH_MARGIN = float(os.environ.get("TOKEN_REFRESH_MARGIN", "300"))
+
+_logger = logging.getLogger(__name__)
+
+
+class ConnectionMetrics():
+    """
+    Requests and new connections per transport (the rest reused a connection).
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.requests = Counter()
+        self.connections = Counter()
+
+    def record_request(
+        self,
+        transport: str
+    ) -> None:
+        with self.lock:
+            self.requests[transport] += 1
+
+    def record_connection(
+        self,
+        transport: str
+    ) -> None:
+        with self.lock:
+            self.connections[transport] += 1
+
+    def get_metrics(self) -> dict:
+        with self.lock:
+            return {
+                transport: {
+                    "requests": requests,
+                    "connections": self.connections[transport],
+                    "reuse_ratio": 1 - min(self.connections[transport], requests) / requests if requests else 0.0
+                }
+                for transport, requests in self.requests.items()
+            }
+
+
+class TokenMetrics():
+    """
+    Token requests served from the cache vs. acquired (and refreshed).
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.acquisitions = 0
+        self.refreshes = 0
+        self.failures = 0
+        self.acquire_time = 0.0
+
+    def record_request(self) -> None:
+        with self.lock:
+            self.requests += 1
+
+    def record_acquisition(
+        self,
+        refresh: bool,
+        acquire_time: float,
+        failed: bool = False
+    ) -> None:
+        with self.lock:
+            if failed:
+                self.failures += 1
+                return
+            self.acquisitions += 1
+            self.refreshes += int(refresh)
+            self.acquire_time += acquire_time
+
+    def get_metrics(self) -> dict:
+        with self.lock:
+            return {
+                "requests": self.requests,
+                "acquisitions": self.acquisitions,
+                "refreshes": self.refreshes,
+                "failures": self.failures,
+                "hit_ratio": 1 - self.acquisitions / self.requests if self.requests else 0.0,
+                "avg_acquire_ms": self.acquire_time / self.acquisitions * 1000 if self.acquisitions else 0.0
+            }
+
+
+connection_metrics = ConnectionMetrics()
+token_metrics = TokenMetrics()
+
+
+def get_token_key(
+    scopes: tuple[str, ...],
+    kwargs: dict
+) -> tuple:
+    return (scopes, kwargs.get("claims"), kwargs.get("tenant_id"))
+
+
+def get_refresh_time(
+    token: AccessToken
+) -> float:
+    """
+    When to refresh token: TOKEN_REFRESH_MARGIN before it expires
+    (halfway through, for short-lived tokens).
+    """
+    now = time.time()
+    return token.expires_on - min(TOKEN_REFRESH_MARGIN, (token.expires_on - now) / 2)
+
+
+def is_fresh(
+    entry: tuple[AccessToken, float] | None
+) -> bool:
+    return entry is not None and time.time() < entry[1]
+
+
+class CachedTokenCredential():
+    """
+    Credential caching tokens per scope until shortly before they expire.
+
+    Concurrent requests for a missing or expiring token wait for a
+    single acquisition.
+    """
+
+    def __init__(
+        self,
+        credential
+    ):
+        self.credential = credential
+        self.tokens = {}
+        self.locks = {}
+        self.lock = threading.Lock()
+
+    def get_token(
+        self,
+        *scopes: str,
+        **kwargs
+    ) -> AccessToken:
+        token_metrics.record_request()
+        key = get_token_key(scopes, kwargs)
+        entry = self.tokens.get(key)
+        if is_fresh(entry):
+            return entry[0]
+
+        with self.lock:
+            lock = self.locks.setdefault(key, threading.Lock())
+        with lock:
+            entry = self.tokens.get(key)
+            if is_fresh(entry):
+                return entry[0]
+            start = time.perf_counter()
+            try:
+                token = self.credential.get_token(*scopes, **kwargs)
+            except Exception:
+                token_metrics.record_acquisition(entry is not None, 0.0, failed=True)
+                raise
+            token_metrics.record_acquisition(entry is not None, time.perf_counter() - start)
+            self.tokens[key] = (token, get_refresh_time(token))
+            return token
+
+    def close(self) -> None:
+        self.credential.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args) -> None:
+        # Shared credential outlives clients:
+        pass
+
+
+class AsyncCachedTokenCredential():
+    """
+    Async credential caching tokens per scope (see CachedTokenCredential).
+    """
+
+    def __init__(
+        self,
+        credential
+    ):
+        self.credential = credential
+        self.tokens = {}
+        self.locks = {}
+
+    async def get_token(
+        self,
+        *scopes: str,
+        **kwargs
+    ) -> AccessToken:
+        token_metrics.record_request()
+        key = get_token_key(scopes, kwargs)
+        entry = self.tokens.get(key)
+        if is_fresh(entry):
+            return entry[0]
+
+        lock = self.locks.setdefault(key, asyncio.Lock())
+        async with lock:
+            entry = self.tokens.get(key)
+            if is_fresh(entry):
+                return entry[0]
+            start = time.perf_counter()
+            try:
+                token = await self.credential.get_token(*scopes, **kwargs)
+            except Exception:
+                token_metrics.record_acquisition(entry is not None, 0.0, failed=True)
+                raise
+            token_metrics.record_acquisition(entry is not None, time.perf_counter() - start)
+            self.tokens[key] = (token, get_refresh_time(token))
+            return token
+
+    async def close(self) -> None:
+        await self.credential.close()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args) -> None:
+        # Shared credential outlives clients:
+        pass
+
+
+def record_request(
+    transport: str,
+    retry: bool = False
+) -> None:
+    """
+    Count request for transport and on the current tracing span.
+    """
+    connection_metrics.record_request(transport)
+    tracing.increment("http_requests")
+    if retry:
+        tracing.increment("retries")
+
+
+def is_retry(request) -> bool:
+    """
+    Whether an AOAI request is a retry (the SDK sends the attempt number).
+    """
+    return request.headers.get("x-stainless-retry-count", "0") != "0"
+
+
+def create_requests_session() -> requests.Session:
+    """
+    Pooled session counting requests and connections.
+    """
+    session = requests.Session()
+    # Retries are left to the Azure SDK pipeline:
+    adapter = HTTPAdapter(
+        pool_connections=HTTP_POOL_HOSTS,
+        pool_maxsize=HTTP_POOL_SIZE,
+        max_retries=Retry(total=False, redirect=False, raise_on_status=False)
+    )
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    session.hooks["response"].append(lambda response, **kwargs: record_request("azure"))
+
+    # urllib3 counts connections per host pool:
+    def count_connections(pool_manager) -> int:
+        return sum(pool_manager.pools[key].num_connections for key in pool_manager.pools.keys())
+
+    session.count_connections = lambda: count_connections(adapter.poolmanager)
+    return session
+
+
+def create_aiohttp_session() -> aiohttp.ClientSession:
+    """
+    Pooled session counting requests and connections (on the running loop).
+    """
+    async def on_request_start(session, context, params) -> None:
+        record_request("azure_async")
+
+    async def on_connection_create_end(session, context, params) -> None:
+        connection_metrics.record_connection("azure_async")
+
+    trace_config = aiohttp.TraceConfig()
+    trace_config.on_request_start.append(on_request_start)
+    trace_config.on_connection_create_end.append(on_connection_create_end)
+    return aiohttp.ClientSession(
+        connector=aiohttp.TCPConnector(
+            limit=HTTP_POOL_SIZE,
+            keepalive_timeout=HTTP_KEEPALIVE_TIMEOUT
+        ),
+        cookie_jar=aiohttp.DummyCookieJar(),
+        auto_decompress=False,
+        trust_env=True,
+        trace_configs=[trace_config]
+    )
+
+
+def is_http2_available() -> bool:
+    return HTTP2_ENABLED and importlib.util.find_spec("h2") is not None
+
+
+def create_http_client() -> openai.DefaultHttpxClient:
+    """
+    Shared AOAI HTTP client counting requests and new connections.
+    """
+    def trace(event: str, info: dict) -> None:
+        if event == "connection.connect_tcp.started":
+            connection_metrics.record_connection("aoai")
+
+    def on_request(request) -> None:
+        record_request("aoai", retry=is_retry(request))
+        request.extensions["trace"] = trace
+
+    return openai.DefaultHttpxClient(
+        http2=is_http2_available(),
+        event_hooks={"request": [on_request]}
+    )
+
+
+def create_http_client_async() -> openai.DefaultAsyncHttpxClient:
+    async def trace(event: str, info: dict) -> None:
+        if event == "connection.connect_tcp.started":
+            connection_metrics.record_connection("aoai_async")
+
+    async def on_request(request) -> None:
+        record_request("aoai_async", retry=is_retry(request))
+        request.extensions["trace"] = trace
+
+    return openai.DefaultAsyncHttpxClient(
+        http2=is_http2_available(),
+        event_hooks={"request": [on_request]}
+    )
+
+
+credential = Lazy(lambda: CachedTokenCredential(get_azure_credential()))
+credential_async = Lazy(lambda: AsyncCachedTokenCredential(get_azure_credential_async()))
+requests_session = Lazy(create_requests_session)
+http_client = Lazy(create_http_client)
+http_client_async = Lazy(create_http_client_async)
+# aiohttp sessions are bound to the loop they were created on:
+_aiohttp_sessions = {}
+_aiohttp_sessions_lock = threading.Lock()
+
+
+def get_aiohttp_session() -> aiohttp.ClientSession:
+    loop = asyncio.get_running_loop()
+    with _aiohttp_sessions_lock:
+        session = _aiohttp_sessions.get(loop)
+        if session is None or session.closed:
+            # Drop sessions of closed loops:
+            for closed in [l for l in _aiohttp_sessions if l.is_closed()]:
+                del _aiohttp_sessions[closed]
+            session = _aiohttp_sessions[loop] = create_aiohttp_session()
+        return session
+
+
+class SharedAioHttpTransport(AioHttpTransport):
+    """
+    aiohttp transport using the shared session of the running loop.
+    """
+
+    async def open(self):
+        if self.session is None:
+            self.session = get_aiohttp_session()
+        await super().open()
+
+    async def close(self):
+        # Shared session outlives clients:
+        pass
+
+
+def get_credential():
+    """
+    Shared sync credential (a new one if sharing is disabled).
+    """
+    if not CLIENT_SHARING_ENABLED:
+        return get_azure_credential()
+    return credential.get()
+
+
+def get_credential_async():
+    """
+    Shared async credential (a new one if sharing is disabled).
+    """
+    if not CLIENT_SHARING_ENABLED:
+        return get_azure_credential_async()
+    return credential_async.get()
+
+
+def get_transport() -> RequestsTransport | None:
+    """
+    Transport for sync Azure SDK clients (None for the SDK default).
+    """
+    if not CLIENT_SHARING_ENABLED:
+        return None
+    return RequestsTransport(session=requests_session.get(), session_owner=False)
+
+
+def get_transport_async() -> AioHttpTransport | None:
+    """
+    Transport for async Azure SDK clients (None for the SDK default).
+    """
+    if not CLIENT_SHARING_ENABLED:
+        return None
+    return SharedAioHttpTransport()
+
+
+def get_http_client() -> openai.DefaultHttpxClient | None:
+    """
+    HTTP client for AOAI clients (None for the SDK default).
+    """
+    return http_client.get() if CLIENT_SHARING_ENABLED else None
+
+
+def get_http_client_async() -> openai.DefaultAsyncHttpxClient | None:
+    return http_client_async.get() if CLIENT_SHARING_ENABLED else None
+
+
+def get_metrics() -> dict:
+    """
+    Connection reuse per transport and token cache metrics.
+    """
+    connections = connection_metrics.get_metrics()
+    if "azure" in connections:
+        # Sync Azure SDK connections come from the urllib3 pools:
+        azure = connections["azure"]
+        azure["connections"] = requests_session.get().count_connections()
+        azure["reuse_ratio"] = 1 - min(azure["connections"], azure["requests"]) / azure["requests"]
+    return {
+        "enabled": CLIENT_SHARING_ENABLED,
+        "http2": is_http2_available(),
+        "connections": connections,
+        "tokens": token_metrics.get_metrics()
+    }
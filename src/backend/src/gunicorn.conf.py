@@ -0,0 +1,55 @@
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT License.
+import os
+import multiprocessing
+
+"""
+Gunicorn settings for production serving (`gunicorn server:app`).
+"""
+
+# Stores and caches kept in process memory are not shared across workers,
+# so conversations would lose history (and PII mappings) whenever a request
+# lands on another worker:
+IN_MEMORY_STORES = [
+    name for name, enabled in [
+        ("SESSION_STORE_BACKEND", os.environ.get("SESSION_STORE_BACKEND", "memory") == "memory"),
+        ("PII_STORE_BACKEND", os.environ.get("PII_STORE_BACKEND", "memory") == "memory"),
+        ("RAG_CACHE_ENABLED", os.environ.get("RAG_CACHE_ENABLED", "false").lower() == "true"),
+        ("ROUTER_CACHE_ENABLED", os.environ.get("ROUTER_CACHE_ENABLED", "false").lower() == "true")
+    ]
+    if enabled
+]
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '7000')}"
+# Scale with threads in a single worker unless every store is shared:
+default_workers = 1 if IN_MEMORY_STORES else multiprocessing.cpu_count() * 2 + 1
+workers = int(os.environ.get("WEB_CONCURRENCY", default_workers))
+threads = int(os.environ.get("GUNICORN_THREADS", "8"))
+worker_class = "gthread"
+timeout = int(os.environ.get("GUNICORN_TIMEOUT", "120"))
+keepalive = int(os.environ.get("GUNICORN_KEEPALIVE", "5"))
+accesslog = "-"
+
+# Clients are built after fork, so each worker owns its own connections:
+preload_app = False
+
+
+def on_starting(server):
+    """
+    Warn when per-process stores are served by several workers.
+    """
+    if workers > 1 and IN_MEMORY_STORES:
+        server.log.warning(
+            f"Running {workers} workers with in-memory stores "
+            f"({', '.join(IN_MEMORY_STORES)}); conversation state is not "
+            "shared across workers, configure shared store backends or "
+            "WEB_CONCURRENCY=1"
+        )
+
+
+def post_worker_init(worker):
+    """
+    Create clients once per worker before it accepts requests.
+    """
+    from server import init_clients
+    init_clients()
@@ -0,0 +1,318 @@
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT License.
+import os
+import re
+import json
+import math
+import logging
+import threading
+from collections import Counter
+from router.router_type import RouterType
+
+"""
+Local intent pre-classifier.
+
+A TF-IDF nearest-example classifier trained offline from the CLU project
+utterances and CQA questions (infra/data/clu_import.json, cqa_import.json).
+Confident predictions are turned into CLU/CQA routing results in-process,
+so the remote router is only called for uncertain utterances.
+"""
+
+INTENT_CLASSIFIER_ENABLED = os.environ.get("INTENT_CLASSIFIER_ENABLED", "false").lower() == "true"
+# Trained model (see benchmarks/intent_classifier_eval.py --save-model):
+INTENT_CLASSIFIER_MODEL = os.environ.get("INTENT_CLASSIFIER_MODEL", "intent_model.json")
+INTENT_CLASSIFIER_THRESHOLD = float(os.environ.get("INTENT_CLASSIFIER_THRESHOLD", "0.7"))
+# Minimum similarity gap between the best and second-best label:
+INTENT_CLASSIFIER_MARGIN = float(os.environ.get("INTENT_CLASSIFIER_MARGIN", "0.15"))
+
+MODEL_VERSION = 1
+# CLU "None" intent: route straight to fallback.
+FALLBACK_LABEL = "fallback"
+ORDER_ID_TOKEN = "orderid"
+
+ORDER_ID_PATTERN = re.compile(r"(?<![\w-])\d{6,12}(?![\w-])")
+TOKEN_PATTERN = re.compile(r"[^\W_]+")
+
+# Router type -> label kinds it may route to:
+ROUTER_LABEL_KINDS = {
+    RouterType.CLU: ("clu", FALLBACK_LABEL),
+    RouterType.CQA: ("cqa",),
+    RouterType.ORCHESTRATION: ("clu", "cqa", FALLBACK_LABEL),
+    RouterType.TRIAGE_AGENT: ("clu", "cqa", FALLBACK_LABEL)
+}
+
+_logger = logging.getLogger(__name__)
+
+
+def extract_features(
+    text: str
+) -> Counter:
+    """
+    Word unigrams/bigrams and character trigrams (order ids collapsed).
+    """
+    text = ORDER_ID_PATTERN.sub(f" {ORDER_ID_TOKEN} ", text.lower())
+    words = TOKEN_PATTERN.findall(text)
+    features = Counter(f"w:{word}" for word in words)
+    features.update(f"b:{a} {b}" for a, b in zip(words, words[1:]))
+    for word in words:
+        padded = f" {word} "
+        features.update(f"c:{padded[i:i + 3]}" for i in range(len(padded) - 2))
+    return features
+
+
+def extract_order_ids(
+    text: str
+) -> list[dict]:
+    """
+    OrderId entities shaped like CLU runtime entities.
+    """
+    return [
+        {
+            "category": "OrderId",
+            "text": match.group(),
+            "offset": match.start(),
+            "length": len(match.group()),
+            "confidenceScore": 1.0
+        }
+        for match in ORDER_ID_PATTERN.finditer(text)
+    ]
+
+
+def create_vector(
+    features: Counter,
+    idf: dict[str, float]
+) -> dict[str, float]:
+    """
+    L2-normalized TF-IDF vector (unknown features dropped).
+    """
+    vector = {
+        feature: (1 + math.log(count)) * idf[feature]
+        for feature, count in features.items() if feature in idf
+    }
+    norm = math.sqrt(sum(value * value for value in vector.values()))
+    return {feature: value / norm for feature, value in vector.items()} if norm else {}
+
+
+def load_examples(
+    clu_project: dict,
+    cqa_project: dict
+) -> tuple[list[tuple[str, str]], dict[str, dict]]:
+    """
+    Labelled (text, label) examples and per-label routing metadata.
+
+    Labels are "clu:<intent>", "cqa:<qna id>" or FALLBACK_LABEL.
+    """
+    examples = []
+    labels = {}
+    for utterance in clu_project["assets"]["utterances"]:
+        intent = utterance["intent"]
+        label = FALLBACK_LABEL if intent == "None" else f"clu:{intent}"
+        examples.append((utterance["text"], label))
+        # Entity categories present in every utterance of the intent:
+        categories = {entity["category"] for entity in utterance["entities"]}
+        if label in labels:
+            labels[label]["entities"] = sorted(categories & set(labels[label]["entities"]))
+        else:
+            labels[label] = {"intent": intent, "entities": sorted(categories)}
+
+    for qna in cqa_project["assets"]["qnas"]:
+        label = f"cqa:{qna['id']}"
+        examples.extend((question, label) for question in qna["questions"])
+        labels[label] = {"answer": qna["answer"], "question": qna["questions"][0]}
+    return examples, labels
+
+
+def train(
+    clu_project: dict,
+    cqa_project: dict
+) -> dict:
+    """
+    Train classifier model (JSON-serializable) from CLU/CQA project exports.
+    """
+    examples, labels = load_examples(clu_project, cqa_project)
+    features = [extract_features(text) for text, _ in examples]
+
+    document_frequency = Counter()
+    for example_features in features:
+        document_frequency.update(example_features.keys())
+    idf = {
+        feature: math.log((1 + len(examples)) / (1 + count)) + 1
+        for feature, count in document_frequency.items()
+    }
+
+    language = clu_project["metadata"].get("language", "en-us")
+    return {
+        "version": MODEL_VERSION,
+        "languages": [language.split("-")[0]],
+        "idf": idf,
+        "labels": labels,
+        "examples": [
+            {"label": label, "vector": create_vector(example_features, idf)}
+            for (_, label), example_features in zip(examples, features)
+        ]
+    }
+
+
+class IntentClassifier():
+    """
+    Nearest-example classifier over a trained model.
+
+    Confidence is the cosine similarity to the closest example; a
+    prediction is confident when it clears the threshold and the
+    closest example of any other label by the margin.
+    """
+
+    def __init__(
+        self,
+        model: dict,
+        label_kinds: tuple[str, ...] = None,
+        threshold: float = INTENT_CLASSIFIER_THRESHOLD,
+        margin: float = INTENT_CLASSIFIER_MARGIN
+    ):
+        if model.get("version") != MODEL_VERSION:
+            raise ValueError(f"Unsupported intent model version: {model.get('version')}")
+        self.languages = set(model["languages"])
+        self.idf = model["idf"]
+        self.labels = model["labels"]
+        self.examples = [
+            (example["label"], example["vector"]) for example in model["examples"]
+            if label_kinds is None or example["label"].split(":")[0] in label_kinds
+        ]
+        self.threshold = threshold
+        self.margin = margin
+
+    def predict(
+        self,
+        text: str
+    ) -> tuple[str | None, float, float]:
+        """
+        Best label, its similarity and margin over the second-best label.
+
+        Labels whose training utterances all carry an order id are only
+        considered when text has one.
+        """
+        has_order_id = ORDER_ID_PATTERN.search(text) is not None
+        vector = create_vector(extract_features(text), self.idf)
+        scores = {}
+        for label, example in self.examples:
+            if not has_order_id and "OrderId" in self.labels[label].get("entities", ()):
+                continue
+            similarity = sum(value * example.get(feature, 0.0) for feature, value in vector.items())
+            if similarity > scores.get(label, -1.0):
+                scores[label] = similarity
+
+        if not scores:
+            return None, 0.0, 0.0
+        ranked = sorted(scores.values(), reverse=True)
+        label = max(scores, key=scores.get)
+        second = ranked[1] if len(ranked) > 1 else 0.0
+        return label, ranked[0], ranked[0] - second
+
+    def is_confident(
+        self,
+        confidence: float,
+        margin: float
+    ) -> bool:
+        return confidence >= self.threshold and margin >= self.margin
+
+    def create_result(
+        self,
+        text: str,
+        label: str,
+        confidence: float
+    ) -> dict:
+        """
+        Routing result shaped like the CLU/CQA router results.
+        """
+        if label == FALLBACK_LABEL:
+            return {
+                "kind": "clu_result",
+                "error": "No intent recognized (local)",
+                "intent": "None",
+                "entities": [],
+                "confidence": confidence,
+                "api_response": None
+            }
+
+        if label.startswith("clu:"):
+            return {
+                "kind": "clu_result",
+                "error": None,
+                "intent": self.labels[label]["intent"],
+                "entities": extract_order_ids(text),
+                "confidence": confidence,
+                "api_response": None
+            }
+
+        return {
+            "kind": "cqa_result",
+            "error": None,
+            "answer": self.labels[label]["answer"],
+            "question": self.labels[label]["question"],
+            "confidence": confidence,
+            "api_response": None
+        }
+
+    def classify(
+        self,
+        text: str,
+        language: str
+    ) -> dict | None:
+        """
+        Routing result when confident, else None (use the remote router).
+        """
+        if language.split("-")[0] not in self.languages:
+            return None
+        label, confidence, margin = self.predict(text)
+        if label is None or not self.is_confident(confidence, margin):
+            return None
+        return self.create_result(text, label, confidence)
+
+
+class ClassifierMetrics():
+    """
+    Local classifications and remote router calls avoided.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.classified = 0
+        self.routes = Counter()
+
+    def record(
+        self,
+        result: dict | None
+    ) -> None:
+        with self.lock:
+            self.classified += 1
+            if result is None:
+                self.routes["remote"] += 1
+            elif result["error"] is not None:
+                self.routes["fallback"] += 1
+            else:
+                self.routes["clu" if result["kind"] == "clu_result" else "cqa"] += 1
+
+    def get_metrics(self) -> dict:
+        with self.lock:
+            skipped = self.classified - self.routes["remote"]
+            return {
+                "classified": self.classified,
+                "routes": dict(self.routes),
+                "skipped_remote_calls": skipped,
+                "skip_rate": skipped / self.classified if self.classified else 0.0
+            }
+
+
+def create_intent_classifier(
+    router_type: RouterType
+) -> IntentClassifier | None:
+    """
+    Load classifier (None if disabled or router type has no CLU/CQA routes).
+    """
+    if not INTENT_CLASSIFIER_ENABLED or router_type not in ROUTER_LABEL_KINDS:
+        return None
+
+    _logger.info(f"Loading intent model {INTENT_CLASSIFIER_MODEL}")
+    with open(INTENT_CLASSIFIER_MODEL, "r") as fp:
+        model = json.load(fp)
+    return IntentClassifier(model, label_kinds=ROUTER_LABEL_KINDS[router_type])
@@ -0,0 +1,209 @@
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT License.
+import os
+import re
+import threading
+from typing import NamedTuple
+
+"""
+Local PII pre-screen and offline recognizer.
+
+Pattern categories (emails, phone numbers, card numbers, order ids) are
+detected with regexes and checksum validation. Open-class categories
+(person, organization, ...) cannot be detected locally; text counts as
+clean for them only when every word is in a common-word vocabulary.
+"""
+
+PII_PRESCREEN_ENABLED = os.environ.get("PII_PRESCREEN_ENABLED", "false").lower() == "true"
+# remote (Azure AI Language) | local (offline, pattern categories only):
+PII_RECOGNITION_MODE = os.environ.get("PII_RECOGNITION_MODE", "remote").lower()
+# Extra clean words (one per line), e.g. product vocabulary:
+PII_PRESCREEN_VOCABULARY = os.environ.get("PII_PRESCREEN_VOCABULARY")
+
+# Confidence reported for local detections:
+LOCAL_CONFIDENCE = 0.9
+
+EMAIL_PATTERN = re.compile(r"[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Za-z]{2,}")
+CARD_PATTERN = re.compile(r"(?<![\d-])\d(?:[ -]?\d){12,18}(?![\d-])")
+PHONE_PATTERN = re.compile(r"(?<![\w+])(?:\+\d{1,3}[ .-]?)?(?:\(\d{2,4}\)[ .-]?)?\d{2,4}(?:[ .-]?\d{2,4}){1,3}(?!\w)")
+ORDER_ID_PATTERN = re.compile(r"(?<![\w-])\d{6,12}(?![\w-])")
+DATE_PATTERN = re.compile(r"\d{4}-\d{1,2}-\d{1,2}|\d{1,2}-\d{1,2}-\d{4}")
+WORD_PATTERN = re.compile(r"[^\W\d_]+(?:'[^\W\d_]+)?")
+
+COMMON_WORDS = frozenset("""
+a about after again all also am an and any anything are as ask at be because been before
+bye can cancel can't cannot could day did do does doesn't don't done else everything fine
+for from get give go good great had has have hello help hey hi how i i'm if in is isn't
+it it's just know let like looking many me more morning much my need no not nothing now
+of off ok okay on one only or other our out please problem question questions really
+return returns right see should so some something sorry status still sure tell than thank
+thanks that that's the their them then there these they thing this time to today too
+understand up us want was way we well were what what's when where which who why will
+with without would yes yet you you're your
+""".split())
+
+_vocabulary = None
+_vocabulary_lock = threading.Lock()
+
+
+class LocalEntity(NamedTuple):
+    text: str
+    category: str
+    confidence_score: float
+
+
+class LocalRecognitionResult(NamedTuple):
+    entities: list[LocalEntity]
+    is_error: bool = False
+
+
+def is_luhn_valid(
+    digits: str
+) -> bool:
+    """
+    Luhn checksum (card numbers).
+    """
+    total = 0
+    for i, digit in enumerate(reversed(digits)):
+        value = int(digit)
+        if i % 2:
+            value = value * 2 - 9 if value > 4 else value * 2
+        total += value
+    return total % 10 == 0
+
+
+def only_digits(
+    text: str
+) -> str:
+    return re.sub(r"\D", "", text)
+
+
+def find_emails(text: str) -> list[str]:
+    return EMAIL_PATTERN.findall(text)
+
+
+def find_card_numbers(text: str) -> list[str]:
+    return [
+        match for match in CARD_PATTERN.findall(text)
+        if 13 <= len(only_digits(match)) <= 19 and is_luhn_valid(only_digits(match))
+    ]
+
+
+def find_phone_numbers(text: str) -> list[str]:
+    # Bare digit runs without separators or country code are ambiguous (order ids):
+    return [
+        match for match in PHONE_PATTERN.findall(text)
+        if 7 <= len(only_digits(match)) <= 15
+        and (match.startswith("+") or not match.isdigit())
+        and not DATE_PATTERN.fullmatch(match)
+    ]
+
+
+def find_order_ids(text: str) -> list[str]:
+    return ORDER_ID_PATTERN.findall(text)
+
+
+# Category (as in PII_CATEGORIES) -> detector, in priority order:
+PATTERN_DETECTORS = {
+    "EMAIL": find_emails,
+    "CREDITCARDNUMBER": find_card_numbers,
+    "PHONENUMBER": find_phone_numbers,
+    "ORDERID": find_order_ids
+}
+
+
+def get_vocabulary() -> frozenset:
+    """
+    Common words plus PII_PRESCREEN_VOCABULARY (loaded once).
+    """
+    global _vocabulary
+    with _vocabulary_lock:
+        if _vocabulary is None:
+            words = set(COMMON_WORDS)
+            if PII_PRESCREEN_VOCABULARY:
+                with open(PII_PRESCREEN_VOCABULARY, "r") as fp:
+                    words.update(line.strip().lower() for line in fp if line.strip())
+            _vocabulary = frozenset(words)
+    return _vocabulary
+
+
+def has_only_common_words(
+    text: str
+) -> bool:
+    if any(c.isdigit() for c in text):
+        return False
+    vocabulary = get_vocabulary()
+    return all(word in vocabulary for word in WORD_PATTERN.findall(text.lower()))
+
+
+def recognize_locally(
+    text: str,
+    categories: list[str]
+) -> LocalRecognitionResult:
+    """
+    Detect pattern-category entities (each span reported once).
+    """
+    entities = []
+    seen = set()
+    for category, detect in PATTERN_DETECTORS.items():
+        if category not in categories:
+            continue
+        for match in detect(text):
+            if any(match in other for other in seen):
+                continue
+            seen.add(match)
+            entities.append(LocalEntity(match, category, LOCAL_CONFIDENCE))
+    return LocalRecognitionResult(entities)
+
+
+def is_clean(
+    text: str,
+    categories: list[str]
+) -> bool:
+    """
+    Whether text provably has no entities in categories.
+
+    Pattern categories need their candidate characters ("@" or digits),
+    so the check does not depend on regex recall.
+    """
+    has_digits = any(c.isdigit() for c in text)
+    for category in categories:
+        if not category:
+            continue
+        if category == "EMAIL":
+            if "@" in text:
+                return False
+        elif category in PATTERN_DETECTORS:
+            if has_digits:
+                return False
+        elif not has_only_common_words(text):
+            return False
+    return True
+
+
+class PrescreenMetrics():
+    """
+    Pre-screened texts and skipped remote calls.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.checked = 0
+        self.skipped = 0
+
+    def record(
+        self,
+        skipped: bool
+    ) -> None:
+        with self.lock:
+            self.checked += 1
+            self.skipped += int(skipped)
+
+    def get_metrics(self) -> dict:
+        with self.lock:
+            return {
+                "mode": PII_RECOGNITION_MODE,
+                "checked": self.checked,
+                "skipped_remote_calls": self.skipped,
+                "skip_rate": self.skipped / self.checked if self.checked else 0.0
+            }
@@ -1,9 +1,28 @@
 # Copyright (c) Microsoft Corporation.
 # Licensed under the MIT License.
 import os
+import re
+import uuid
 import logging
+import threading
+import contextlib
+from typing import Iterator
 from azure.ai.textanalytics import TextAnalyticsClient
-from utils import get_azure_credential
+from cache import TTLCache
+from pii_prescreen import (
+    PII_PRESCREEN_ENABLED,
+    PII_RECOGNITION_MODE,
+    PATTERN_DETECTORS,
+    LocalRecognitionResult,
+    PrescreenMetrics,
+    is_clean,
+    recognize_locally
+)
+from pii_store import PII_MAPPING_TTL_SECONDS, create_pii_store
+import tracing
+from ta_batcher import TA_BATCHING_ENABLED, TextAnalyticsBatcher
+from client_registry import get_credential, get_transport
+from utils import Lazy
 
 """
 Azure AI Language PII recognition, redaction, and reconstruction.
@@ -11,28 +30,116 @@ Azure AI Language PII recognition, redaction, and reconstruction.
 
 CATEGORIES = os.environ.get("PII_CATEGORIES", "").upper().split(",")
 CONFIDENCE_THRESHOLD = float(os.environ.get("PII_CONFIDENCE_THRESHOLD", "0.5"))
-TA_CLIENT = TextAnalyticsClient(
+TA_CLIENT = Lazy(lambda: TextAnalyticsClient(
     endpoint=os.environ.get("LANGUAGE_ENDPOINT"),
-    credential=get_azure_credential()
-)
+    credential=get_credential(),
+    transport=get_transport()
+))
+# Batch concurrent recognition calls:
+TA_BATCHER = Lazy(lambda: TextAnalyticsBatcher(TA_CLIENT.get()) if TA_BATCHING_ENABLED else None)
 
-entity_id = 0
-redaction_mappings = dict()
+# Redaction mappings per conversation id:
+MAPPING_STORE = Lazy(create_pii_store)
+# Compiled matchers for recently used mappings:
+MATCHER_CACHE_SIZE = int(os.environ.get("PII_MATCHER_CACHE_SIZE", "1024"))
+compiled_mappings = TTLCache(maxsize=MATCHER_CACHE_SIZE, ttl=PII_MAPPING_TTL_SECONDS)
+prescreen_metrics = PrescreenMetrics()
+
+# Request-scoped PII context metrics (see request_context):
+context_metrics_lock = threading.Lock()
+context_metrics = {
+    "requests": 0,
+    "redactions": 0,
+    "recognitions": 0,
+    "avoided_recognitions": 0
+}
 
 _logger = logging.getLogger(__name__)
 
+if PII_RECOGNITION_MODE == "local" and not set(CATEGORIES) <= set(PATTERN_DETECTORS):
+    _logger.warning("Local PII recognition only detects: " + ", ".join(PATTERN_DETECTORS))
+
 
 def create_redaction_key(
-    category: str
+    category: str,
+    id: str
 ) -> str:
     """
-    Create PII entity redaction key.
+    Create PII entity redaction key (unique within conversation id).
     """
-    global entity_id
-    entity_id += 1
+    entity_id = MAPPING_STORE.get().next_entity_id(id)
     return f"{{PII_{category}_{entity_id}}}"
 
 
+def compile_matcher(
+    strings: list[str]
+) -> re.Pattern | None:
+    """
+    Compile alternation of literal strings, longest first
+    (so "John Smith" wins over "John" at the same position).
+    """
+    strings = sorted(set(s for s in strings if s), key=len, reverse=True)
+    if not strings:
+        return None
+    return re.compile("|".join(re.escape(s) for s in strings))
+
+
+class RedactionMapping():
+    """
+    Redaction key -> entity text mapping with compiled matchers.
+
+    Redaction and reconstruction are each a single pass over the text.
+    """
+
+    def __init__(
+        self,
+        mapping: dict[str, str]
+    ):
+        self.mapping = mapping
+        # First key wins for repeated entity text:
+        self.redactions = dict()
+        for redaction, entity in mapping.items():
+            self.redactions.setdefault(entity, redaction)
+        self.entity_matcher = compile_matcher(list(self.redactions))
+        self.redaction_matcher = compile_matcher(list(mapping))
+
+    def __len__(self) -> int:
+        return len(self.mapping)
+
+    def redact(
+        self,
+        text: str
+    ) -> str:
+        if self.entity_matcher is None:
+            return text
+        return self.entity_matcher.sub(lambda m: self.redactions[m.group(0)], text)
+
+    def reconstruct(
+        self,
+        text: str
+    ) -> str:
+        if self.redaction_matcher is None:
+            return text
+        return self.redaction_matcher.sub(lambda m: self.mapping[m.group(0)], text)
+
+
+def get_mapping(
+    id: str
+) -> RedactionMapping | None:
+    """
+    Get stored mapping with compiled matchers (None if unknown).
+    """
+    mapping = MAPPING_STORE.get().get(id)
+    if mapping is None:
+        return None
+
+    compiled = compiled_mappings.get(id)
+    if compiled is None or compiled.mapping != mapping:
+        compiled = RedactionMapping(mapping)
+        compiled_mappings.set(id, compiled)
+    return compiled
+
+
 def apply_mapping(
     text: str,
     id: str,
@@ -41,15 +148,36 @@ def apply_mapping(
     """
     Redact or reconstruct text.
     """
-    result = text
-    mapping = redaction_mappings[id]
+    mapping = get_mapping(id)
+    if mapping is None:
+        return text
+
+    if redact:
+        return mapping.redact(text)
+    return mapping.reconstruct(text)
 
-    for redaction, entity in mapping.items():
-        if redact:
-            result = result.replace(entity, redaction)
-        else:
-            result = result.replace(redaction, entity)
 
+@tracing.traced("pii.recognize")
+def recognize_remotely(
+    text: str,
+    language: str
+):
+    """
+    Recognize PII entities with Azure AI Language.
+    """
+    # Call TA:
+    if TA_BATCHER.get() is not None:
+        result = TA_BATCHER.get().submit(
+            "recognize_pii_entities",
+            text,
+            language=language
+        )
+    else:
+        response = TA_CLIENT.get().recognize_pii_entities(
+            documents=[text],
+            language=language
+        )
+        result = response[0]
     return result
 
 
@@ -63,12 +191,21 @@ def recognize(
     Recognize PII entities in text input and
     create redaction mapping.
     """
-    # Call TA:
-    response = TA_CLIENT.recognize_pii_entities(
-        documents=[text],
-        language=language
-    )
-    result = response[0]
+    if PII_RECOGNITION_MODE == "local":
+        # Offline (pattern categories only):
+        result = recognize_locally(text, CATEGORIES)
+        tracing.set_attributes(recognition="local")
+    elif PII_PRESCREEN_ENABLED and is_clean(text, CATEGORIES):
+        # Provably clean, skip TA:
+        prescreen_metrics.record(skipped=True)
+        result = LocalRecognitionResult([])
+        tracing.set_attributes(recognition="prescreened")
+    else:
+        result = recognize_remotely(text, language)
+        if PII_PRESCREEN_ENABLED:
+            prescreen_metrics.record(skipped=False)
+        tracing.set_attributes(recognition="remote")
+
     if result.is_error:
         return []
 
@@ -79,26 +216,34 @@ def recognize(
         confidence = ent.confidence_score
 
         if category in CATEGORIES and confidence > CONFIDENCE_THRESHOLD:
-            redaction_key = create_redaction_key(category)
+            redaction_key = create_redaction_key(category, id)
             mapping[redaction_key] = ent.text
 
+    tracing.set_attributes(entities=len(mapping))
     if cache:
-        # Store mapping:
-        redaction_mappings[id] = mapping
+        # Store mapping (merged with concurrent requests' entries):
+        MAPPING_STORE.get().update(id, mapping)
 
     return len(mapping) != 0
 
 
+@tracing.traced("pii.redact")
 def redact(
     text: str,
     id: str,
     language: str = "en",
-    cache: bool = True
+    cache: bool = True,
+    context: "PIIContext" = None
 ) -> str:
     """
     Create text redaction.
+
+    With a request context, the context's mapping is used instead of id.
     """
-    if id in redaction_mappings:
+    if context is not None:
+        return context.redact(text, language)
+
+    if get_mapping(id) is not None:
         return apply_mapping(
             text=text,
             id=id,
@@ -109,7 +254,7 @@ def redact(
         _logger.info("No PII entities found")
         return text
 
-    _logger.info(f"Pre-redaction: {text}")
+    _logger.debug("Pre-redaction: %s", text)
     result = apply_mapping(
         text=text,
         id=id,
@@ -118,25 +263,32 @@ def redact(
 
     if not cache:
         # Do not store mapping:
-        redaction_mappings.pop(id)
+        remove(id)
 
-    _logger.info(f"Post-redaction: {result}")
+    _logger.debug("Post-redaction: %s", result)
     return result
 
 
+@tracing.traced("pii.reconstruct")
 def reconstruct(
     text: str,
     id: str,
-    cache: bool = False
+    cache: bool = False,
+    context: "PIIContext" = None
 ) -> str:
     """
     Reconstruct redacted text.
+
+    With a request context, the context's mapping is used instead of id.
     """
-    if id not in redaction_mappings:
+    if context is not None:
+        return context.reconstruct(text)
+
+    if get_mapping(id) is None:
         _logger.warning(f"No mapping for id: {id}")
         return text
 
-    _logger.info(f"Pre-reconstruction: {text}")
+    _logger.debug("Pre-reconstruction: %s", text)
     result = apply_mapping(
         text=text,
         id=id,
@@ -145,9 +297,9 @@ def reconstruct(
 
     if not cache:
         # Clean up memory:
-        redaction_mappings.pop(id)
+        remove(id)
 
-    _logger.info(f"Post-reconstruction: {result}")
+    _logger.debug("Post-reconstruction: %s", result)
     return result
 
 
@@ -157,8 +309,120 @@ def remove(
     """
     Remove redaction mapping.
     """
-    if id not in redaction_mappings:
+    compiled_mappings.delete(id)
+    if not MAPPING_STORE.get().delete(id):
         _logger.warning(f"No mapping for id: {id}")
+
+
+class PIIContext():
+    """
+    Request-scoped PII redaction state.
+
+    Holds one mapping for the whole request path (server, routers,
+    fallback), so each distinct text span is recognized once: texts
+    contained in already recognized text, or clean once known entities
+    are masked, reuse the mapping without another remote call.
+    """
+
+    def __init__(
+        self,
+        id: str
+    ):
+        # Own namespace, so concurrent requests in a conversation don't collide:
+        self.id = f"{id}:{uuid.uuid4().hex}"
+        self.recognized = []
+        self.lock = threading.Lock()
+        with context_metrics_lock:
+            context_metrics["requests"] += 1
+
+    def is_covered(
+        self,
+        text: str
+    ) -> bool:
+        """
+        Whether text has no entities beyond those already recognized.
+        """
+        with self.lock:
+            if any(text in recognized for recognized in self.recognized):
+                return True
+            if not self.recognized:
+                return False
+
+        mapping = get_mapping(self.id)
+        if mapping is None:
+            return False
+        masked = mapping.redact(text)
+        if mapping.redaction_matcher is not None:
+            masked = mapping.redaction_matcher.sub("", masked)
+        return is_clean(masked, CATEGORIES)
+
+    def redact(
+        self,
+        text: str,
+        language: str = "en"
+    ) -> str:
+        """
+        Redact text, recognizing entities only in text not yet covered.
+        """
+        covered = self.is_covered(text)
+        with context_metrics_lock:
+            context_metrics["redactions"] += 1
+            context_metrics["recognitions" if not covered else "avoided_recognitions"] += 1
+        tracing.set_attributes(covered=covered)
+
+        if not covered:
+            recognize(text=text, id=self.id, language=language)
+            with self.lock:
+                self.recognized.append(text)
+        return apply_mapping(text=text, id=self.id, redact=True)
+
+    def reconstruct(
+        self,
+        text: str
+    ) -> str:
+        return apply_mapping(text=text, id=self.id, redact=False)
+
+    def close(self) -> None:
+        """
+        Drop request mapping.
+        """
+        compiled_mappings.delete(self.id)
+        MAPPING_STORE.get().delete(self.id)
+
+
+@contextlib.contextmanager
+def request_context(
+    id: str,
+    enabled: bool = True
+) -> Iterator[PIIContext | None]:
+    """
+    Open request-scoped PII context (None if not enabled).
+
+    The context is passed along the request path (orchestrate, routers,
+    tool functions and fallbacks) so they share its mapping, and is
+    closed when the request ends.
+    """
+    if not enabled:
+        yield None
         return
 
-    redaction_mappings.pop(id)
+    context = PIIContext(id)
+    try:
+        yield context
+    finally:
+        context.close()
+
+
+def get_metrics() -> dict:
+    """
+    Get mapping store, matcher cache, request context and batching metrics.
+    """
+    with context_metrics_lock:
+        context_metrics_snapshot = dict(context_metrics)
+    return {
+        "store": MAPPING_STORE.get().get_metrics(),
+        "matcher_cache": compiled_mappings.get_metrics(),
+        "prescreen": prescreen_metrics.get_metrics(),
+        "context": context_metrics_snapshot,
+        "batching": TA_BATCHER.get().get_metrics() if TA_BATCHER.get() else None
+    }
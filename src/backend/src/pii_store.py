@@ -0,0 +1,210 @@
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT License.
+import os
+import time
+import logging
+import threading
+import importlib
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+
+"""
+Per-conversation PII redaction mapping storage.
+"""
+
+PII_STORE_BACKEND = os.environ.get("PII_STORE_BACKEND", "memory")
+PII_MAPPING_TTL_SECONDS = float(os.environ.get("PII_MAPPING_TTL_SECONDS", "600"))
+PII_MAX_MAPPINGS = int(os.environ.get("PII_MAX_MAPPINGS", "10000"))
+
+_logger = logging.getLogger(__name__)
+
+
+def get_mapping_size(
+    mapping: dict[str, str]
+) -> int:
+    """
+    Approximate mapping size in bytes.
+    """
+    return sum(
+        len(key.encode("utf-8")) + len(entity.encode("utf-8"))
+        for key, entity in mapping.items()
+    )
+
+
+class PIIMappingStore(ABC):
+    """
+    PII mapping store interface.
+
+    Each conversation id is a namespace holding a redaction key -> entity
+    text mapping and a counter for redaction key ids. Backends implement
+    next_entity_id/get/update/delete; namespaces expire after ttl seconds
+    of inactivity.
+    """
+
+    def __init__(
+        self,
+        ttl: float = PII_MAPPING_TTL_SECONDS
+    ):
+        self.ttl = ttl
+
+    @abstractmethod
+    def next_entity_id(
+        self,
+        id: str
+    ) -> int:
+        """
+        Atomically allocate the next entity id in namespace.
+        """
+
+    @abstractmethod
+    def get(
+        self,
+        id: str
+    ) -> dict[str, str] | None:
+        """
+        Get mapping (None if unknown or expired).
+        """
+
+    @abstractmethod
+    def update(
+        self,
+        id: str,
+        mapping: dict[str, str]
+    ) -> None:
+        """
+        Merge entries into namespace mapping.
+        """
+
+    @abstractmethod
+    def delete(
+        self,
+        id: str
+    ) -> bool:
+        """
+        Delete namespace; returns whether it existed.
+        """
+
+    def get_metrics(self) -> dict:
+        """
+        Get store metrics.
+        """
+        return {}
+
+
+class InMemoryPIIMappingStore(PIIMappingStore):
+    """
+    In-process PII mapping store with TTL and LRU eviction.
+    """
+
+    def __init__(
+        self,
+        ttl: float = PII_MAPPING_TTL_SECONDS,
+        max_mappings: int = PII_MAX_MAPPINGS
+    ):
+        PIIMappingStore.__init__(self, ttl=ttl)
+        self.max_mappings = max_mappings
+        # id -> [last_access, entity_ids, mapping]:
+        self.namespaces = OrderedDict()
+        self.lock = threading.Lock()
+        self.evictions = 0
+
+    def evict_expired(
+        self,
+        now: float
+    ) -> None:
+        """
+        Evict namespaces idle for longer than ttl (oldest first).
+        """
+        while self.namespaces:
+            id, (last_access, _, _) = next(iter(self.namespaces.items()))
+            if now - last_access <= self.ttl:
+                break
+            self.namespaces.pop(id)
+            self.evictions += 1
+
+    def touch(
+        self,
+        id: str,
+        now: float
+    ) -> list:
+        """
+        Get (or create) namespace entry and mark it most recently used.
+        """
+        self.evict_expired(now)
+        entry = self.namespaces.pop(id, None)
+        if entry is None:
+            entry = [now, 0, {}]
+        entry[0] = now
+        self.namespaces[id] = entry
+
+        while len(self.namespaces) > self.max_mappings:
+            self.namespaces.popitem(last=False)
+            self.evictions += 1
+        return entry
+
+    def next_entity_id(
+        self,
+        id: str
+    ) -> int:
+        with self.lock:
+            entry = self.touch(id, time.monotonic())
+            entry[1] += 1
+            return entry[1]
+
+    def get(
+        self,
+        id: str
+    ) -> dict[str, str] | None:
+        now = time.monotonic()
+        with self.lock:
+            self.evict_expired(now)
+            if id not in self.namespaces:
+                return None
+            entry = self.touch(id, now)
+            return dict(entry[2])
+
+    def update(
+        self,
+        id: str,
+        mapping: dict[str, str]
+    ) -> None:
+        with self.lock:
+            entry = self.touch(id, time.monotonic())
+            entry[2] = {**entry[2], **mapping}
+
+    def delete(
+        self,
+        id: str
+    ) -> bool:
+        with self.lock:
+            return self.namespaces.pop(id, None) is not None
+
+    def get_metrics(self) -> dict:
+        with self.lock:
+            self.evict_expired(time.monotonic())
+            mappings = [mapping for _, _, mapping in self.namespaces.values()]
+
+        return {
+            "mappings": len(mappings),
+            "entities": sum(len(m) for m in mappings),
+            "bytes": sum(get_mapping_size(m) for m in mappings),
+            "evictions": self.evictions
+        }
+
+
+def create_pii_store(
+    backend: str = PII_STORE_BACKEND
+) -> PIIMappingStore:
+    """
+    Create PII mapping store.
+
+    Backend is "memory" or a custom PIIMappingStore class given as
+    "module:ClassName" (e.g. a shared cache so mappings survive across workers).
+    """
+    if backend == "memory":
+        return InMemoryPIIMappingStore()
+
+    module_name, class_name = backend.split(":")
+    _logger.info(f"Using PII store backend {backend}")
+    store_class = getattr(importlib.import_module(module_name), class_name)
+    return store_class()
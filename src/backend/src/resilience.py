@@ -0,0 +1,480 @@
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT License.
+import os
+import json
+import time
+import random
+import asyncio
+import logging
+import threading
+import email.utils
+from typing import Any, Awaitable, Callable
+import openai
+from azure.core.exceptions import ServiceRequestError, ServiceResponseError
+import tracing
+
+"""
+Timeouts, retries and circuit breakers for remote dependencies.
+
+Each dependency (CLU, CQA and orchestration runtimes, AOAI, AI Search)
+has a policy: a per-attempt timeout, retries of transient failures
+(connection errors, timeouts, 408/429/5xx) after the server's
+Retry-After or a jittered exponential backoff, and a circuit breaker.
+After CIRCUIT_FAILURE_THRESHOLD consecutive failed calls the circuit
+opens and calls fail immediately with CircuitOpenError until
+CIRCUIT_RESET_TIMEOUT has passed; one trial call then closes or reopens
+it. Transient failures left after the retries are raised as
+RetriesExhaustedError (DependencyTimeoutError for timeouts); all three
+are DependencyErrors, on which routers go straight to the fallback. SDK retries are disabled
+for wrapped calls so that attempts are not multiplied.
+"""
+
+RESILIENCE_ENABLED = os.environ.get("RESILIENCE_ENABLED", "true").lower() == "true"
+# Seconds per attempt (0 for the SDK default), with per-dependency overrides, e.g. {"aoai": 60}:
+DEPENDENCY_TIMEOUTS = {
+    "clu": 5.0,
+    "cqa": 5.0,
+    "orchestration": 5.0,
+    "aoai": 30.0,
+    "search": 10.0,
+    **json.loads(os.environ.get("DEPENDENCY_TIMEOUTS", "{}"))
+}
+# Retries after the first attempt, with per-dependency overrides, e.g. {"clu": 0}:
+RETRY_MAX_RETRIES = int(os.environ.get("RETRY_MAX_RETRIES", "2"))
+DEPENDENCY_RETRIES = json.loads(os.environ.get("DEPENDENCY_RETRIES", "{}"))
+# Backoff (seconds): full jitter over base * 2^retry, capped; longer Retry-After is not waited for:
+RETRY_BACKOFF_BASE = float(os.environ.get("RETRY_BACKOFF_BASE", "0.5"))
+RETRY_BACKOFF_MAX = float(os.environ.get("RETRY_BACKOFF_MAX", "8"))
+RETRY_STATUS_CODES = {408, 429, 500, 502, 503, 504}
+# Consecutive failed calls opening a circuit (0 disables) and seconds until a trial call:
+CIRCUIT_FAILURE_THRESHOLD = int(os.environ.get("CIRCUIT_FAILURE_THRESHOLD", "5"))
+CIRCUIT_RESET_TIMEOUT = float(os.environ.get("CIRCUIT_RESET_TIMEOUT", "30"))
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+CIRCUIT_STATES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+_logger = logging.getLogger(__name__)
+
+
+class DependencyError(Exception):
+    """
+    Dependency unavailable (circuit open or transient failures after retries).
+    """
+
+    def __init__(
+        self,
+        dependency: str,
+        message: str
+    ):
+        super().__init__(message)
+        self.dependency = dependency
+
+
+class CircuitOpenError(DependencyError):
+    """
+    Call skipped: the dependency's circuit is open.
+    """
+
+    def __init__(
+        self,
+        dependency: str
+    ):
+        super().__init__(dependency, f"{dependency} circuit open")
+
+
+class RetriesExhaustedError(DependencyError):
+    """
+    Call failed with a transient error on every attempt (the last one is the cause).
+    """
+
+    def __init__(
+        self,
+        dependency: str,
+        attempts: int,
+        error: Exception
+    ):
+        super().__init__(dependency, f"{dependency} failed after {attempts} attempt(s): {type(error).__name__}: {error}")
+        self.attempts = attempts
+        self.error = error
+
+
+class DependencyTimeoutError(RetriesExhaustedError):
+    """
+    Call failed after retries, the last attempt timed out.
+    """
+
+
+def is_transient(
+    error: BaseException
+) -> bool:
+    """
+    Whether error is worth retrying (and counts against the circuit).
+    """
+    if isinstance(error, (TimeoutError, ServiceRequestError, ServiceResponseError, openai.APIConnectionError)):
+        return True
+    return getattr(error, "status_code", None) in RETRY_STATUS_CODES
+
+
+def is_timeout(
+    error: BaseException
+) -> bool:
+    return isinstance(error, (TimeoutError, openai.APITimeoutError)) or "Timeout" in type(error).__name__
+
+
+def get_retry_after(
+    error: BaseException
+) -> float | None:
+    """
+    Seconds to wait from the error response's Retry-After headers (None if absent).
+    """
+    headers = getattr(getattr(error, "response", None), "headers", None)
+    if not headers:
+        return None
+    for header, scale in (("retry-after-ms", 0.001), ("x-ms-retry-after-ms", 0.001), ("retry-after", 1.0)):
+        value = headers.get(header)
+        if not value:
+            continue
+        try:
+            return max(0.0, float(value) * scale)
+        except ValueError:
+            pass
+        try:
+            # HTTP date:
+            return max(0.0, email.utils.parsedate_to_datetime(value).timestamp() - time.time())
+        except (TypeError, ValueError):
+            pass
+    return None
+
+
+def create_failure(
+    dependency: str,
+    attempts: int,
+    error: Exception
+) -> RetriesExhaustedError:
+    if is_timeout(error):
+        return DependencyTimeoutError(dependency, attempts, error)
+    return RetriesExhaustedError(dependency, attempts, error)
+
+
+def get_backoff(
+    retry: int
+) -> float:
+    """
+    Full-jitter exponential backoff before retry (0-based).
+    """
+    return random.uniform(0, min(RETRY_BACKOFF_MAX, RETRY_BACKOFF_BASE * 2 ** retry))
+
+
+def create_azure_kwargs(
+    timeout: float | None
+) -> dict:
+    """
+    Azure SDK per-call options: transport timeouts, no pipeline retries.
+    """
+    if timeout is None:
+        return {"retry_total": 0}
+    return {"connection_timeout": timeout, "read_timeout": timeout, "retry_total": 0}
+
+
+def create_openai_kwargs(
+    timeout: float | None
+) -> dict:
+    """
+    OpenAI per-call options (client retries are disabled, see get_client_max_retries).
+    """
+    return {"timeout": timeout} if timeout is not None else {}
+
+
+def get_client_max_retries() -> int:
+    """
+    max_retries for OpenAI clients (retries belong to the aoai policy when enabled).
+    """
+    return 0 if RESILIENCE_ENABLED else openai.DEFAULT_MAX_RETRIES
+
+
+class CircuitBreaker():
+    """
+    Consecutive-failure circuit breaker (closed, open, half-open with one trial call).
+    """
+
+    def __init__(
+        self,
+        failure_threshold: int = CIRCUIT_FAILURE_THRESHOLD,
+        reset_timeout: float = CIRCUIT_RESET_TIMEOUT
+    ):
+        self.lock = threading.Lock()
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.opened = 0
+        self.trial = False
+
+    def allow(self) -> str | None:
+        """
+        State a call may proceed in (half-open for the trial call), None if open.
+        """
+        with self.lock:
+            if self.state == CLOSED:
+                return CLOSED
+            if self.state == OPEN and time.monotonic() - self.opened_at >= self.reset_timeout:
+                self.state = HALF_OPEN
+            if self.state == HALF_OPEN and not self.trial:
+                self.trial = True
+                return HALF_OPEN
+            return None
+
+    def record_success(self) -> None:
+        with self.lock:
+            self.state = CLOSED
+            self.failures = 0
+            self.trial = False
+
+    def record_failure(self) -> None:
+        with self.lock:
+            self.failures += 1
+            self.trial = False
+            if self.failure_threshold <= 0:
+                return
+            if self.state == HALF_OPEN or (self.state == CLOSED and self.failures >= self.failure_threshold):
+                self.state = OPEN
+                self.opened_at = time.monotonic()
+                self.opened += 1
+
+    def release(self) -> None:
+        """
+        Give up an unfinished trial call (e.g. cancelled).
+        """
+        with self.lock:
+            self.trial = False
+
+    def get_state(self) -> str:
+        with self.lock:
+            if self.state == OPEN and time.monotonic() - self.opened_at >= self.reset_timeout:
+                return HALF_OPEN
+            return self.state
+
+
+class DependencyPolicy():
+    """
+    Timeout, retry and circuit-breaker policy for one dependency, with metrics.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        timeout: float,
+        max_retries: int,
+        create_kwargs: Callable[[float | None], dict] = create_azure_kwargs,
+        breaker: CircuitBreaker = None
+    ):
+        self.name = name
+        self.timeout = timeout if timeout > 0 else None
+        self.max_retries = max_retries
+        self.call_kwargs = create_kwargs(self.timeout)
+        self.breaker = breaker or CircuitBreaker()
+        self.lock = threading.Lock()
+        self.counts = {
+            "calls": 0,
+            "successes": 0,
+            "failures": 0,
+            "errors": 0,
+            "retries": 0,
+            "retry_after": 0,
+            "timeouts": 0,
+            "skipped": 0
+        }
+
+    def count(
+        self,
+        key: str
+    ) -> None:
+        with self.lock:
+            self.counts[key] += 1
+
+    def start(self) -> bool:
+        """
+        Count a call; raises CircuitOpenError while the circuit is open.
+
+        Returns whether the call is the half-open trial.
+        """
+        state = self.breaker.allow()
+        if state is None:
+            self.count("skipped")
+            tracing.set_attributes(circuit=OPEN)
+            raise CircuitOpenError(self.name)
+        self.count("calls")
+        return state == HALF_OPEN
+
+    def succeed(self) -> None:
+        self.breaker.record_success()
+        self.count("successes")
+
+    def get_retry_delay(
+        self,
+        error: Exception,
+        retry: int
+    ) -> float | None:
+        """
+        Seconds before retrying a failed attempt (None to give up).
+        """
+        if is_timeout(error):
+            self.count("timeouts")
+        if not is_transient(error):
+            # The dependency responded (e.g. a bad request):
+            self.breaker.record_success()
+            self.count("errors")
+            return None
+        if retry < self.max_retries:
+            delay = get_retry_after(error)
+            if delay is None:
+                delay = get_backoff(retry)
+            elif delay <= RETRY_BACKOFF_MAX:
+                self.count("retry_after")
+            else:
+                delay = None
+            if delay is not None:
+                _logger.warning(f"{self.name} call failed ({type(error).__name__}: {error}), retrying in {delay:.2f}s")
+                self.count("retries")
+                tracing.increment("retries")
+                return delay
+        self.breaker.record_failure()
+        self.count("failures")
+        return None
+
+    def call(
+        self,
+        function: Callable,
+        *args: Any,
+        **kwargs: Any
+    ) -> Any:
+        """
+        Call an SDK function under the policy (per-call timeout options added).
+        """
+        if not RESILIENCE_ENABLED:
+            return function(*args, **kwargs)
+        trial = self.start()
+        try:
+            retry = 0
+            while True:
+                try:
+                    result = function(*args, **kwargs, **self.call_kwargs)
+                except Exception as e:
+                    delay = self.get_retry_delay(e, retry)
+                    if delay is None:
+                        if not is_transient(e):
+                            raise
+                        raise create_failure(self.name, retry + 1, e) from e
+                    retry += 1
+                    time.sleep(delay)
+                    continue
+                self.succeed()
+                return result
+        finally:
+            if trial:
+                self.breaker.release()
+
+    async def call_async(
+        self,
+        function: Callable[..., Awaitable],
+        *args: Any,
+        **kwargs: Any
+    ) -> Any:
+        """
+        Call an async SDK function under the policy (each attempt bounded by the timeout).
+        """
+        if not RESILIENCE_ENABLED:
+            return await function(*args, **kwargs)
+        trial = self.start()
+        try:
+            retry = 0
+            while True:
+                try:
+                    result = await asyncio.wait_for(function(*args, **kwargs, **self.call_kwargs), self.timeout)
+                except Exception as e:
+                    delay = self.get_retry_delay(e, retry)
+                    if delay is None:
+                        if not is_transient(e):
+                            raise
+                        raise create_failure(self.name, retry + 1, e) from e
+                    retry += 1
+                    await asyncio.sleep(delay)
+                    continue
+                self.succeed()
+                return result
+        finally:
+            if trial:
+                self.breaker.release()
+
+    def get_metrics(self) -> dict:
+        with self.lock:
+            counts = dict(self.counts)
+        return {
+            "timeout": self.timeout,
+            "max_retries": self.max_retries,
+            "circuit": self.breaker.get_state(),
+            "circuit_opened": self.breaker.opened,
+            "consecutive_failures": self.breaker.failures,
+            **counts
+        }
+
+
+def create_policy(
+    name: str
+) -> DependencyPolicy:
+    return DependencyPolicy(
+        name,
+        timeout=float(DEPENDENCY_TIMEOUTS.get(name, 0)),
+        max_retries=int(DEPENDENCY_RETRIES.get(name, RETRY_MAX_RETRIES)),
+        create_kwargs=create_openai_kwargs if name == "aoai" else create_azure_kwargs
+    )
+
+
+# One per dependency (shared by sync and async clients):
+policies = {name: create_policy(name) for name in DEPENDENCY_TIMEOUTS}
+
+
+def get_policy(
+    name: str
+) -> DependencyPolicy:
+    if name not in policies:
+        policies[name] = create_policy(name)
+    return policies[name]
+
+
+def get_metrics() -> dict:
+    return {
+        "enabled": RESILIENCE_ENABLED,
+        "dependencies": {name: policy.get_metrics() for name, policy in sorted(policies.items())}
+    }
+
+
+def format_prometheus() -> str:
+    """
+    Circuit states and call outcomes in the Prometheus text format.
+    """
+    dependencies = get_metrics()["dependencies"]
+    lines = [
+        "# HELP dependency_circuit_state Circuit state (0 closed, 1 half-open, 2 open).",
+        "# TYPE dependency_circuit_state gauge"
+    ]
+    for name, metrics in dependencies.items():
+        lines.append(f'dependency_circuit_state{{dependency="{name}"}} {CIRCUIT_STATES[metrics["circuit"]]}')
+    for key, help in (
+        ("calls", "Calls attempted."),
+        ("skipped", "Calls skipped while the circuit was open."),
+        ("retries", "Retried attempts."),
+        ("timeouts", "Timed-out attempts."),
+        ("failures", "Calls failed after retries."),
+        ("circuit_opened", "Times the circuit opened.")
+    ):
+        lines += [
+            f"# HELP dependency_{key}_total {help}",
+            f"# TYPE dependency_{key}_total counter"
+        ]
+        for name, metrics in dependencies.items():
+            lines.append(f'dependency_{key}_total{{dependency="{name}"}} {metrics[key]}')
+    return "\n".join(lines) + "\n"
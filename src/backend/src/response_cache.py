@@ -0,0 +1,261 @@
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT License.
+import os
+import time
+import logging
+import threading
+import numpy as np
+from collections import OrderedDict
+from typing import Any
+from cache import TTLCache, normalize_text
+
+"""
+Response cache for RAG (fallback) answers.
+
+Exact tier keyed by normalized query and language; optional semantic
+tier matching query embeddings above a cosine similarity threshold.
+Entries are dropped when the search index changes.
+"""
+
+RAG_CACHE_ENABLED = os.environ.get("RAG_CACHE_ENABLED", "false").lower() == "true"
+RAG_CACHE_SIZE = int(os.environ.get("RAG_CACHE_SIZE", "1024"))
+RAG_CACHE_TTL = float(os.environ.get("RAG_CACHE_TTL", "3600"))
+# Embedding deployment for the semantic tier (disabled if unset):
+RAG_CACHE_EMBEDDING_DEPLOYMENT = os.environ.get("RAG_CACHE_EMBEDDING_DEPLOYMENT")
+RAG_CACHE_SIMILARITY_THRESHOLD = float(os.environ.get("RAG_CACHE_SIMILARITY_THRESHOLD", "0.95"))
+# How often to check the search index for changes (0 to disable):
+RAG_CACHE_INDEX_CHECK_INTERVAL = float(os.environ.get("RAG_CACHE_INDEX_CHECK_INTERVAL", "300"))
+# Sortable index field stamped by ingestion (e.g. last_modified); its latest
+# value and the document count form the index version (count only if unset):
+RAG_CACHE_INDEX_VERSION_FIELD = os.environ.get("RAG_CACHE_INDEX_VERSION_FIELD", "")
+
+_logger = logging.getLogger(__name__)
+
+
+def normalize_embedding(
+    embedding: list[float]
+) -> np.ndarray:
+    """
+    Unit-length float32 vector, so cosine similarity is a dot product.
+    """
+    vector = np.asarray(embedding, dtype=np.float32)
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+class ResponseCache():
+    """
+    Two-tier (exact/semantic) TTL/LRU cache of RAG responses.
+    """
+
+    def __init__(
+        self,
+        maxsize: int = RAG_CACHE_SIZE,
+        ttl: float = RAG_CACHE_TTL,
+        similarity_threshold: float = RAG_CACHE_SIMILARITY_THRESHOLD,
+        index_check_interval: float = RAG_CACHE_INDEX_CHECK_INTERVAL,
+        index_version_field: str = RAG_CACHE_INDEX_VERSION_FIELD
+    ):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self.similarity_threshold = similarity_threshold
+        self.index_check_interval = index_check_interval
+        self.index_version_field = index_version_field
+        self.exact = TTLCache(maxsize=maxsize, ttl=ttl)
+
+        # Semantic tier: key -> (expires, language, embedding, response),
+        # scanned through a (keys, entries, expires, languages, matrix)
+        # snapshot rebuilt after changes:
+        self.semantic = OrderedDict()
+        self.snapshot = None
+        self.lock = threading.Lock()
+        self.semantic_hits = 0
+        self.invalidations = 0
+
+        self.index_version = None
+        self.index_checked = None
+
+    def create_key(
+        self,
+        query: str,
+        language: str
+    ) -> tuple:
+        return (normalize_text(query), language)
+
+    def get(
+        self,
+        query: str,
+        language: str
+    ) -> str | None:
+        """
+        Exact-match lookup.
+        """
+        return self.exact.get(self.create_key(query, language))
+
+    def get_snapshot(self) -> tuple | None:
+        """
+        Semantic tier as arrays (None if empty); caller holds the lock.
+        """
+        if self.snapshot is None and self.semantic:
+            keys = list(self.semantic)
+            entries = list(self.semantic.values())
+            self.snapshot = (
+                keys,
+                entries,
+                np.array([np.inf if e[0] is None else e[0] for e in entries]),
+                np.array([e[1] for e in entries], dtype=object),
+                np.stack([e[2] for e in entries])
+            )
+        return self.snapshot
+
+    def get_similar(
+        self,
+        language: str,
+        embedding: list[float]
+    ) -> str | None:
+        """
+        Semantic lookup: best response above similarity threshold.
+
+        The scan is one matrix product over a snapshot taken under the
+        lock, so concurrent lookups and stores do not wait on it.
+        """
+        with self.lock:
+            snapshot = self.get_snapshot()
+        if snapshot is None:
+            return None
+
+        keys, entries, expires, languages, matrix = snapshot
+        similarities = matrix @ normalize_embedding(embedding)
+        similarities[(expires <= time.monotonic()) | (languages != language)] = -np.inf
+        best = int(np.argmax(similarities))
+        if similarities[best] < self.similarity_threshold:
+            return None
+
+        with self.lock:
+            # Evicted or replaced since the snapshot was taken:
+            if self.semantic.get(keys[best]) is not entries[best]:
+                return None
+            self.semantic.move_to_end(keys[best])
+            self.semantic_hits += 1
+            return entries[best][3]
+
+    def set(
+        self,
+        query: str,
+        language: str,
+        response: str,
+        latency: float = None,
+        embedding: list[float] = None
+    ) -> None:
+        """
+        Cache response; latency is the cost of generating it.
+        """
+        key = self.create_key(query, language)
+        self.exact.set(key, response, latency=latency)
+        if embedding is None:
+            return
+
+        now = time.monotonic()
+        expires = now + self.ttl if self.ttl else None
+        embedding = normalize_embedding(embedding)
+        with self.lock:
+            for expired in [k for k, e in self.semantic.items() if e[0] is not None and e[0] <= now]:
+                self.semantic.pop(expired)
+            self.semantic[key] = (expires, language, embedding, response)
+            self.semantic.move_to_end(key)
+            while len(self.semantic) > self.maxsize:
+                self.semantic.popitem(last=False)
+            self.snapshot = None
+
+    def is_index_check_due(self) -> bool:
+        if not self.index_check_interval:
+            return False
+        return (
+            self.index_checked is None
+            or time.monotonic() - self.index_checked >= self.index_check_interval
+        )
+
+    def create_index_version_request(self) -> dict | None:
+        """
+        Search arguments for the latest version field value (None if unset).
+        """
+        if not self.index_version_field:
+            return None
+        return {
+            "search_text": "*",
+            "order_by": [f"{self.index_version_field} desc"],
+            "select": [self.index_version_field],
+            "top": 1
+        }
+
+    def create_index_version(
+        self,
+        document_count: int,
+        latest: list[dict] = None
+    ) -> Any:
+        """
+        Index version from the document count and the version request's results.
+
+        Updated documents leave the count unchanged but bump the version
+        field; deleted ones lower the count.
+        """
+        if not self.index_version_field:
+            return document_count
+        return (latest[0].get(self.index_version_field) if latest else None, document_count)
+
+    def update_index_version(
+        self,
+        version: Any
+    ) -> bool:
+        """
+        Record search index version; invalidate cache if it changed.
+
+        Returns whether the index changed.
+        """
+        self.index_checked = time.monotonic()
+        changed = self.index_version is not None and version != self.index_version
+        if changed:
+            _logger.info(f"Search index changed ({self.index_version} -> {version})")
+            self.invalidate()
+        self.index_version = version
+        return changed
+
+    def invalidate(self) -> None:
+        """
+        Drop all cached responses.
+        """
+        self.exact.clear()
+        with self.lock:
+            self.semantic.clear()
+            self.snapshot = None
+            self.invalidations += 1
+
+    def get_metrics(self) -> dict:
+        """
+        Get per-tier hits/misses and estimated latency saved.
+        """
+        exact_metrics = self.exact.get_metrics()
+        with self.lock:
+            semantic_hits = self.semantic_hits
+            semantic_size = len(self.semantic)
+            invalidations = self.invalidations
+
+        hits = exact_metrics["hits"] + semantic_hits
+        misses = exact_metrics["misses"] - semantic_hits
+        lookups = hits + misses
+        # Semantic hits count as exact misses but carry no latency:
+        miss_latency = exact_metrics["avg_miss_latency_ms"] * exact_metrics["misses"]
+        avg_miss_latency = miss_latency / misses if misses else 0.0
+        return {
+            "hits": hits,
+            "misses": misses,
+            "hit_ratio": hits / lookups if lookups else 0.0,
+            "exact_hits": exact_metrics["hits"],
+            "semantic_hits": semantic_hits,
+            "size": exact_metrics["size"],
+            "semantic_size": semantic_size,
+            "evictions": exact_metrics["evictions"],
+            "invalidations": invalidations,
+            "avg_miss_latency_ms": avg_miss_latency,
+            "latency_saved_ms": hits * avg_miss_latency
+        }
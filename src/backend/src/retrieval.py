@@ -0,0 +1,82 @@
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT License.
+import os
+import json
+import threading
+from cache import TTLCache, normalize_text
+from source_packing import RAG_SOURCE_TOKEN_BUDGET
+
+"""
+Retrieval settings, search-result cache and per-stage timing for RAG.
+"""
+
+# Default vector k-nearest-neighbors and number of results:
+RAG_SEARCH_K = int(os.environ.get("RAG_SEARCH_K", "50"))
+RAG_SEARCH_TOP = int(os.environ.get("RAG_SEARCH_TOP", "5"))
+# Per-deployment overrides, e.g. {"gpt-4o-mini": {"k": 20, "top": 3, "source_tokens": 1500}}:
+RAG_SEARCH_SETTINGS = json.loads(os.environ.get("RAG_SEARCH_SETTINGS", "{}"))
+# Search-result cache (size 0 to disable):
+RAG_SEARCH_CACHE_SIZE = int(os.environ.get("RAG_SEARCH_CACHE_SIZE", "256"))
+RAG_SEARCH_CACHE_TTL = float(os.environ.get("RAG_SEARCH_CACHE_TTL", "300"))
+
+
+def get_search_settings(
+    deployment: str
+) -> dict:
+    """
+    Get k (nearest neighbors), top (results) and source token budget
+    for deployment.
+    """
+    settings = RAG_SEARCH_SETTINGS.get(deployment, {})
+    return {
+        "k": int(settings.get("k", RAG_SEARCH_K)),
+        "top": int(settings.get("top", RAG_SEARCH_TOP)),
+        "source_tokens": int(settings.get("source_tokens", RAG_SOURCE_TOKEN_BUDGET))
+    }
+
+
+def create_search_cache() -> TTLCache | None:
+    """
+    Create search-result cache (None if disabled).
+    """
+    if RAG_SEARCH_CACHE_SIZE <= 0:
+        return None
+    return TTLCache(maxsize=RAG_SEARCH_CACHE_SIZE, ttl=RAG_SEARCH_CACHE_TTL)
+
+
+def create_search_key(
+    query: str,
+    k: int,
+    top: int
+) -> tuple:
+    return (normalize_text(query), k, top)
+
+
+class StageTimings():
+    """
+    Latency per pipeline stage (count, average and max).
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.stages = {}
+
+    def record(
+        self,
+        stage: str,
+        seconds: float
+    ) -> None:
+        with self.lock:
+            count, total, maximum = self.stages.get(stage, (0, 0.0, 0.0))
+            self.stages[stage] = (count + 1, total + seconds, max(maximum, seconds))
+
+    def get_metrics(self) -> dict:
+        with self.lock:
+            return {
+                stage: {
+                    "count": count,
+                    "avg_ms": total / count * 1000,
+                    "max_ms": maximum * 1000
+                }
+                for stage, (count, total, maximum) in self.stages.items()
+            }
@@ -2,13 +2,44 @@
 # Licensed under the MIT License.
 import os
 import logging
-from typing import Callable
+from typing import Awaitable, Callable
 from azure.ai.language.conversations import ConversationAnalysisClient
-from utils import get_azure_credential
+from azure.ai.language.conversations.aio import ConversationAnalysisClient as AsyncConversationAnalysisClient
+import tracing
+import resilience
+from client_registry import get_credential, get_credential_async, get_transport, get_transport_async
+from pii_redacter import PIIContext
 
 _logger = logging.getLogger(__name__)
 
 
+def create_input(
+    utterance: str,
+    language: str,
+    id: str,
+    project_name: str,
+    deployment_name: str
+) -> dict:
+    """
+    Create JSON input for CLU runtime.
+    """
+    return {
+        "kind": "Conversation",
+        "analysisInput": {
+            "conversationItem": {
+                "id": str(id),
+                "participantId": "0",
+                "language": language,
+                "text": utterance
+            }
+        },
+        "parameters": {
+            "projectName": project_name,
+            "deploymentName": deployment_name
+        }
+    }
+
+
 def create_clu_router() -> Callable[[str, str, str], dict]:
     """
     Create CLU runtime routing function.
@@ -16,37 +47,69 @@ def create_clu_router() -> Callable[[str, str, str], dict]:
     project_name = os.environ['CLU_PROJECT_NAME']
     deployment_name = os.environ['CLU_DEPLOYMENT_NAME']
     endpoint = os.environ['LANGUAGE_ENDPOINT']
-    credential = get_azure_credential()
-    client = ConversationAnalysisClient(endpoint, credential)
+    credential = get_credential()
+    client = ConversationAnalysisClient(endpoint, credential, transport=get_transport())
+    policy = resilience.get_policy("clu")
 
-    def create_input(
+    @tracing.traced("clu.call_runtime")
+    def call_runtime(
         utterance: str,
         language: str,
-        id: str
+        id: str,
+        pii_context: PIIContext = None
     ) -> dict:
         """
-        Create JSON input for CLU runtime.
+        Call CLU runtime.
         """
-        return {
-            "kind": "Conversation",
-            "analysisInput": {
-                "conversationItem": {
-                    "id": str(id),
-                    "participantId": "0",
-                    "language": language,
-                    "text": utterance
-                }
-            },
-            "parameters": {
-                "projectName": project_name,
-                "deploymentName": deployment_name
+        input_json = create_input(
+            utterance=utterance,
+            language=language,
+            id=id,
+            project_name=project_name,
+            deployment_name=deployment_name
+        )
+
+        try:
+            _logger.info(f"Calling {project_name}:{deployment_name} runtime")
+            tracing.set_attributes(project=project_name, deployment=deployment_name)
+
+            response = policy.call(
+                client.analyze_conversation,
+                task=input_json
+            )
+
+            _logger.debug("Runtime response: %s", response)
+            return tracing.set_result(parse_response(
+                response=response
+            ))
+
+        except Exception as e:
+            _logger.error(f"Runtime call failed: {e}")
+            tracing.set_error(e)
+            return {
+                "error": e
             }
-        }
 
-    def call_runtime(
+    return call_runtime
+
+
+def create_clu_router_async() -> Callable[[str, str, str], Awaitable[dict]]:
+    """
+    Create async CLU runtime routing function.
+    """
+    project_name = os.environ['CLU_PROJECT_NAME']
+    deployment_name = os.environ['CLU_DEPLOYMENT_NAME']
+    endpoint = os.environ['LANGUAGE_ENDPOINT']
+    credential = get_credential_async()
+    client = AsyncConversationAnalysisClient(endpoint, credential, transport=get_transport_async())
+    policy = resilience.get_policy("clu")
+
+    @tracing.traced("clu.call_runtime")
+    async def call_runtime(
         utterance: str,
         language: str,
-        id: str
+        id: str,
+        pii_context: PIIContext = None
     ) -> dict:
         """
         Call CLU runtime.
@@ -54,23 +117,28 @@ def create_clu_router() -> Callable[[str, str, str], dict]:
         input_json = create_input(
             utterance=utterance,
             language=language,
-            id=id
+            id=id,
+            project_name=project_name,
+            deployment_name=deployment_name
         )
 
         try:
             _logger.info(f"Calling {project_name}:{deployment_name} runtime")
+            tracing.set_attributes(project=project_name, deployment=deployment_name)
 
-            response = client.analyze_conversation(
+            response = await policy.call_async(
+                client.analyze_conversation,
                 task=input_json
             )
 
-            _logger.info(f"Runtime response: {response}")
-            return parse_response(
+            _logger.debug("Runtime response: %s", response)
+            return tracing.set_result(parse_response(
                 response=response
-            )
+            ))
 
         except Exception as e:
             _logger.error(f"Runtime call failed: {e}")
+            tracing.set_error(e)
             return {
                 "error": e
             }
@@ -2,9 +2,13 @@
 # Licensed under the MIT License.
 import os
 import logging
-from typing import Callable
+from typing import Awaitable, Callable
 from azure.ai.language.questionanswering import QuestionAnsweringClient
-from utils import get_azure_credential
+from azure.ai.language.questionanswering.aio import QuestionAnsweringClient as AsyncQuestionAnsweringClient
+import tracing
+import resilience
+from client_registry import get_credential, get_credential_async, get_transport, get_transport_async
+from pii_redacter import PIIContext
 
 _logger = logging.getLogger(__name__)
 
@@ -16,34 +20,88 @@ def create_cqa_router() -> Callable[[str, str, str], dict]:
     project_name = os.environ['CQA_PROJECT_NAME']
     deployment_name = os.environ['CQA_DEPLOYMENT_NAME']
     endpoint = os.environ['LANGUAGE_ENDPOINT']
-    credential = get_azure_credential()
-    client = QuestionAnsweringClient(endpoint, credential)
+    credential = get_credential()
+    client = QuestionAnsweringClient(endpoint, credential, transport=get_transport())
+    policy = resilience.get_policy("cqa")
 
+    @tracing.traced("cqa.call_runtime")
     def call_runtime(
         question: str,
         language: str,
-        id: str
+        id: str,
+        pii_context: PIIContext = None
     ) -> dict:
         """
         Call CQA runtime.
         """
         try:
             _logger.info(f"Calling {project_name}:{deployment_name} runtime")
+            tracing.set_attributes(project=project_name, deployment=deployment_name)
 
-            response = client.get_answers(
+            response = policy.call(
+                client.get_answers,
                 question=question,
                 top=1,
                 project_name=project_name,
                 deployment_name=deployment_name
             )
 
-            _logger.info(f"Runtime response: {response}")
-            return parse_response_sdk(
+            _logger.debug("Runtime response: %s", response)
+            return tracing.set_result(parse_response_sdk(
                 response=response
+            ))
+
+        except Exception as e:
+            _logger.error(f"Runtime call failed: {e}")
+            tracing.set_error(e)
+            return {
+                "error": e
+            }
+
+    return call_runtime
+
+
+def create_cqa_router_async() -> Callable[[str, str, str], Awaitable[dict]]:
+    """
+    Create async CQA runtime routing function.
+    """
+    project_name = os.environ['CQA_PROJECT_NAME']
+    deployment_name = os.environ['CQA_DEPLOYMENT_NAME']
+    endpoint = os.environ['LANGUAGE_ENDPOINT']
+    credential = get_credential_async()
+    client = AsyncQuestionAnsweringClient(endpoint, credential, transport=get_transport_async())
+    policy = resilience.get_policy("cqa")
+
+    @tracing.traced("cqa.call_runtime")
+    async def call_runtime(
+        question: str,
+        language: str,
+        id: str,
+        pii_context: PIIContext = None
+    ) -> dict:
+        """
+        Call CQA runtime.
+        """
+        try:
+            _logger.info(f"Calling {project_name}:{deployment_name} runtime")
+            tracing.set_attributes(project=project_name, deployment=deployment_name)
+
+            response = await policy.call_async(
+                client.get_answers,
+                question=question,
+                top=1,
+                project_name=project_name,
+                deployment_name=deployment_name
             )
 
+            _logger.debug("Runtime response: %s", response)
+            return tracing.set_result(parse_response_sdk(
+                response=response
+            ))
+
         except Exception as e:
             _logger.error(f"Runtime call failed: {e}")
+            tracing.set_error(e)
             return {
                 "error": e
             }
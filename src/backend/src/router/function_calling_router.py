@@ -3,7 +3,10 @@
 import os
 import json
 import logging
+import contextvars
 import pii_redacter
+from pii_redacter import PIIContext
+from concurrent.futures import ThreadPoolExecutor
 from typing import Callable
 from azure.core.rest import HttpRequest
 from azure.ai.language.conversations.authoring import ConversationAuthoringClient
@@ -11,35 +14,57 @@ from azure.ai.language.questionanswering.authoring import AuthoringClient
 from aoai_client import AOAIClient, get_prompt
 from router.clu_router import create_clu_router
 from router.cqa_router import create_cqa_router
-from utils import get_azure_credential
+from router.project_snapshot import PROJECT_SNAPSHOT_ENABLED, ProjectSnapshot
+import tracing
+import resilience
+from client_registry import get_credential, get_transport
 
 _logger = logging.getLogger(__name__)
 
 PII_ENABLED = os.environ.get("PII_ENABLED", "false").lower() == "true"
+# per_utterance (extract, then one completion per utterance) | merged (one completion per message):
+FUNCTION_CALLING_MODE = os.environ.get("FUNCTION_CALLING_MODE", "per_utterance").lower()
+MERGED_ROUTING_WORKERS = int(os.environ.get("MERGED_ROUTING_WORKERS", "8"))
 FUNCTION_CALLING_PROMPT = get_prompt("function_calling.txt")
+MERGED_ROUTING_PROMPT = get_prompt("extract_and_route.txt")
 
 
 def get_tools(
-    path: str = "tools/"
+    path: str = "tools/",
+    names: list[str] = None
 ) -> dict:
     """
-    Load AOAI function-calling tool specs.
+    Load AOAI function-calling tool specs (optionally only names).
     """
     tools = []
     for file in os.listdir(path):
         with open(path + file, 'r') as fp:
-            tools.append(json.load(fp))
+            tool = json.load(fp)
+        if names is None or tool["function"]["name"] in names:
+            tools.append(tool)
     return tools
 
 
-def get_clu_intents() -> list[str]:
+def create_clu_authoring_client() -> ConversationAuthoringClient:
+    endpoint = os.environ['LANGUAGE_ENDPOINT']
+    credential = get_credential()
+    return ConversationAuthoringClient(endpoint, credential, transport=get_transport())
+
+
+def create_cqa_authoring_client() -> AuthoringClient:
+    endpoint = os.environ['LANGUAGE_ENDPOINT']
+    credential = get_credential()
+    return AuthoringClient(endpoint, credential, transport=get_transport())
+
+
+def get_clu_intents(
+    client: ConversationAuthoringClient = None
+) -> list[str]:
     """
     Get all intents registered in CLU project.
     """
     project_name = os.environ['CLU_PROJECT_NAME']
-    endpoint = os.environ['LANGUAGE_ENDPOINT']
-    credential = get_azure_credential()
-    client = ConversationAuthoringClient(endpoint, credential)
+    client = client or create_clu_authoring_client()
 
     try:
         _logger.info(f"Getting intents from project {project_name}")
@@ -66,14 +91,14 @@ def get_clu_intents() -> list[str]:
         raise e
 
 
-def get_cqa_questions() -> list[str]:
+def get_cqa_questions(
+    client: AuthoringClient = None
+) -> list[str]:
     """
     Get all registered questions in CQA project.
     """
     project_name = os.environ['CQA_PROJECT_NAME']
-    endpoint = os.environ['LANGUAGE_ENDPOINT']
-    credential = get_azure_credential()
-    client = AuthoringClient(endpoint, credential)
+    client = client or create_cqa_authoring_client()
 
     try:
         _logger.info(f"Getting questions from project {project_name}")
@@ -99,6 +124,52 @@ def get_cqa_questions() -> list[str]:
         raise e
 
 
+def get_project_versions(
+    clu_client: ConversationAuthoringClient = None,
+    cqa_client: AuthoringClient = None
+) -> dict:
+    """
+    Get CLU and CQA project last modified times (cheap vs. an export).
+    """
+    clu_client = clu_client or create_clu_authoring_client()
+    cqa_client = cqa_client or create_cqa_authoring_client()
+    clu_project = clu_client.get_project(project_name=os.environ['CLU_PROJECT_NAME'])
+    cqa_project = cqa_client.get_project_details(project_name=os.environ['CQA_PROJECT_NAME'])
+    return {
+        "clu": clu_project.get("lastModifiedDateTime"),
+        "cqa": cqa_project.get("lastModifiedDateTime")
+    }
+
+
+def create_project_snapshot(
+    clu_client: ConversationAuthoringClient = None,
+    cqa_client: AuthoringClient = None,
+    **kwargs
+) -> ProjectSnapshot:
+    """
+    Create on-disk snapshot of the CLU intents and CQA questions.
+    """
+    clu_client = clu_client or create_clu_authoring_client()
+    cqa_client = cqa_client or create_cqa_authoring_client()
+
+    def fetch() -> dict:
+        return {
+            "intents": get_clu_intents(clu_client),
+            "questions": get_cqa_questions(cqa_client)
+        }
+
+    return ProjectSnapshot(
+        key=f"{os.environ['LANGUAGE_ENDPOINT']}|{os.environ['CLU_PROJECT_NAME']}|{os.environ['CQA_PROJECT_NAME']}",
+        fetch=fetch,
+        fetch_version=lambda: get_project_versions(clu_client, cqa_client),
+        **kwargs
+    )
+
+
+# Shared by the function-calling clients (see get_snapshot_metrics):
+project_snapshot = None
+
+
 def create_router_hook(
     router: Callable[[str, str, str], dict]
 ) -> Callable[[str, str, str], dict]:
@@ -110,58 +181,117 @@ def create_router_hook(
     def route(
         text: str,
         language: str,
-        id: str
+        id: str,
+        pii_context: PIIContext = None
     ) -> dict:
         if PII_ENABLED:
             # Reconstruct PII:
             text = pii_redacter.reconstruct(
                 text=text,
                 id=id,
-                cache=True
+                cache=True,
+                context=pii_context
             )
-        return router(text, language, id)
+        return router(text, language, id, pii_context=pii_context)
 
     return route
 
 
-def create_function_calling_router() -> Callable[[str, str, str], dict]:
-    """
-    Create function-calling router.
-    """
-    functions = {
-        "get_clu": create_router_hook(
-            router=create_clu_router()
-        ),
-        "get_cqa": create_router_hook(
-            router=create_cqa_router()
-        )
-    }
+def get_snapshot_metrics() -> dict | None:
+    return project_snapshot.get_metrics() if project_snapshot else None
 
-    clu_intents = get_clu_intents()
-    cqa_questions = get_cqa_questions()
 
-    prompt = FUNCTION_CALLING_PROMPT.format(
-        intents=", ".join(clu_intents),
-        questions="\n".join(cqa_questions)
+def create_function_calling_prompt(
+    prompt_template: str,
+    data: dict
+) -> str:
+    return prompt_template.format(
+        intents=", ".join(data["intents"]),
+        questions="\n".join(data["questions"])
     )
 
+
+def create_function_calling_client(
+    prompt_template: str,
+    tools: list,
+    functions: dict[str, Callable],
+    role: str = "function_calling"
+) -> AOAIClient:
+    """
+    Create function-calling AOAI client prompted with CLU intents and CQA questions.
+
+    role names the client's session history (with the deployment).
+
+    With PROJECT_SNAPSHOT_ENABLED, they come from the on-disk snapshot
+    (the prompt is updated when the snapshot is refreshed).
+    """
+    global project_snapshot
+    created = PROJECT_SNAPSHOT_ENABLED and project_snapshot is None
+    if created:
+        project_snapshot = create_project_snapshot()
+        project_snapshot.load()
+    if PROJECT_SNAPSHOT_ENABLED:
+        data = project_snapshot.snapshot["data"]
+    else:
+        data = {
+            "intents": get_clu_intents(),
+            "questions": get_cqa_questions()
+        }
+
     aoai_client = AOAIClient(
         endpoint=os.environ['AOAI_ENDPOINT'],
         deployment=os.environ['AOAI_DEPLOYMENT'],
-        system_message=prompt,
+        session_namespace=f"{role}:{os.environ['AOAI_DEPLOYMENT']}",
+        system_message=create_function_calling_prompt(prompt_template, data),
         function_calling=True,
-        tools=get_tools(),
+        tools=tools,
         functions=functions,
         return_functions=True
     )
 
+    if PROJECT_SNAPSHOT_ENABLED:
+        project_snapshot.add_listener(
+            lambda data: aoai_client.set_system_message(
+                create_function_calling_prompt(prompt_template, data)
+            )
+        )
+    if created:
+        project_snapshot.start_refresh()
+    return aoai_client
+
+
+def create_function_calling_router(
+    aoai_client: AOAIClient = None
+) -> Callable[[str, str, str], dict]:
+    """
+    Create function-calling router.
+    """
+    if aoai_client is None:
+        functions = {
+            "get_clu": create_router_hook(
+                router=create_clu_router()
+            ),
+            "get_cqa": create_router_hook(
+                router=create_cqa_router()
+            )
+        }
+        aoai_client = create_function_calling_client(
+            prompt_template=FUNCTION_CALLING_PROMPT,
+            tools=get_tools(names=list(functions)),
+            functions=functions
+        )
+
     def function_calling_router(
         message: str,
         language: str,
-        id: str
+        id: str,
+        pii_context: PIIContext = None
     ) -> dict:
         """
         Function-calling router function.
+
+        pii_context is the request's PII context (None if not enabled),
+        shared with the router hooks that reconstruct PII.
         """
         if PII_ENABLED:
             # Redact PII:
@@ -169,14 +299,24 @@ def create_function_calling_router() -> Callable[[str, str, str], dict]:
                 text=message,
                 id=id,
                 language=language,
-                cache=True
+                cache=True,
+                context=pii_context
             )
 
-        function_results = aoai_client.chat_completion(
-            message=message,
-            language=language,
-            id=id
-        )
+        try:
+            function_results = aoai_client.chat_completion(
+                message=message,
+                language=language,
+                id=id,
+                function_kwargs={"pii_context": pii_context}
+            )
+        except resilience.DependencyError as e:
+            # AOAI unavailable (circuit open, timeouts or retries exhausted), straight to the fallback:
+            _logger.error(f"Function-calling completion failed: {e}")
+            tracing.set_error(e)
+            return {
+                "error": e
+            }
 
         # There should only be one function-call:
         if len(function_results) != 1:
@@ -188,3 +328,111 @@ def create_function_calling_router() -> Callable[[str, str, str], dict]:
         return parsed_response
 
     return function_calling_router
+
+
+def create_tool_call_recorder(
+    name: str
+) -> Callable[[str, str, str], dict]:
+    """
+    Record a tool call's utterance (routed after the completion).
+    """
+    def record(
+        utterance: str,
+        language: str,
+        id: str,
+        pii_context: PIIContext = None
+    ) -> dict:
+        return {
+            "tool": name,
+            "utterance": utterance
+        }
+
+    return record
+
+
+def create_merged_function_calling_router(
+    aoai_client: AOAIClient = None,
+    clu_router: Callable[[str, str, str], dict] = None,
+    cqa_router: Callable[[str, str, str], dict] = None
+) -> Callable[[str, str, str], list[dict] | None]:
+    """
+    Create merged extraction + function-calling router.
+
+    One completion splits the message into utterances and emits a
+    get_clu/get_cqa/get_fallback tool call per utterance; the CLU/CQA
+    runtime calls then run concurrently. Returns a routing result per
+    utterance (with its "utterance"), or None if no tool was called
+    (e.g. harmful content).
+    """
+    routers = {
+        "get_clu": create_router_hook(
+            router=clu_router or create_clu_router()
+        ),
+        "get_cqa": create_router_hook(
+            router=cqa_router or create_cqa_router()
+        )
+    }
+    if aoai_client is None:
+        tool_names = ["get_clu", "get_cqa", "get_fallback"]
+        aoai_client = create_function_calling_client(
+            prompt_template=MERGED_ROUTING_PROMPT,
+            tools=get_tools(names=tool_names),
+            functions={name: create_tool_call_recorder(name) for name in tool_names},
+            role="merged_routing"
+        )
+    executor = ThreadPoolExecutor(
+        max_workers=MERGED_ROUTING_WORKERS,
+        thread_name_prefix="merged-routing"
+    )
+
+    def route_tool_call(
+        tool_call: dict,
+        language: str,
+        id: str,
+        pii_context: PIIContext = None
+    ) -> dict:
+        router = routers.get(tool_call["tool"])
+        if router is None:
+            routing_result = {"error": "Fallback requested"}
+        else:
+            routing_result = router(tool_call["utterance"], language, id, pii_context=pii_context)
+        return {"utterance": tool_call["utterance"], **routing_result}
+
+    def merged_router(
+        message: str,
+        language: str,
+        id: str,
+        pii_context: PIIContext = None
+    ) -> list[dict] | None:
+        """
+        Merged function-calling router function.
+
+        message is already redacted (server.extract_utterances routes the
+        whole message before PII is reconstructed per utterance);
+        pii_context is used to reconstruct it for the CLU/CQA calls.
+        """
+        try:
+            tool_calls = aoai_client.chat_completion(
+                message=message,
+                language=language,
+                id=id
+            )
+        except resilience.DependencyError as e:
+            # AOAI unavailable, the whole message goes to the fallback:
+            _logger.error(f"Merged routing completion failed: {e}")
+            tracing.set_error(e)
+            return [{"utterance": message, "error": e}]
+        # Unknown functions come back as error strings:
+        tool_calls = [tool_call for tool_call in tool_calls if isinstance(tool_call, dict)]
+        tracing.set_attributes(tool_calls=len(tool_calls))
+        if not tool_calls:
+            return None
+
+        # Route utterances concurrently (each with the caller's context, e.g. tracing span):
+        futures = [
+            executor.submit(contextvars.copy_context().run, route_tool_call, tool_call, language, id, pii_context)
+            for tool_call in tool_calls
+        ]
+        return [future.result() for future in futures]
+
+    return merged_router
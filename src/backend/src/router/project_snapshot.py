@@ -0,0 +1,315 @@
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT License.
+import os
+import json
+import time
+import logging
+import tempfile
+import threading
+import contextlib
+from typing import Any, Callable
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+"""
+On-disk snapshot of project data exported at startup.
+
+The function-calling router prompts with the CLU intents and CQA
+questions, which take a full long-running project export to fetch.
+The snapshot stores them with the projects' versions (last modified
+times); workers start from the snapshot immediately and check the
+versions in the background, re-exporting only when a project changed
+(or the snapshot is older than PROJECT_SNAPSHOT_MAX_AGE). Exports hold
+an exclusive lock on the snapshot's lock file, so of workers starting
+or refreshing together only one exports and the others read its result.
+"""
+
+PROJECT_SNAPSHOT_ENABLED = os.environ.get("PROJECT_SNAPSHOT_ENABLED", "true").lower() == "true"
+PROJECT_SNAPSHOT_PATH = os.environ.get(
+    "PROJECT_SNAPSHOT_PATH",
+    os.path.join(tempfile.gettempdir(), "function_calling_snapshot.json")
+)
+# Seconds between background version checks (0 to check at startup only):
+PROJECT_SNAPSHOT_REFRESH_INTERVAL = float(os.environ.get("PROJECT_SNAPSHOT_REFRESH_INTERVAL", "600"))
+# Re-export after this many seconds even if versions are unchanged (0 for never):
+PROJECT_SNAPSHOT_MAX_AGE = float(os.environ.get("PROJECT_SNAPSHOT_MAX_AGE", "86400"))
+
+SNAPSHOT_FORMAT = 1
+
+_logger = logging.getLogger(__name__)
+
+
+def read_snapshot(
+    path: str,
+    key: str
+) -> dict | None:
+    """
+    Read snapshot for key (None if missing, unreadable or for another key).
+    """
+    try:
+        with open(path, "r") as fp:
+            snapshot = json.load(fp)
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError) as e:
+        _logger.warning(f"Ignoring unreadable snapshot {path}: {e}")
+        return None
+
+    if snapshot.get("format") != SNAPSHOT_FORMAT or snapshot.get("key") != key:
+        return None
+    return snapshot
+
+
+def write_snapshot(
+    path: str,
+    snapshot: dict
+) -> None:
+    """
+    Write snapshot atomically (concurrent workers never read a partial file).
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, temp_path = tempfile.mkstemp(dir=directory, prefix=".snapshot-")
+    try:
+        with os.fdopen(fd, "w") as fp:
+            json.dump(snapshot, fp)
+        os.replace(temp_path, path)
+    except BaseException:
+        os.unlink(temp_path)
+        raise
+
+
+@contextlib.contextmanager
+def lock_snapshot(
+    path: str
+):
+    """
+    Hold an exclusive lock on path + ".lock" (shared by all workers).
+
+    Without fcntl (Windows) or a writable directory, workers are not
+    serialized and may export concurrently.
+    """
+    if fcntl is None:
+        yield
+        return
+    try:
+        fp = open(path + ".lock", "a")
+    except OSError as e:
+        _logger.warning(f"Unable to lock snapshot {path}: {e}")
+        yield
+        return
+    with fp:
+        fcntl.flock(fp, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(fp, fcntl.LOCK_UN)
+
+
+class SnapshotMetrics():
+    """
+    Startup source and load time, version checks and refreshes.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.source = None
+        self.load_time = 0.0
+        self.checks = 0
+        self.check_failures = 0
+        self.refreshes = 0
+        self.refresh_time = 0.0
+
+    def record_load(
+        self,
+        source: str,
+        load_time: float
+    ) -> None:
+        with self.lock:
+            self.source = source
+            self.load_time = load_time
+
+    def record_check(
+        self,
+        failed: bool
+    ) -> None:
+        with self.lock:
+            self.checks += 1
+            self.check_failures += int(failed)
+
+    def record_refresh(
+        self,
+        refresh_time: float
+    ) -> None:
+        with self.lock:
+            self.refreshes += 1
+            self.refresh_time += refresh_time
+
+    def get_metrics(self) -> dict:
+        with self.lock:
+            return {
+                "source": self.source,
+                "load_ms": self.load_time * 1000,
+                "checks": self.checks,
+                "check_failures": self.check_failures,
+                "refreshes": self.refreshes,
+                "avg_refresh_ms": self.refresh_time / self.refreshes * 1000 if self.refreshes else 0.0
+            }
+
+
+class ProjectSnapshot():
+    """
+    Project data loaded from an on-disk snapshot, refreshed in the background.
+
+    fetch returns the (JSON-serializable) data; fetch_version returns
+    the projects' current version, cheap compared to fetch. key
+    identifies the projects, so a snapshot of other projects is ignored.
+    """
+
+    def __init__(
+        self,
+        key: str,
+        fetch: Callable[[], Any],
+        fetch_version: Callable[[], Any],
+        path: str = PROJECT_SNAPSHOT_PATH,
+        refresh_interval: float = PROJECT_SNAPSHOT_REFRESH_INTERVAL,
+        max_age: float = PROJECT_SNAPSHOT_MAX_AGE
+    ):
+        self.key = key
+        self.fetch = fetch
+        self.fetch_version = fetch_version
+        self.path = path
+        self.refresh_interval = refresh_interval
+        self.max_age = max_age
+        self.snapshot = None
+        self.source = None
+        self.listeners = []
+        self.lock = threading.Lock()
+        self.metrics = SnapshotMetrics()
+
+    def export(
+        self,
+        version: Any = None
+    ) -> dict:
+        """
+        Fetch data into a new snapshot and write it (best effort).
+        """
+        if version is None:
+            version = self.fetch_version()
+        snapshot = {
+            "format": SNAPSHOT_FORMAT,
+            "key": self.key,
+            "version": version,
+            "created": time.time(),
+            "data": self.fetch()
+        }
+        try:
+            write_snapshot(self.path, snapshot)
+        except OSError as e:
+            _logger.warning(f"Unable to write snapshot {self.path}: {e}")
+        return snapshot
+
+    def load(self) -> Any:
+        """
+        Get data from the snapshot, else fetch it (and write the snapshot).
+        """
+        start = time.perf_counter()
+        snapshot = read_snapshot(self.path, self.key)
+        if snapshot is None:
+            with lock_snapshot(self.path):
+                # Another worker may have exported while we waited:
+                snapshot = read_snapshot(self.path, self.key)
+                if snapshot is None:
+                    self.snapshot = self.export()
+                    self.source = "export"
+        if snapshot is not None:
+            _logger.info(f"Loaded snapshot {self.path} (version {snapshot['version']})")
+            self.snapshot = snapshot
+            self.source = "snapshot"
+        self.metrics.record_load(self.source, time.perf_counter() - start)
+        return self.snapshot["data"]
+
+    def is_stale(
+        self,
+        snapshot: dict,
+        version: Any
+    ) -> bool:
+        if version != snapshot["version"]:
+            return True
+        return bool(self.max_age) and time.time() - snapshot["created"] > self.max_age
+
+    def refresh(self) -> bool:
+        """
+        Check versions and re-export if stale. Returns True if refreshed.
+        """
+        with self.lock:
+            try:
+                version = self.fetch_version()
+            except Exception as e:
+                _logger.warning(f"Snapshot version check failed: {e}")
+                self.metrics.record_check(failed=True)
+                return False
+            self.metrics.record_check(failed=False)
+
+            start = time.perf_counter()
+            with lock_snapshot(self.path):
+                # Another worker may have exported already:
+                snapshot = read_snapshot(self.path, self.key)
+                if snapshot is not None and not self.is_stale(snapshot, version):
+                    refreshed = snapshot["created"] != self.snapshot["created"]
+                    self.snapshot = snapshot
+                elif self.is_stale(self.snapshot, version):
+                    try:
+                        self.snapshot = self.export(version)
+                    except Exception as e:
+                        _logger.warning(f"Snapshot refresh failed: {e}")
+                        return False
+                    refreshed = True
+                else:
+                    refreshed = False
+
+            if refreshed:
+                # Includes waiting for another worker's export:
+                self.metrics.record_refresh(time.perf_counter() - start)
+                _logger.info(f"Refreshed snapshot (version {version})")
+                for listener in self.listeners:
+                    listener(self.snapshot["data"])
+            return refreshed
+
+    def start_refresh(self) -> None:
+        """
+        Start background refresh thread, after load and adding listeners.
+
+        A snapshot loaded from disk is checked right away, then (like
+        a fresh export) every refresh interval.
+        """
+        check_now = self.source == "snapshot"
+        if not check_now and not self.refresh_interval:
+            return
+
+        def run() -> None:
+            if check_now:
+                self.refresh()
+            while self.refresh_interval:
+                time.sleep(self.refresh_interval)
+                self.refresh()
+
+        threading.Thread(target=run, name="project-snapshot", daemon=True).start()
+
+    def add_listener(
+        self,
+        listener: Callable[[Any], None]
+    ) -> None:
+        """
+        Call listener with the new data after each background refresh.
+        """
+        self.listeners.append(listener)
+
+    def get_metrics(self) -> dict:
+        return {
+            "version": self.snapshot["version"] if self.snapshot else None,
+            "age_s": time.time() - self.snapshot["created"] if self.snapshot else None,
+            **self.metrics.get_metrics()
+        }
@@ -0,0 +1,304 @@
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT License.
+import os
+import time
+import logging
+import threading
+from typing import Any, Awaitable, Callable
+from cache import TTLCache, normalize_text
+from router.router_type import RouterType
+from pii_redacter import PIIContext
+
+"""
+Router result cache.
+
+Caches CLU/CQA/orchestration runtime results keyed by project,
+deployment, language and normalized text. Entries expire after a TTL
+and are dropped when the deployment is redeployed or on explicit
+invalidation. The deployment version is fetched through the authoring
+API by a background thread every ROUTER_CACHE_DEPLOYMENT_CHECK_INTERVAL
+seconds; requests only compare it with the version the cache was filled
+under.
+"""
+
+ROUTER_CACHE_ENABLED = os.environ.get("ROUTER_CACHE_ENABLED", "false").lower() == "true"
+ROUTER_CACHE_SIZE = int(os.environ.get("ROUTER_CACHE_SIZE", "4096"))
+ROUTER_CACHE_TTL = float(os.environ.get("ROUTER_CACHE_TTL", "600"))
+# How often to check the deployment for redeploys (0 to disable):
+ROUTER_CACHE_DEPLOYMENT_CHECK_INTERVAL = float(os.environ.get("ROUTER_CACHE_DEPLOYMENT_CHECK_INTERVAL", "300"))
+
+# Router type -> project/deployment environment variables:
+ROUTER_DEPLOYMENTS = {
+    RouterType.CLU: ("CLU_PROJECT_NAME", "CLU_DEPLOYMENT_NAME"),
+    RouterType.CQA: ("CQA_PROJECT_NAME", "CQA_DEPLOYMENT_NAME"),
+    RouterType.ORCHESTRATION: ("ORCHESTRATION_PROJECT_NAME", "ORCHESTRATION_DEPLOYMENT_NAME")
+}
+
+_logger = logging.getLogger(__name__)
+
+
+def create_deployment_version_getter(
+    router_type: RouterType,
+    project_name: str,
+    deployment_name: str
+) -> Callable[[], Any]:
+    """
+    Create function returning the deployment's last deployed time.
+    """
+    from client_registry import get_credential, get_transport
+    endpoint = os.environ['LANGUAGE_ENDPOINT']
+
+    if router_type == RouterType.CQA:
+        from azure.ai.language.questionanswering.authoring import AuthoringClient
+        client = AuthoringClient(endpoint, get_credential(), transport=get_transport())
+
+        def get_version() -> Any:
+            for deployment in client.list_deployments(project_name=project_name):
+                if deployment["deploymentName"] == deployment_name:
+                    return deployment.get("lastDeployedDateTime")
+            return None
+
+        return get_version
+
+    from azure.ai.language.conversations.authoring import ConversationAuthoringClient
+    client = ConversationAuthoringClient(endpoint, get_credential(), transport=get_transport())
+
+    def get_version() -> Any:
+        deployment = client.get_deployment(
+            project_name=project_name,
+            deployment_name=deployment_name
+        )
+        return deployment.get("lastDeployedDateTime")
+
+    return get_version
+
+
+def is_cacheable(
+    result: dict | None
+) -> bool:
+    """
+    Cache routed and below-threshold results, not runtime failures.
+    """
+    return result is not None and not isinstance(result.get("error"), Exception)
+
+
+class RouterCache():
+    """
+    TTL/LRU cache of router results for one project deployment.
+    """
+
+    def __init__(
+        self,
+        router_type: RouterType,
+        project_name: str,
+        deployment_name: str,
+        maxsize: int = ROUTER_CACHE_SIZE,
+        ttl: float = ROUTER_CACHE_TTL,
+        deployment_check_interval: float = ROUTER_CACHE_DEPLOYMENT_CHECK_INTERVAL,
+        get_deployment_version: Callable[[], Any] = None
+    ):
+        self.router_type = router_type
+        self.project_name = project_name
+        self.deployment_name = deployment_name
+        self.results = TTLCache(maxsize=maxsize, ttl=ttl)
+        self.deployment_check_interval = deployment_check_interval
+        self.get_deployment_version = get_deployment_version
+
+        self.lock = threading.Lock()
+        self.deployment_version = None
+        # Last version fetched in the background:
+        self.latest_version = None
+        self.deployment_checked = None
+        self.invalidations = 0
+
+    def create_key(
+        self,
+        text: str,
+        language: str
+    ) -> tuple:
+        return (self.project_name, self.deployment_name, language, normalize_text(text))
+
+    def get(
+        self,
+        text: str,
+        language: str
+    ) -> dict | None:
+        """
+        Get cached result (a copy; callers may mutate it).
+        """
+        result = self.results.get(self.create_key(text, language))
+        return dict(result) if result is not None else None
+
+    def set(
+        self,
+        text: str,
+        language: str,
+        result: dict,
+        latency: float = None
+    ) -> None:
+        """
+        Cache result; latency is the cost of the runtime call.
+        """
+        if is_cacheable(result):
+            self.results.set(self.create_key(text, language), dict(result), latency=latency)
+
+    def start_refresh(self) -> None:
+        """
+        Start background deployment version checks (the first one right away).
+        """
+        if not self.deployment_check_interval or self.get_deployment_version is None:
+            return
+
+        def run() -> None:
+            while True:
+                self.refresh_deployment_version()
+                time.sleep(self.deployment_check_interval)
+
+        threading.Thread(target=run, name="router-cache-deployment", daemon=True).start()
+
+    def refresh_deployment_version(self) -> None:
+        """
+        Fetch the deployment version through the authoring API.
+        """
+        try:
+            version = self.get_deployment_version()
+        except Exception as e:
+            _logger.warning(f"Deployment check failed: {e}")
+            return
+        with self.lock:
+            self.latest_version = version
+            self.deployment_checked = time.monotonic()
+
+    def check_deployment(self) -> None:
+        """
+        Invalidate cache if the last fetched version differs (no remote call).
+        """
+        with self.lock:
+            version = self.latest_version
+            if version is None or version == self.deployment_version:
+                return
+        self.update_deployment_version(version)
+
+    def update_deployment_version(
+        self,
+        version: Any
+    ) -> bool:
+        """
+        Record deployment version; invalidate cache if it changed.
+
+        Returns whether the deployment changed.
+        """
+        with self.lock:
+            changed = self.deployment_version is not None and version != self.deployment_version
+            self.deployment_version = version
+        if changed:
+            _logger.info(f"{self.project_name}:{self.deployment_name} redeployed, invalidating router cache")
+            self.invalidate()
+        return changed
+
+    def invalidate(self) -> None:
+        """
+        Drop all cached results.
+        """
+        self.results.clear()
+        with self.lock:
+            self.invalidations += 1
+
+    def get_metrics(self) -> dict:
+        with self.lock:
+            invalidations = self.invalidations
+            deployment_version = self.deployment_version
+            checked = self.deployment_checked
+        return {
+            **self.results.get_metrics(),
+            "project": self.project_name,
+            "deployment": self.deployment_name,
+            "deployment_version": deployment_version,
+            "deployment_checked_s_ago": time.monotonic() - checked if checked is not None else None,
+            "invalidations": invalidations
+        }
+
+
+def create_router_cache(
+    router_type: RouterType
+) -> RouterCache | None:
+    """
+    Create router cache (None if disabled or router type has no deployment).
+    """
+    if not ROUTER_CACHE_ENABLED or router_type not in ROUTER_DEPLOYMENTS:
+        return None
+
+    project_variable, deployment_variable = ROUTER_DEPLOYMENTS[router_type]
+    project_name = os.environ[project_variable]
+    deployment_name = os.environ[deployment_variable]
+
+    get_deployment_version = None
+    if ROUTER_CACHE_DEPLOYMENT_CHECK_INTERVAL:
+        get_deployment_version = create_deployment_version_getter(
+            router_type=router_type,
+            project_name=project_name,
+            deployment_name=deployment_name
+        )
+
+    cache = RouterCache(
+        router_type=router_type,
+        project_name=project_name,
+        deployment_name=deployment_name,
+        get_deployment_version=get_deployment_version
+    )
+    cache.start_refresh()
+    return cache
+
+
+def create_cached_router(
+    router: Callable[[str, str, str], dict],
+    cache: RouterCache
+) -> Callable[[str, str, str], dict]:
+    """
+    Wrap sync router with result cache.
+    """
+    def route(
+        message: str,
+        language: str,
+        id: str,
+        pii_context: PIIContext = None
+    ) -> dict:
+        cache.check_deployment()
+
+        result = cache.get(message, language)
+        if result is not None:
+            return result
+
+        start = time.perf_counter()
+        result = router(message, language, id, pii_context=pii_context)
+        cache.set(message, language, result, latency=time.perf_counter() - start)
+        return result
+
+    return route
+
+
+def create_cached_router_async(
+    router: Callable[[str, str, str], Awaitable[dict]],
+    cache: RouterCache
+) -> Callable[[str, str, str], Awaitable[dict]]:
+    """
+    Wrap async router with result cache.
+    """
+    async def route(
+        message: str,
+        language: str,
+        id: str,
+        pii_context: PIIContext = None
+    ) -> dict:
+        cache.check_deployment()
+
+        result = cache.get(message, language)
+        if result is not None:
+            return result
+
+        start = time.perf_counter()
+        result = await router(message, language, id, pii_context=pii_context)
+        cache.set(message, language, result, latency=time.perf_counter() - start)
+        return result
+
+    return route
@@ -1,30 +1,103 @@
 # Copyright (c) Microsoft Corporation.
 # Licensed under the MIT License.
-from typing import Callable
+import asyncio
+from typing import Awaitable, Callable
+from pii_redacter import PIIContext
 from router.router_type import RouterType
-from router.clu_router import create_clu_router
-from router.cqa_router import create_cqa_router
-from router.function_calling_router import create_function_calling_router
-from router.orchestration_router import create_orchestration_router
-from router.triage_agent_router import create_triage_agent_router
+from router.router_cache import RouterCache, create_cached_router, create_cached_router_async
+from router.clu_router import create_clu_router, create_clu_router_async
+from router.cqa_router import create_cqa_router, create_cqa_router_async
+from router.function_calling_router import create_function_calling_router, create_merged_function_calling_router
+from router.orchestration_router import create_orchestration_router, create_orchestration_router_async
+from router.triage_agent_router import create_triage_agent_router, create_triage_agent_router_async
 
 
 def create_router(
-    router_type: RouterType
+    router_type: RouterType,
+    cache: RouterCache = None
 ) -> Callable[[str, str, str], dict]:
     """
     Create router based on settings.
+
+    CLU/CQA/orchestration results are cached when cache is given.
     """
     if router_type == RouterType.BYPASS:
-        return lambda x, y, z: None
+        return lambda x, y, z, pii_context=None: None
     if router_type == RouterType.CLU:
-        return create_clu_router()
+        router = create_clu_router()
     elif router_type == RouterType.CQA:
-        return create_cqa_router()
+        router = create_cqa_router()
     elif router_type == RouterType.ORCHESTRATION:
-        return create_orchestration_router()
+        router = create_orchestration_router()
     elif router_type == RouterType.FUNCTION_CALLING:
         return create_function_calling_router()
     elif router_type == RouterType.TRIAGE_AGENT:
         return create_triage_agent_router()
-    raise ValueError("Unsupported router type")
+    else:
+        raise ValueError("Unsupported router type")
+
+    if cache is not None:
+        router = create_cached_router(router, cache)
+    return router
+
+
+def create_threaded_router(
+    router: Callable[[str, str, str], dict]
+) -> Callable[[str, str, str], Awaitable[dict]]:
+    """
+    Wrap sync router to run in a worker thread.
+    """
+    async def route(
+        message: str,
+        language: str,
+        id: str,
+        pii_context: PIIContext = None
+    ) -> dict:
+        return await asyncio.to_thread(router, message, language, id, pii_context=pii_context)
+
+    return route
+
+
+def create_async_router(
+    router_type: RouterType,
+    cache: RouterCache = None
+) -> Callable[[str, str, str], Awaitable[dict]]:
+    """
+    Create async router based on settings.
+
+    CLU/CQA/orchestration results are cached when cache is given.
+    """
+    if router_type == RouterType.BYPASS:
+        async def bypass(x, y, z, pii_context=None):
+            return None
+        return bypass
+    if router_type == RouterType.CLU:
+        router = create_clu_router_async()
+    elif router_type == RouterType.CQA:
+        router = create_cqa_router_async()
+    elif router_type == RouterType.ORCHESTRATION:
+        router = create_orchestration_router_async()
+    elif router_type == RouterType.FUNCTION_CALLING:
+        return create_threaded_router(
+            router=create_function_calling_router()
+        )
+    elif router_type == RouterType.TRIAGE_AGENT:
+        return create_triage_agent_router_async()
+    else:
+        raise ValueError("Unsupported router type")
+
+    if cache is not None:
+        router = create_cached_router_async(router, cache)
+    return router
+
+
+def create_merged_router(
+    use_async: bool = False
+) -> Callable[[str, str, str], list[dict] | None | Awaitable[list[dict] | None]]:
+    """
+    Create merged extraction + function-calling router (per message).
+    """
+    router = create_merged_function_calling_router()
+    if use_async:
+        return create_threaded_router(router)
+    return router
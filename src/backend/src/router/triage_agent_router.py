@@ -1,85 +1,448 @@
 # Copyright (c) Microsoft Corporation.
 # Licensed under the MIT License.
 import os
-import json
+import re
+import time
+import asyncio
 import logging
+import threading
 import pii_redacter
-from typing import Callable
-from azure.ai.agents import AgentsClient
-from azure.ai.agents.models import ListSortOrder
-from utils import get_azure_credential
+from pii_redacter import PIIContext
+from collections import Counter, OrderedDict
+from typing import Any, Awaitable, Callable
+from azure.ai.agents.aio import AgentsClient
+from azure.ai.agents.models import AgentThreadCreationOptions, ListSortOrder, MessageRole, RunStatus, ThreadMessageOptions
+from intent_classifier import extract_order_ids
+from client_registry import get_credential_async, get_transport_async
+from utils import run_coroutine
+import tracing
 
-_logger = logging.getLogger(__name__)
+"""
+Triage agent router.
+
+Each conversation keeps one agent thread (from a bounded pool, evicted
+when idle), so an utterance is a single run: the user message is posted
+with the run request (the first one also creates the thread). Runs are
+polled asynchronously with a growing interval, and the agent's reply
+("Detected Intent: <intent>" or the CQA answer) is parsed into a CLU/CQA
+routing result. The sync router runs on the background event loop.
+"""
 
 PII_ENABLED = os.environ.get("PII_ENABLED", "false").lower() == "true"
+TRIAGE_AGENT_MAX_THREADS = int(os.environ.get("TRIAGE_AGENT_MAX_THREADS", "1000"))
+# Seconds before an idle conversation's thread is evicted (and deleted):
+TRIAGE_AGENT_THREAD_IDLE_TIMEOUT = float(os.environ.get("TRIAGE_AGENT_THREAD_IDLE_TIMEOUT", "900"))
+# Run polling: first interval, growth factor and maximum interval (seconds):
+TRIAGE_AGENT_POLL_INTERVAL = float(os.environ.get("TRIAGE_AGENT_POLL_INTERVAL", "0.1"))
+TRIAGE_AGENT_POLL_BACKOFF = float(os.environ.get("TRIAGE_AGENT_POLL_BACKOFF", "1.5"))
+TRIAGE_AGENT_MAX_POLL_INTERVAL = float(os.environ.get("TRIAGE_AGENT_MAX_POLL_INTERVAL", "1.0"))
+# Seconds before an unfinished run is cancelled:
+TRIAGE_AGENT_RUN_TIMEOUT = float(os.environ.get("TRIAGE_AGENT_RUN_TIMEOUT", "30"))
+
+DETECTED_INTENT_PATTERN = re.compile(r"Detected Intent:\W*(\w+)", re.IGNORECASE)
+TERMINAL_STATUSES = (RunStatus.COMPLETED, RunStatus.FAILED, RunStatus.CANCELLED, RunStatus.EXPIRED)
+
+_logger = logging.getLogger(__name__)
+
+
+def parse_response(
+    response: str | None,
+    utterance: str
+) -> dict:
+    """
+    Parse agent reply into a CLU or CQA routing result.
+
+    CLU replies only carry the intent; OrderId entities are extracted
+    from the (unredacted) utterance.
+    """
+    if not response:
+        return {
+            "error": "No agent response"
+        }
+
+    match = DETECTED_INTENT_PATTERN.search(response)
+    if match is None:
+        return {
+            "kind": "cqa_result",
+            "error": None,
+            "answer": response,
+            "question": None,
+            "confidence": None,
+            "api_response": response
+        }
+
+    intent = match.group(1)
+    error = None
+    if intent == "None":
+        _logger.warning("No intent recognized")
+        error = "No intent recognized"
+
+    return {
+        "kind": "clu_result",
+        "error": error,
+        "intent": intent,
+        "entities": extract_order_ids(utterance),
+        "confidence": None,
+        "api_response": response
+    }
+
+
+class AgentThread():
+    """
+    A conversation's agent thread (one run at a time).
+    """
+
+    def __init__(self):
+        self.thread_id = None
+        self.lock = asyncio.Lock()
+        self.last_used = time.monotonic()
+
+
+class TriageAgentMetrics():
+    """
+    Thread reuse/evictions, runs, polls and run latency.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.threads = 0
+        self.created_threads = 0
+        self.reused_threads = 0
+        self.evictions = 0
+        self.runs = 0
+        self.polls = 0
+        self.run_time = 0.0
+        self.statuses = Counter()
+        self.routes = Counter()
 
+    def record_thread(
+        self,
+        created: bool,
+        threads: int
+    ) -> None:
+        with self.lock:
+            self.threads = threads
+            if created:
+                self.created_threads += 1
+            else:
+                self.reused_threads += 1
 
+    def record_evictions(
+        self,
+        evictions: int,
+        threads: int
+    ) -> None:
+        with self.lock:
+            self.threads = threads
+            self.evictions += evictions
 
-def create_triage_agent_router() -> Callable[[str, str, str], dict]:
+    def record_run(
+        self,
+        status: str,
+        polls: int,
+        run_time: float,
+        result: dict
+    ) -> None:
+        with self.lock:
+            self.runs += 1
+            self.polls += polls
+            self.run_time += run_time
+            self.statuses[status] += 1
+            if result.get("error") is not None:
+                self.routes["fallback"] += 1
+            else:
+                self.routes["clu" if result["kind"] == "clu_result" else "cqa"] += 1
+
+    def get_metrics(self) -> dict:
+        with self.lock:
+            return {
+                "threads": self.threads,
+                "created_threads": self.created_threads,
+                "reused_threads": self.reused_threads,
+                "evictions": self.evictions,
+                "runs": self.runs,
+                "avg_polls": self.polls / self.runs if self.runs else 0.0,
+                "avg_run_ms": self.run_time / self.runs * 1000 if self.runs else 0.0,
+                "statuses": dict(self.statuses),
+                "routes": dict(self.routes)
+            }
+
+
+metrics = TriageAgentMetrics()
+
+
+class AgentThreadPool():
     """
-    Create triage agent router.
+    Agent threads by conversation id, least recently used first.
+
+    Threads idle for idle_timeout are evicted, as are the least recently
+    used idle ones beyond max_threads; evicted threads are deleted.
     """
-    project_endpoint = os.environ.get("AGENTS_PROJECT_ENDPOINT")
-    credential = get_azure_credential()
-    agents_client = AgentsClient(
-        endpoint=project_endpoint,
-        credential=credential,
-        api_version="2025-05-15-preview"
+
+    def __init__(
+        self,
+        agents_client: AgentsClient,
+        max_threads: int = TRIAGE_AGENT_MAX_THREADS,
+        idle_timeout: float = TRIAGE_AGENT_THREAD_IDLE_TIMEOUT
+    ):
+        self.agents_client = agents_client
+        self.max_threads = max_threads
+        self.idle_timeout = idle_timeout
+        self.threads = OrderedDict()
+        self.pending_deletes = set()
+
+    def get(
+        self,
+        id: str
+    ) -> AgentThread:
+        """
+        Get conversation's thread (thread_id None until its first run).
+        """
+        thread = self.threads.get(id)
+        created = thread is None
+        if created:
+            thread = AgentThread()
+            self.threads[id] = thread
+        self.threads.move_to_end(id)
+        thread.last_used = time.monotonic()
+        self.evict(keep=id)
+        metrics.record_thread(created, len(self.threads))
+        return thread
+
+    def remove(
+        self,
+        id: str
+    ) -> None:
+        """
+        Forget conversation's thread (e.g. after a failed run).
+        """
+        thread = self.threads.pop(id, None)
+        if thread is not None:
+            self.delete(thread)
+
+    def evict(
+        self,
+        keep: str
+    ) -> None:
+        """
+        Evict idle threads, then least recently used ones over max_threads
+        (never keep or threads with a run in progress).
+        """
+        now = time.monotonic()
+        evicted = [
+            id for id, thread in self.threads.items()
+            if now - thread.last_used > self.idle_timeout and not thread.lock.locked() and id != keep
+        ]
+        excess = len(self.threads) - len(evicted) - self.max_threads
+        for id, thread in self.threads.items():
+            if excess <= 0:
+                break
+            if id not in evicted and not thread.lock.locked() and id != keep:
+                evicted.append(id)
+                excess -= 1
+
+        for id in evicted:
+            self.delete(self.threads.pop(id))
+        if evicted:
+            metrics.record_evictions(len(evicted), len(self.threads))
+
+    def delete(
+        self,
+        thread: AgentThread
+    ) -> None:
+        if thread.thread_id is None:
+            return
+        task = asyncio.create_task(self.delete_thread(thread.thread_id))
+        # Keep a reference until done:
+        self.pending_deletes.add(task)
+        task.add_done_callback(self.pending_deletes.discard)
+
+    async def delete_thread(
+        self,
+        thread_id: str
+    ) -> None:
+        try:
+            await self.agents_client.threads.delete(thread_id)
+        except Exception as e:
+            _logger.warning(f"Unable to delete thread {thread_id}: {e}")
+
+
+async def poll_run(
+    agents_client: AgentsClient,
+    run: Any
+) -> tuple[Any, int]:
+    """
+    Poll run until terminal (cancelled after TRIAGE_AGENT_RUN_TIMEOUT).
+
+    The interval grows from TRIAGE_AGENT_POLL_INTERVAL by
+    TRIAGE_AGENT_POLL_BACKOFF up to TRIAGE_AGENT_MAX_POLL_INTERVAL.
+    Returns the final run and number of polls.
+    """
+    deadline = time.monotonic() + TRIAGE_AGENT_RUN_TIMEOUT
+    interval = TRIAGE_AGENT_POLL_INTERVAL
+    polls = 0
+    while run.status not in TERMINAL_STATUSES:
+        if run.status == RunStatus.REQUIRES_ACTION or time.monotonic() > deadline:
+            # Agent tools run server-side; nothing to submit:
+            _logger.warning(f"Cancelling run {run.id} ({run.status})")
+            return await agents_client.runs.cancel(thread_id=run.thread_id, run_id=run.id), polls
+        await asyncio.sleep(interval)
+        interval = min(interval * TRIAGE_AGENT_POLL_BACKOFF, TRIAGE_AGENT_MAX_POLL_INTERVAL)
+        run = await agents_client.runs.get(thread_id=run.thread_id, run_id=run.id)
+        polls += 1
+    return run, polls
+
+
+async def get_run_response(
+    agents_client: AgentsClient,
+    run: Any
+) -> str | None:
+    """
+    Get text of the agent message created by run.
+    """
+    messages = agents_client.messages.list(
+        thread_id=run.thread_id,
+        run_id=run.id,
+        order=ListSortOrder.DESCENDING,
+        limit=1
+    )
+    async for message in messages:
+        if message.role == MessageRole.AGENT and message.text_messages:
+            return message.text_messages[-1].text.value
+    return None
+
+
+def create_agents_client() -> AgentsClient:
+    return AgentsClient(
+        endpoint=os.environ.get("AGENTS_PROJECT_ENDPOINT"),
+        credential=get_credential_async(),
+        api_version="2025-05-15-preview",
+        transport=get_transport_async()
     )
+
+
+def create_agent_runner(
+    agents_client: AgentsClient = None
+) -> Callable[[str, str, str], Awaitable[dict]]:
+    """
+    Create function running the triage agent on (redacted) text in the
+    conversation's thread; utterance is the original text.
+    """
+    agents_client = agents_client or create_agents_client()
     agent_id = os.environ.get("TRIAGE_AGENT_ID")
-    agent = agents_client.get_agent(agent_id=agent_id)
+    pool = None
+
+    @tracing.traced("triage_agent.run")
+    async def run_agent(
+        text: str,
+        utterance: str,
+        id: str
+    ) -> dict:
+        nonlocal pool
+        if pool is None:
+            # Created on the loop the runs are polled on:
+            pool = AgentThreadPool(agents_client)
+
+        thread = pool.get(id)
+        async with thread.lock:
+            start = time.perf_counter()
+            message = ThreadMessageOptions(role=MessageRole.USER, content=text)
+            try:
+                if thread.thread_id is None:
+                    run = await agents_client.create_thread_and_run(
+                        agent_id=agent_id,
+                        thread=AgentThreadCreationOptions(messages=[message])
+                    )
+                    thread.thread_id = run.thread_id
+                else:
+                    run = await agents_client.runs.create(
+                        thread_id=thread.thread_id,
+                        agent_id=agent_id,
+                        additional_messages=[message]
+                    )
+                run, polls = await poll_run(agents_client, run)
+                status = RunStatus(run.status).value
+                if run.status == RunStatus.COMPLETED:
+                    result = parse_response(await get_run_response(agents_client, run), utterance)
+                else:
+                    _logger.warning(f"Run {run.id} {status}: {run.last_error}")
+                    result = {"error": f"Run {status}"}
+            except Exception as e:
+                _logger.error(f"Triage agent run failed: {e}")
+                # Start over with a new thread next time:
+                pool.remove(id)
+                result = {"error": e}
+                status, polls = "error", 0
+
+        metrics.record_run(status, polls, time.perf_counter() - start, result)
+        tracing.set_attributes(status=status, polls=polls)
+        if status == "error":
+            tracing.set_error(result["error"])
+        return tracing.set_result(result)
+
+    return run_agent
+
+
+def create_triage_agent_router_async(
+    agents_client: AgentsClient = None
+) -> Callable[[str, str, str], Awaitable[dict]]:
+    """
+    Create async triage agent router.
+    """
+    run_agent = create_agent_runner(agents_client)
+
+    async def triage_agent_router(
+        utterance: str,
+        language: str,
+        id: str,
+        pii_context: PIIContext = None
+    ) -> dict:
+        """
+        Triage agent router function.
+        """
+        text = utterance
+        if PII_ENABLED:
+            # Redact PII (off the event loop, recognition may call Text Analytics):
+            text = await asyncio.to_thread(
+                pii_redacter.redact,
+                text=utterance,
+                id=id,
+                language=language,
+                cache=True,
+                context=pii_context
+            )
+        return await run_agent(text, utterance, id)
+
+    return triage_agent_router
+
+
+def create_triage_agent_router(
+    agents_client: AgentsClient = None
+) -> Callable[[str, str, str], dict]:
+    """
+    Create triage agent router (runs polled on the background event loop).
+    """
+    run_agent = create_agent_runner(agents_client)
 
     def triage_agent_router(
         utterance: str,
         language: str,
-        id: str
+        id: str,
+        pii_context: PIIContext = None
     ) -> dict:
         """
         Triage agent router function.
         """
+        text = utterance
         if PII_ENABLED:
             # Redact PII:
-            message = pii_redacter.redact(
+            text = pii_redacter.redact(
                 text=utterance,
                 id=id,
                 language=language,
-                cache=True
+                cache=True,
+                context=pii_context
             )
-
-        # Create thread for communication
-        thread = agents_client.threads.create()
-        print(f"Created thread, ID: {thread.id}")
-
-        # Create message to thread
-        message = agents_client.messages.create(
-            thread_id=thread.id,
-            role="user",
-            content=utterance,
-        )
-        print(f"Created message: {message['id']}")
-        
-        run = agents_client.runs.create_and_process(thread_id=thread.id, agent_id=agent.id)
-        print(f"Run finished with status: {run.status}")
-        
-        message = agents_client.messages.create(
-            thread_id=thread.id,
-            role="user",
-            content="Where is my order?",
-        )
-        print(f"Created message: {message['id']}")
-
-        # Create and process an Agent run in thread with tools
-        run = agents_client.runs.create_and_process(thread_id=thread.id, agent_id=agent.id)
-        print(f"Run finished with status: {run.status}")
-
-        if run.status == "failed":
-            print(f"Run failed: {run.last_error}")
-
-        # Fetch and log all messages
-        messages = agents_client.messages.list(thread_id=thread.id, order=ListSortOrder.ASCENDING)
-        for msg in messages:
-            if msg.text_messages:
-                last_text = msg.text_messages[-1]
-                print(f"{msg.role}: {last_text.text.value}")
+        return run_coroutine(run_agent(text, utterance, id))
 
     return triage_agent_router
@@ -2,144 +2,580 @@
 # Licensed under the MIT License.
 import os
 import json
+import time
+import uuid
+import asyncio
+import logging
 import importlib
+import contextlib
+import client_registry
 import pii_redacter
+from pii_redacter import PIIContext
+import tracing
+import resilience
 from json import JSONDecodeError
-from flask import Flask, request, jsonify, render_template
+from typing import AsyncIterator, Iterator
+from flask import Flask, Response, request, jsonify, render_template
 from azure.search.documents import SearchClient
-from aoai_client import AOAIClient, get_prompt
+from azure.search.documents.aio import SearchClient as AsyncSearchClient
+from aoai_client import AOAIClient, AsyncAOAIClient, get_prompt
+from client_registry import get_credential, get_credential_async, get_transport, get_transport_async
+from response_cache import RAG_CACHE_EMBEDDING_DEPLOYMENT, RAG_CACHE_ENABLED, ResponseCache
 from router.router_type import RouterType
 from unified_conversation_orchestrator import UnifiedConversationOrchestrator
-from utils import get_azure_credential
+from utils import Lazy, iterate_async, run_coroutine
 
 # Flask server:
 app = Flask(__name__, static_url_path='',
             static_folder='dist',
             template_folder='dist')
 
-# RAG AOAI client:
-search_client = SearchClient(
-    endpoint=os.environ.get("SEARCH_ENDPOINT"),
-    index_name=os.environ.get("SEARCH_INDEX_NAME"),
-    credential=get_azure_credential()
-)
-rag_client = AOAIClient(
-    endpoint=os.environ.get("AOAI_ENDPOINT"),
-    deployment=os.environ.get("AOAI_DEPLOYMENT"),
-    use_rag=True,
-    search_client=search_client
-)
-
-# Extract-utterances AOAI client:
-extract_prompt = get_prompt("extract_utterances.txt")
-extract_client = AOAIClient(
-    endpoint=os.environ.get("AOAI_ENDPOINT"),
-    deployment=os.environ.get("AOAI_DEPLOYMENT"),
-    system_message=extract_prompt
-)
+# Async pipeline:
+ASYNC_PIPELINE_ENABLED = os.environ.get("ASYNC_PIPELINE_ENABLED", "false").lower() == "true"
+MAX_CONCURRENT_UTTERANCES = int(os.environ.get("MAX_CONCURRENT_UTTERANCES", "4"))
+
+_logger = logging.getLogger(__name__)
+
+
+
+def create_rag_client() -> AOAIClient | AsyncAOAIClient:
+    """
+    Create RAG AOAI client.
+    """
+    response_cache = ResponseCache() if RAG_CACHE_ENABLED else None
+    if ASYNC_PIPELINE_ENABLED:
+        search_client = AsyncSearchClient(
+            endpoint=os.environ.get("SEARCH_ENDPOINT"),
+            index_name=os.environ.get("SEARCH_INDEX_NAME"),
+            credential=get_credential_async(),
+            transport=get_transport_async()
+        )
+        return AsyncAOAIClient(
+            endpoint=os.environ.get("AOAI_ENDPOINT"),
+            deployment=os.environ.get("AOAI_DEPLOYMENT"),
+            session_namespace=f"rag:{os.environ.get('AOAI_DEPLOYMENT')}",
+            use_rag=True,
+            search_client=search_client,
+            response_cache=response_cache,
+            embedding_deployment=RAG_CACHE_EMBEDDING_DEPLOYMENT
+        )
+
+    search_client = SearchClient(
+        endpoint=os.environ.get("SEARCH_ENDPOINT"),
+        index_name=os.environ.get("SEARCH_INDEX_NAME"),
+        credential=get_credential(),
+        transport=get_transport()
+    )
+    return AOAIClient(
+        endpoint=os.environ.get("AOAI_ENDPOINT"),
+        deployment=os.environ.get("AOAI_DEPLOYMENT"),
+        session_namespace=f"rag:{os.environ.get('AOAI_DEPLOYMENT')}",
+        use_rag=True,
+        search_client=search_client,
+        response_cache=response_cache,
+        embedding_deployment=RAG_CACHE_EMBEDDING_DEPLOYMENT
+    )
+
+
+def create_extract_client() -> AOAIClient | AsyncAOAIClient:
+    """
+    Create extract-utterances AOAI client.
+    """
+    extract_prompt = get_prompt("extract_utterances.txt")
+    return (AsyncAOAIClient if ASYNC_PIPELINE_ENABLED else AOAIClient)(
+        endpoint=os.environ.get("AOAI_ENDPOINT"),
+        deployment=os.environ.get("AOAI_DEPLOYMENT"),
+        session_namespace=f"extract:{os.environ.get('AOAI_DEPLOYMENT')}",
+        system_message=extract_prompt
+    )
+
+
+# Clients are created on first use, once per worker process:
+rag_client = Lazy(create_rag_client)
+extract_client = Lazy(create_extract_client)
 
 # PII:
 PII_ENABLED = os.environ.get("PII_ENABLED", "false").lower() == "true"
 
+UNABLE_TO_RESPOND = 'I am unable to respond or participate in this conversation.'
+ERROR_RESPONSE = 'Sorry, something went wrong while answering. Please try again.'
+
+
+def redact_query(
+    query: str,
+    language: str,
+    id: int,
+    pii_context: PIIContext = None
+) -> str:
+    """
+    Redact PII from a RAG query (with the request's PII context).
+    """
+    if not PII_ENABLED:
+        return query
+    return pii_redacter.redact(
+        text=query,
+        id=id,
+        language=language,
+        cache=True,
+        context=pii_context
+    )
+
+
+async def redact_query_async(
+    query: str,
+    language: str,
+    id: int,
+    pii_context: PIIContext = None
+) -> str:
+    """
+    Redact PII from a RAG query in a worker thread.
+    """
+    if not PII_ENABLED:
+        return query
+    return await asyncio.to_thread(redact_query, query, language, id, pii_context)
+
 
 # Fallback function (RAG):
 def fallback_function(
     query: str,
     language: str,
-    id: int
+    id: int,
+    pii_context: PIIContext = None
 ) -> str:
     """
     Call RAG client for grounded chat completion.
     """
-    if PII_ENABLED:
-        # Redact PII:
-        query = pii_redacter.redact(
-            text=query,
-            id=id,
-            language=language,
-            cache=True
-        )
+    query = redact_query(query, language, id, pii_context)
+    return rag_client.get().chat_completion(query, language=language, id=id)
+
+
+async def fallback_function_async(
+    query: str,
+    language: str,
+    id: int,
+    pii_context: PIIContext = None
+) -> str:
+    """
+    Call async RAG client for grounded chat completion.
+    """
+    query = await redact_query_async(query, language, id, pii_context)
+    return await rag_client.get().chat_completion(query, language=language, id=id)
 
-    return rag_client.chat_completion(query)
+
+def fallback_function_stream(
+    query: str,
+    language: str,
+    id: int,
+    pii_context: PIIContext = None
+) -> Iterator[str]:
+    """
+    Call RAG client for streamed grounded chat completion
+    (a generator, so all work happens while the stream is consumed).
+    """
+    query = redact_query(query, language, id, pii_context)
+    yield from rag_client.get().chat_completion_stream(query, language=language, id=id)
+
+
+async def fallback_function_stream_async(
+    query: str,
+    language: str,
+    id: int,
+    pii_context: PIIContext = None
+) -> AsyncIterator[str]:
+    """
+    Call async RAG client for streamed grounded chat completion
+    (an async generator, so all work happens while the stream is consumed).
+    """
+    query = await redact_query_async(query, language, id, pii_context)
+    async for token in rag_client.get().chat_completion_stream(query, language=language, id=id):
+        yield token
+
+
+def speculate_retrieval(
+    query: str,
+    language: str,
+    id: int,
+    pii_context: PIIContext = None
+) -> None:
+    """
+    Prefetch RAG search results for a possible fallback.
+    """
+    # Redact as the fallback will:
+    query = redact_query(query, language, id, pii_context)
+    rag_client.get().retrieve(query)
+
+
+async def speculate_retrieval_async(
+    query: str,
+    language: str,
+    id: int,
+    pii_context: PIIContext = None
+) -> None:
+    """
+    Prefetch RAG search results for a possible fallback (async).
+    """
+    # Redact as the fallback will:
+    query = await redact_query_async(query, language, id, pii_context)
+    await rag_client.get().retrieve(query)
 
 
 # Unified-Conversation-Orchestrator:
 router_type = RouterType(os.environ.get("ROUTER_TYPE", "BYPASS"))
-orchestrator = UnifiedConversationOrchestrator(
-    router_type=router_type,
-    fallback_function=fallback_function
-)
-chat_id = 0
-
-
-def orchestrate_chat(message: str) -> list[str]:
-    if PII_ENABLED:
-        # Redact PII:
-        message = pii_redacter.redact(
-            text=message,
-            id=chat_id,
-            cache=True
-        )
 
-    # Break user message into separate utterances:
-    utterances = extract_client.chat_completion(message)
-    print(f"Utterances: {utterances}")
+
+def create_orchestrator() -> UnifiedConversationOrchestrator:
+    """
+    Create unified-conversation-orchestrator.
+    """
+    return UnifiedConversationOrchestrator(
+        router_type=router_type,
+        fallback_function=fallback_function_async if ASYNC_PIPELINE_ENABLED else fallback_function,
+        use_async=ASYNC_PIPELINE_ENABLED,
+        speculate_function=speculate_retrieval_async if ASYNC_PIPELINE_ENABLED else speculate_retrieval
+    )
+
+
+orchestrator = Lazy(create_orchestrator)
+
+
+def init_clients() -> None:
+    """
+    Create all clients up front (e.g. in each worker before serving).
+    """
+    rag_client.get()
+    extract_client.get()
+    orchestrator.get()
+
+
+def parse_utterances(
+    utterances: str | list
+) -> list[str] | None:
+    """
+    Parse extracted utterances (None on harmful content).
+    """
+    _logger.debug("Utterances: %s", utterances)
     if not isinstance(utterances, list):
         try:
             utterances = json.loads(utterances)
         except JSONDecodeError:
+            return None
+    return utterances
+
+
+@tracing.traced("extract_utterances")
+def extract_utterances(
+    message: str,
+    chat_id: str,
+    pii_context: PIIContext = None
+) -> list[tuple[str, dict | None]] | None:
+    """
+    Break message into (utterance, routing result) pairs (None on harmful content).
+
+    Routing results are only known up front with merged function-calling.
+    """
+    if orchestrator.get().merged_routing:
+        utterances = orchestrator.get().route_message(message, id=chat_id, pii_context=pii_context)
+        if utterances is not None:
+            tracing.set_attributes(utterances=len(utterances))
+        return utterances
+
+    utterances = parse_utterances(
+        extract_client.get().chat_completion(message, id=chat_id)
+    )
+    if utterances is None:
+        return None
+    tracing.set_attributes(utterances=len(utterances))
+    return [(query, None) for query in utterances]
+
+
+@tracing.traced("extract_utterances")
+async def extract_utterances_async(
+    message: str,
+    chat_id: str,
+    pii_context: PIIContext = None
+) -> list[tuple[str, dict | None]] | None:
+    """
+    Break message into (utterance, routing result) pairs (async).
+    """
+    if orchestrator.get().merged_routing:
+        utterances = await orchestrator.get().route_message_async(message, id=chat_id, pii_context=pii_context)
+        if utterances is not None:
+            tracing.set_attributes(utterances=len(utterances))
+        return utterances
+
+    utterances = parse_utterances(
+        await extract_client.get().chat_completion(message, id=chat_id)
+    )
+    if utterances is None:
+        return None
+    tracing.set_attributes(utterances=len(utterances))
+    return [(query, None) for query in utterances]
+
+
+def parse_orchestration_response(
+    orchestration_response: dict
+) -> str:
+    """
+    Parse orchestration response into chat response.
+    """
+    response = None
+    if orchestration_response["route"] == "fallback":
+        response = orchestration_response["result"]
+
+    elif orchestration_response["route"] == "clu":
+        intent = orchestration_response["result"]["intent"]
+        entities = orchestration_response["result"]["entities"]
+
+        # Here, you may call external functions based on recognized intent:
+        hooks_module = importlib.import_module("clu_hooks")
+        hook_func = getattr(hooks_module, intent)
+
+        response = hook_func(entities)
+
+    elif orchestration_response["route"] == "cqa":
+        answer = orchestration_response["result"]["answer"]
+
+        response = answer
+
+    _logger.debug("Orchestration response: %s", orchestration_response)
+    _logger.debug("Parsed response: %s", response)
+    return response
+
+
+@tracing.traced("chat")
+def orchestrate_chat(
+    message: str,
+    chat_id: str
+) -> list[str]:
+    with pii_redacter.request_context(chat_id, enabled=PII_ENABLED) as pii_context:
+        if PII_ENABLED:
+            # Redact PII:
+            message = pii_context.redact(message)
+
+        # Break user message into separate utterances:
+        utterances = extract_utterances(message, chat_id, pii_context)
+        if utterances is None:
             # Harmful content case:
+            return [UNABLE_TO_RESPOND]
+
+        # Process each utterance:
+        responses = []
+        for query, routing_result in utterances:
             if PII_ENABLED:
-                # Clean up PII memory:
-                pii_redacter.remove(id=chat_id)
-            return ['I am unable to respond or participate in this conversation.']
+                # Reconstruct PII:
+                query = pii_context.reconstruct(query)
 
-    # Process each utterance:
-    responses = []
-    for query in utterances:
-        if PII_ENABLED:
-            # Reconstruct PII:
-            query = pii_redacter.reconstruct(
-                text=query,
+            # Orchestrate:
+            orchestration_response = orchestrator.get().orchestrate(
+                message=query,
                 id=chat_id,
-                cache=True
+                routing_result=routing_result,
+                pii_context=pii_context
             )
 
-        # Orchestrate:
-        orchestration_response = orchestrator.orchestrate(
-            message=query,
-            id=chat_id
+            # Parse response:
+            responses.append(parse_orchestration_response(orchestration_response))
+
+        return responses
+
+
+@tracing.traced("chat")
+async def orchestrate_chat_async(
+    message: str,
+    chat_id: str
+) -> list[str]:
+    """
+    Orchestrate chat with utterances processed concurrently.
+
+    Responses are returned in utterance order.
+    """
+    with pii_redacter.request_context(chat_id, enabled=PII_ENABLED) as pii_context:
+        if PII_ENABLED:
+            # Redact PII:
+            message = await asyncio.to_thread(pii_context.redact, message)
+
+        # Break user message into separate utterances:
+        utterances = await extract_utterances_async(message, chat_id, pii_context)
+        if utterances is None:
+            # Harmful content case:
+            return [UNABLE_TO_RESPOND]
+
+        semaphore = asyncio.Semaphore(MAX_CONCURRENT_UTTERANCES)
+
+        async def orchestrate_utterance(query: str, routing_result: dict | None) -> str:
+            async with semaphore:
+                if PII_ENABLED:
+                    # Reconstruct PII:
+                    query = pii_context.reconstruct(query)
+
+                # Orchestrate:
+                orchestration_response = await orchestrator.get().orchestrate_async(
+                    message=query,
+                    id=chat_id,
+                    routing_result=routing_result,
+                    pii_context=pii_context
+                )
+
+                # Parse response:
+                return parse_orchestration_response(orchestration_response)
+
+        # Process utterances concurrently (gather preserves order):
+        responses = await asyncio.gather(
+            *[orchestrate_utterance(query, routing_result) for query, routing_result in utterances]
         )
 
-        # Parse response:
-        response = None
-        if orchestration_response["route"] == "fallback":
-            response = orchestration_response["result"]
+        return list(responses)
+
+
+def stream_chat(
+    message: str,
+    chat_id: str
+) -> Iterator[dict]:
+    """
+    Orchestrate chat, yielding each utterance response when ready.
+
+    Fallback (RAG) responses are streamed token by token.
+    """
+    with pii_redacter.request_context(chat_id, enabled=PII_ENABLED) as pii_context:
+        if PII_ENABLED:
+            # Redact PII:
+            message = pii_context.redact(message)
+
+        # Break user message into separate utterances:
+        utterances = extract_utterances(message, chat_id, pii_context)
+        if utterances is None:
+            # Harmful content case:
+            yield {"type": "start", "count": 1}
+            yield {"type": "message", "index": 0, "content": UNABLE_TO_RESPOND}
+            return
+
+        yield {"type": "start", "count": len(utterances)}
+        for index, (query, routing_result) in enumerate(utterances):
+            try:
+                if PII_ENABLED:
+                    # Reconstruct PII:
+                    query = pii_context.reconstruct(query)
 
-        elif orchestration_response["route"] == "clu":
-            intent = orchestration_response["result"]["intent"]
-            entities = orchestration_response["result"]["entities"]
+                # Orchestrate:
+                orchestration_response = orchestrator.get().orchestrate(
+                    message=query,
+                    id=chat_id,
+                    fallback_function=fallback_function_stream,
+                    routing_result=routing_result,
+                    pii_context=pii_context
+                )
 
-            # Here, you may call external functions based on recognized intent:
-            hooks_module = importlib.import_module("clu_hooks")
-            hook_func = getattr(hooks_module, intent)
+                if orchestration_response["route"] == "fallback":
+                    content = []
+                    for token in orchestration_response["result"]:
+                        content.append(token)
+                        yield {"type": "token", "index": index, "content": token}
+                    orchestration_response["result"] = "".join(content)
 
-            response = hook_func(entities)
+                # Parse response:
+                response = parse_orchestration_response(orchestration_response)
+                yield {"type": "message", "index": index, "content": response}
+            except Exception:
+                # Report the failed utterance and go on with the rest:
+                _logger.exception(f"Utterance {index} failed")
+                yield {"type": "error", "index": index, "content": ERROR_RESPONSE}
 
-        elif orchestration_response["route"] == "cqa":
-            answer = orchestration_response["result"]["answer"]
 
-            response = answer
+async def stream_chat_async(
+    message: str,
+    chat_id: str
+) -> AsyncIterator[dict]:
+    """
+    Orchestrate chat concurrently, yielding each utterance response
+    (or fallback token) as soon as it is ready.
+    """
+    with pii_redacter.request_context(chat_id, enabled=PII_ENABLED) as pii_context:
+        if PII_ENABLED:
+            # Redact PII:
+            message = await asyncio.to_thread(pii_context.redact, message)
+
+        # Break user message into separate utterances:
+        utterances = await extract_utterances_async(message, chat_id, pii_context)
+        if utterances is None:
+            # Harmful content case:
+            yield {"type": "start", "count": 1}
+            yield {"type": "message", "index": 0, "content": UNABLE_TO_RESPOND}
+            return
 
-        print(f"Orchestration response: {orchestration_response}")
-        print(f"Parsed response: {response}")
-        responses.append(response)
+        yield {"type": "start", "count": len(utterances)}
 
-    if PII_ENABLED:
-        # Clean up PII memory:
-        pii_redacter.remove(id=chat_id)
+        semaphore = asyncio.Semaphore(MAX_CONCURRENT_UTTERANCES)
+        events = asyncio.Queue()
 
-    return responses
+        async def orchestrate_utterance(index: int, query: str, routing_result: dict | None) -> None:
+            try:
+                async with semaphore:
+                    if PII_ENABLED:
+                        # Reconstruct PII:
+                        query = pii_context.reconstruct(query)
+
+                    # Orchestrate:
+                    orchestration_response = await orchestrator.get().orchestrate_async(
+                        message=query,
+                        id=chat_id,
+                        fallback_function=fallback_function_stream_async,
+                        routing_result=routing_result,
+                        pii_context=pii_context
+                    )
+
+                    if orchestration_response["route"] == "fallback":
+                        content = []
+                        async for token in orchestration_response["result"]:
+                            content.append(token)
+                            await events.put({"type": "token", "index": index, "content": token})
+                        orchestration_response["result"] = "".join(content)
+
+                    # Parse response:
+                    response = parse_orchestration_response(orchestration_response)
+                    await events.put({"type": "message", "index": index, "content": response})
+            except Exception:
+                # Report the failed utterance and go on with the rest:
+                _logger.exception(f"Utterance {index} failed")
+                await events.put({"type": "error", "index": index, "content": ERROR_RESPONSE})
+            finally:
+                # Mark utterance done:
+                await events.put(None)
+
+        tasks = [
+            asyncio.create_task(orchestrate_utterance(index, query, routing_result))
+            for index, (query, routing_result) in enumerate(utterances)
+        ]
+        try:
+            remaining = len(tasks)
+            while remaining:
+                event = await events.get()
+                if event is None:
+                    remaining -= 1
+                    continue
+                yield event
+        finally:
+            # Stop utterances if the consumer went away (e.g. client disconnect):
+            for task in tasks:
+                task.cancel()
+
+
+def format_events(
+    events: Iterator[dict]
+) -> Iterator[str]:
+    """
+    Format chat events as server-sent events.
+    """
+    start = time.perf_counter()
+    # Closing the response (client disconnect) closes the event source too:
+    with contextlib.closing(events):
+        try:
+            for event in events:
+                event["elapsed_ms"] = round((time.perf_counter() - start) * 1000, 1)
+                yield f"data: {json.dumps(event)}\n\n"
+        except Exception:
+            _logger.exception("Chat stream failed")
+            yield f"data: {json.dumps({'type': 'error', 'content': ERROR_RESPONSE})}\n\n"
+    yield f"data: {json.dumps({'type': 'end'})}\n\n"
 
 
 @app.route("/")
@@ -151,10 +587,110 @@ def home_page():
 def chat():
     content = request.json
     message = content["message"]
+    # Chat history is kept per conversation:
+    chat_id = content.get("conversation_id") or str(uuid.uuid4())
 
-    responses = orchestrate_chat(message)
+    if ASYNC_PIPELINE_ENABLED:
+        responses = run_coroutine(orchestrate_chat_async(message, chat_id))
+    else:
+        responses = orchestrate_chat(message, chat_id)
 
-    print(f"responses: {responses}")
+    _logger.debug("Responses: %s", responses)
     return jsonify({
         "messages": responses
     })
+
+
+@app.route("/chat/stream", methods=['POST'])
+def chat_stream():
+    content = request.json
+    message = content["message"]
+    # Chat history is kept per conversation:
+    chat_id = content.get("conversation_id") or str(uuid.uuid4())
+
+    if ASYNC_PIPELINE_ENABLED:
+        events = iterate_async(stream_chat_async(message, chat_id))
+    else:
+        events = stream_chat(message, chat_id)
+
+    return Response(
+        format_events(events),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+@app.route("/language/metrics")
+def language_metrics():
+    return jsonify(orchestrator.get().get_language_metrics())
+
+
+@app.route("/router/metrics")
+def router_metrics():
+    return jsonify(orchestrator.get().get_router_metrics())
+
+
+@app.route("/router/cache/invalidate", methods=["POST"])
+def router_cache_invalidate():
+    orchestrator.get().invalidate_router_cache()
+    return jsonify({"invalidated": True})
+
+
+@app.route("/rag/metrics")
+def rag_metrics():
+    return jsonify(rag_client.get().get_retrieval_metrics())
+
+
+@app.route("/rag/cache/invalidate", methods=["POST"])
+def rag_cache_invalidate():
+    rag_client.get().invalidate_caches()
+    return jsonify({"invalidated": True})
+
+
+@app.route("/pii/metrics")
+def pii_metrics():
+    return jsonify(pii_redacter.get_metrics())
+
+
+@app.route("/sessions/metrics")
+def session_metrics():
+    return jsonify({
+        "extract_client": extract_client.get().get_metrics(),
+        "rag_client": rag_client.get().get_metrics()
+    })
+
+
+@app.route("/clients/metrics")
+def client_metrics():
+    return jsonify(client_registry.get_metrics())
+
+
+@app.route("/resilience/metrics")
+def resilience_metrics():
+    return jsonify(resilience.get_metrics())
+
+
+@app.route("/metrics")
+def metrics():
+    """
+    Stage latency histograms (?format=prometheus for the text format)
+    with the component metrics.
+    """
+    if request.args.get("format") == "prometheus":
+        return Response(
+            tracing.format_prometheus() + resilience.format_prometheus(),
+            mimetype="text/plain; version=0.0.4"
+        )
+    return jsonify({
+        "tracing": tracing.get_metrics(),
+        "language": orchestrator.get().get_language_metrics(),
+        "router": orchestrator.get().get_router_metrics(),
+        "rag": rag_client.get().get_retrieval_metrics(),
+        "pii": pii_redacter.get_metrics(),
+        "sessions": {
+            "extract_client": extract_client.get().get_metrics(),
+            "rag_client": rag_client.get().get_metrics()
+        },
+        "clients": client_registry.get_metrics(),
+        "resilience": resilience.get_metrics()
+    })
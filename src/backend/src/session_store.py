@@ -0,0 +1,234 @@
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT License.
+import os
+import json
+import time
+import logging
+import threading
+import importlib
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+
+"""
+Per-conversation chat history storage for AOAI clients.
+"""
+
+SESSION_STORE_BACKEND = os.environ.get("SESSION_STORE_BACKEND", "memory")
+SESSION_TTL_SECONDS = float(os.environ.get("SESSION_TTL_SECONDS", "1800"))
+SESSION_MAX_MESSAGES = int(os.environ.get("SESSION_MAX_MESSAGES", "20"))
+SESSION_MAX_COUNT = int(os.environ.get("SESSION_MAX_COUNT", "10000"))
+
+_logger = logging.getLogger(__name__)
+
+
+def trim_history(
+    messages: list[dict],
+    max_messages: int
+) -> list[dict]:
+    """
+    Keep the most recent messages, starting on a user turn so
+    tool messages are never separated from their tool call.
+
+    Leading system messages (conversation summary) are always kept.
+    """
+    summary = []
+    for message in messages:
+        if message.get("role") != "system":
+            break
+        summary.append(message)
+
+    messages = messages[len(summary):]
+    if len(messages) <= max_messages:
+        return summary + messages
+
+    window = messages[-max_messages:]
+    while window and window[0].get("role") != "user":
+        window = window[1:]
+    return summary + window
+
+
+def get_message_size(
+    message: dict
+) -> int:
+    """
+    Approximate message size in bytes.
+    """
+    return len(json.dumps(message, default=str))
+
+
+class SessionStore(ABC):
+    """
+    Session store interface.
+
+    History is keyed by namespace (one per AOAI client) and conversation id.
+    Backends implement get/append/set/delete; history is capped to the most
+    recent max_messages and expires after ttl seconds of inactivity.
+    """
+
+    def __init__(
+        self,
+        namespace: str,
+        ttl: float = SESSION_TTL_SECONDS,
+        max_messages: int = SESSION_MAX_MESSAGES
+    ):
+        self.namespace = namespace
+        self.ttl = ttl
+        self.max_messages = max_messages
+
+    @abstractmethod
+    def get(
+        self,
+        session_id: str
+    ) -> list[dict]:
+        """
+        Get session history (empty if unknown or expired).
+        """
+
+    @abstractmethod
+    def append(
+        self,
+        session_id: str,
+        messages: list[dict]
+    ) -> None:
+        """
+        Append messages to session history.
+        """
+
+    @abstractmethod
+    def set(
+        self,
+        session_id: str,
+        messages: list[dict]
+    ) -> None:
+        """
+        Replace session history (e.g. after compaction).
+        """
+
+    @abstractmethod
+    def delete(
+        self,
+        session_id: str
+    ) -> None:
+        """
+        Delete session history.
+        """
+
+    def get_metrics(self) -> dict:
+        """
+        Get store metrics.
+        """
+        return {}
+
+
+class InMemorySessionStore(SessionStore):
+    """
+    In-process session store with TTL and LRU eviction.
+    """
+
+    def __init__(
+        self,
+        namespace: str,
+        ttl: float = SESSION_TTL_SECONDS,
+        max_messages: int = SESSION_MAX_MESSAGES,
+        max_sessions: int = SESSION_MAX_COUNT
+    ):
+        SessionStore.__init__(
+            self,
+            namespace=namespace,
+            ttl=ttl,
+            max_messages=max_messages
+        )
+        self.max_sessions = max_sessions
+        self.sessions = OrderedDict()
+        self.lock = threading.Lock()
+        self.evictions = 0
+
+    def evict_expired(
+        self,
+        now: float
+    ) -> None:
+        """
+        Evict sessions idle for longer than ttl (oldest first).
+        """
+        while self.sessions:
+            session_id, (last_access, _) = next(iter(self.sessions.items()))
+            if now - last_access <= self.ttl:
+                break
+            self.sessions.pop(session_id)
+            self.evictions += 1
+
+    def get(
+        self,
+        session_id: str
+    ) -> list[dict]:
+        now = time.monotonic()
+        with self.lock:
+            self.evict_expired(now)
+            if session_id not in self.sessions:
+                return []
+            _, messages = self.sessions[session_id]
+            return list(messages)
+
+    def append(
+        self,
+        session_id: str,
+        messages: list[dict]
+    ) -> None:
+        now = time.monotonic()
+        with self.lock:
+            self.evict_expired(now)
+            _, history = self.sessions.pop(session_id, (now, []))
+            history = trim_history(history + messages, self.max_messages)
+            self.sessions[session_id] = (now, history)
+
+            while len(self.sessions) > self.max_sessions:
+                self.sessions.popitem(last=False)
+                self.evictions += 1
+
+    def set(
+        self,
+        session_id: str,
+        messages: list[dict]
+    ) -> None:
+        now = time.monotonic()
+        with self.lock:
+            self.sessions.pop(session_id, None)
+            self.sessions[session_id] = (now, trim_history(messages, self.max_messages))
+
+    def delete(
+        self,
+        session_id: str
+    ) -> None:
+        with self.lock:
+            self.sessions.pop(session_id, None)
+
+    def get_metrics(self) -> dict:
+        with self.lock:
+            self.evict_expired(time.monotonic())
+            histories = [messages for _, messages in self.sessions.values()]
+
+        return {
+            "sessions": len(histories),
+            "messages": sum(len(h) for h in histories),
+            "bytes": sum(get_message_size(m) for h in histories for m in h),
+            "evictions": self.evictions
+        }
+
+
+def create_session_store(
+    namespace: str,
+    backend: str = SESSION_STORE_BACKEND
+) -> SessionStore:
+    """
+    Create session store.
+
+    Backend is "memory" or a custom SessionStore class
+    given as "module:ClassName" (e.g. a shared cache backend).
+    """
+    if backend == "memory":
+        return InMemorySessionStore(namespace=namespace)
+
+    module_name, class_name = backend.split(":")
+    _logger.info(f"Using session store backend {backend}")
+    store_class = getattr(importlib.import_module(module_name), class_name)
+    return store_class(namespace=namespace)
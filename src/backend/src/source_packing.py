@@ -0,0 +1,152 @@
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT License.
+import os
+import threading
+from token_budget import count_text_tokens
+
+"""
+Token-aware packing of search results into the RAG grounding prompt.
+
+The indexer splits documents into overlapping chunks (2000 characters,
+500 overlap), so adjacent results repeat text. Packing ranks results by
+search score, trims text already covered by higher-ranked chunks of the
+same document and fills a token budget.
+"""
+
+RAG_SOURCE_PACKING = os.environ.get("RAG_SOURCE_PACKING", "true").lower() == "true"
+# Default token budget for packed sources (0 for no budget):
+RAG_SOURCE_TOKEN_BUDGET = int(os.environ.get("RAG_SOURCE_TOKEN_BUDGET", "0"))
+
+# Shorter overlaps are treated as coincidental:
+MIN_OVERLAP = 50
+# Chunks trimmed below this length are dropped:
+MIN_CHUNK_LENGTH = 50
+
+SCORE_FIELD = "@search.score"
+
+
+def find_overlap(
+    head: str,
+    tail: str
+) -> int:
+    """
+    Length of the longest suffix of head that is a prefix of tail.
+    """
+    if len(head) < MIN_OVERLAP or len(tail) < MIN_OVERLAP:
+        return 0
+    start = max(0, len(head) - len(tail))
+    probe = tail[:MIN_OVERLAP]
+    position = head.find(probe, start)
+    while position != -1:
+        length = len(head) - position
+        if tail.startswith(head[position:]):
+            return length
+        position = head.find(probe, position + 1)
+    return 0
+
+
+def trim_overlap(
+    chunk: str,
+    kept: list[str]
+) -> str:
+    """
+    Remove text of chunk already covered by kept chunks.
+    """
+    for other in kept:
+        if chunk in other:
+            return ""
+        # Chunk continues other:
+        overlap = find_overlap(other, chunk)
+        if overlap:
+            chunk = chunk[overlap:]
+        # Chunk precedes other:
+        overlap = find_overlap(chunk, other)
+        if overlap:
+            chunk = chunk[:-overlap]
+    return chunk
+
+
+def format_rag_source(
+    doc: dict
+) -> str:
+    return f'TITLE: {doc["title"]}, CONTENT: {doc["chunk"]}'
+
+
+def count_source_tokens(
+    search_results: list[dict]
+) -> int:
+    return sum(count_text_tokens(format_rag_source(doc)) for doc in search_results)
+
+
+def pack_sources(
+    search_results: list[dict],
+    token_budget: int = None
+) -> tuple[list[dict], dict]:
+    """
+    Rank, deduplicate and budget search results.
+
+    Returns packed results and token counts (before/after/saved).
+    """
+    ranked = sorted(
+        search_results,
+        key=lambda doc: doc.get(SCORE_FIELD) or 0.0,
+        reverse=True
+    )
+
+    packed = []
+    kept_chunks = {}
+    tokens = 0
+    for doc in ranked:
+        kept = kept_chunks.setdefault(doc["title"], [])
+        chunk = trim_overlap(doc["chunk"], kept)
+        if not chunk.strip() or (chunk != doc["chunk"] and len(chunk.strip()) < MIN_CHUNK_LENGTH):
+            continue
+
+        packed_doc = dict(doc, chunk=chunk)
+        doc_tokens = count_text_tokens(format_rag_source(packed_doc))
+        if token_budget and tokens + doc_tokens > token_budget:
+            # Lower-ranked but smaller chunks may still fit:
+            continue
+
+        kept.append(chunk)
+        packed.append(packed_doc)
+        tokens += doc_tokens
+
+    source_tokens = count_source_tokens(search_results)
+    return packed, {
+        "source_tokens": source_tokens,
+        "packed_tokens": tokens,
+        "tokens_saved": source_tokens - tokens
+    }
+
+
+class PackingMetrics():
+    """
+    Source and packed prompt token totals.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.source_tokens = 0
+        self.packed_tokens = 0
+
+    def record(
+        self,
+        stats: dict
+    ) -> None:
+        with self.lock:
+            self.requests += 1
+            self.source_tokens += stats["source_tokens"]
+            self.packed_tokens += stats["packed_tokens"]
+
+    def get_metrics(self) -> dict:
+        with self.lock:
+            tokens_saved = self.source_tokens - self.packed_tokens
+            return {
+                "requests": self.requests,
+                "source_tokens": self.source_tokens,
+                "packed_tokens": self.packed_tokens,
+                "tokens_saved": tokens_saved,
+                "avg_tokens_saved": tokens_saved / self.requests if self.requests else 0.0
+            }
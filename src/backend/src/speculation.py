@@ -0,0 +1,283 @@
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT License.
+import os
+import time
+import asyncio
+import logging
+import threading
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from typing import Awaitable, Callable
+from pii_redacter import PIIContext
+
+"""
+Speculative fallback work, started in parallel with the router.
+
+The speculation (e.g. RAG retrieval into the search cache) runs while
+the router call is in flight. If the router falls back, the orchestrator
+waits for it before calling the fallback, so only the remaining part of
+the fallback is on the critical path; if the router wins, it is cancelled
+or its result discarded. Speculations are rate limited to a budget of
+calls per second.
+"""
+
+SPECULATIVE_ROUTING_ENABLED = os.environ.get("SPECULATIVE_ROUTING_ENABLED", "false").lower() == "true"
+# Cost budget (0 for unlimited):
+SPECULATIVE_MAX_PER_SECOND = float(os.environ.get("SPECULATIVE_MAX_PER_SECOND", "10"))
+SPECULATIVE_WORKERS = int(os.environ.get("SPECULATIVE_WORKERS", "4"))
+
+_logger = logging.getLogger(__name__)
+
+
+class SpeculationBudget():
+    """
+    Token bucket allowing rate speculations per second (bursts up to rate,
+    at least one so that fractional rates still allow a speculation).
+    """
+
+    def __init__(
+        self,
+        rate: float
+    ):
+        self.rate = rate
+        self.capacity = max(rate, 1.0)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self) -> bool:
+        if not self.rate:
+            return True
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens < 1:
+                return False
+            self.tokens -= 1
+            return True
+
+
+class SpeculationMetrics():
+    """
+    Speculations used by fallbacks (latency saved) vs. wasted.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.started = 0
+        self.over_budget = 0
+        self.used = 0
+        self.wasted = 0
+        self.cancelled = 0
+        self.failed = 0
+        self.latency_saved = 0.0
+        self.wasted_time = 0.0
+
+    def record_start(
+        self,
+        started: bool
+    ) -> None:
+        with self.lock:
+            if started:
+                self.started += 1
+            else:
+                self.over_budget += 1
+
+    def record_used(
+        self,
+        saved: float,
+        failed: bool
+    ) -> None:
+        with self.lock:
+            self.used += 1
+            self.failed += int(failed)
+            if not failed:
+                self.latency_saved += saved
+
+    def record_wasted(
+        self,
+        cancelled: bool,
+        elapsed: float
+    ) -> None:
+        with self.lock:
+            self.wasted += 1
+            self.cancelled += int(cancelled)
+            self.wasted_time += elapsed
+
+    def get_metrics(self) -> dict:
+        with self.lock:
+            finished = self.used + self.wasted
+            return {
+                "started": self.started,
+                "over_budget": self.over_budget,
+                "used": self.used,
+                "wasted": self.wasted,
+                "cancelled": self.cancelled,
+                "failed": self.failed,
+                "waste_ratio": self.wasted / finished if finished else 0.0,
+                "latency_saved_ms": self.latency_saved * 1000,
+                "avg_latency_saved_ms": self.latency_saved / self.used * 1000 if self.used else 0.0,
+                "wasted_time_ms": self.wasted_time * 1000
+            }
+
+
+class Speculation():
+    """
+    In-flight speculation: future/task plus start and finish times.
+    """
+
+    def __init__(
+        self,
+        start: float
+    ):
+        self.start = start
+        self.finish = None
+        self.failed = False
+        self.handle = None
+
+
+class Speculator():
+    """
+    Runs a speculate function (message, language, id, pii_context) alongside
+    the router.
+
+    Sync functions run on a bounded thread pool (with the caller's context
+    variables, e.g. the tracing span); async functions run as tasks.
+    """
+
+    def __init__(
+        self,
+        speculate_function: Callable[[str, str, str], None | Awaitable[None]],
+        max_per_second: float = SPECULATIVE_MAX_PER_SECOND,
+        workers: int = SPECULATIVE_WORKERS
+    ):
+        self.speculate_function = speculate_function
+        self.budget = SpeculationBudget(max_per_second)
+        self.metrics = SpeculationMetrics()
+        self.executor = None
+        self.executor_lock = threading.Lock()
+        self.workers = workers
+
+    def get_executor(self) -> ThreadPoolExecutor:
+        with self.executor_lock:
+            if self.executor is None:
+                self.executor = ThreadPoolExecutor(
+                    max_workers=self.workers,
+                    thread_name_prefix="speculation"
+                )
+            return self.executor
+
+    def run(
+        self,
+        speculation: Speculation,
+        message: str,
+        language: str,
+        id: str,
+        pii_context: PIIContext = None
+    ) -> None:
+        try:
+            self.speculate_function(message, language, id, pii_context=pii_context)
+        except Exception as e:
+            _logger.warning(f"Speculation failed: {e}")
+            speculation.failed = True
+        speculation.finish = time.perf_counter()
+
+    async def run_async(
+        self,
+        speculation: Speculation,
+        message: str,
+        language: str,
+        id: str,
+        pii_context: PIIContext = None
+    ) -> None:
+        try:
+            await self.speculate_function(message, language, id, pii_context=pii_context)
+        except Exception as e:
+            _logger.warning(f"Speculation failed: {e}")
+            speculation.failed = True
+        speculation.finish = time.perf_counter()
+
+    def acquire(self) -> Speculation | None:
+        started = self.budget.acquire()
+        self.metrics.record_start(started)
+        return Speculation(time.perf_counter()) if started else None
+
+    def start(
+        self,
+        message: str,
+        language: str,
+        id: str,
+        pii_context: PIIContext = None
+    ) -> Speculation | None:
+        """
+        Start speculation on the thread pool (None if over budget).
+        """
+        speculation = self.acquire()
+        if speculation is None:
+            return None
+        context = contextvars.copy_context()
+        speculation.handle = self.get_executor().submit(
+            context.run, self.run, speculation, message, language, id, pii_context
+        )
+        return speculation
+
+    def start_async(
+        self,
+        message: str,
+        language: str,
+        id: str,
+        pii_context: PIIContext = None
+    ) -> Speculation | None:
+        """
+        Start speculation as a task (None if over budget).
+        """
+        speculation = self.acquire()
+        if speculation is None:
+            return None
+        speculation.handle = asyncio.create_task(
+            self.run_async(speculation, message, language, id, pii_context)
+        )
+        return speculation
+
+    def record_used(
+        self,
+        speculation: Speculation,
+        routed: float
+    ) -> None:
+        # Without speculation, the work would have started once routing was done:
+        saved = min(speculation.finish, routed) - speculation.start
+        self.metrics.record_used(saved, speculation.failed)
+
+    def use(
+        self,
+        speculation: Speculation
+    ) -> None:
+        """
+        Wait for speculation before running the fallback.
+        """
+        routed = time.perf_counter()
+        speculation.handle.result()
+        self.record_used(speculation, routed)
+
+    async def use_async(
+        self,
+        speculation: Speculation
+    ) -> None:
+        routed = time.perf_counter()
+        await speculation.handle
+        self.record_used(speculation, routed)
+
+    def discard(
+        self,
+        speculation: Speculation
+    ) -> None:
+        """
+        Cancel speculation (or drop its result) after the router won.
+        """
+        # Pool futures can only be cancelled before they start running:
+        cancelled = speculation.handle.cancel()
+        self.metrics.record_wasted(cancelled, time.perf_counter() - speculation.start)
+
+    def get_metrics(self) -> dict:
+        return self.metrics.get_metrics()
@@ -0,0 +1,262 @@
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT License.
+import os
+import time
+import asyncio
+import logging
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Hashable
+
+"""
+Micro-batching for Azure AI Language (Text Analytics) calls.
+
+Single-document calls from concurrent requests are collected for a short
+window and sent as one multi-document request; each caller gets back
+the result for its own document.
+"""
+
+TA_BATCHING_ENABLED = os.environ.get("TA_BATCHING_ENABLED", "false").lower() == "true"
+TA_BATCH_WINDOW = float(os.environ.get("TA_BATCH_WINDOW_MS", "10")) / 1000
+TA_BATCH_WORKERS = int(os.environ.get("TA_BATCH_WORKERS", "4"))
+
+# Service limits on documents per synchronous request:
+MAX_BATCH_SIZES = {
+    "detect_language": 1000,
+    "recognize_pii_entities": 5
+}
+DEFAULT_MAX_BATCH_SIZE = 5
+
+_logger = logging.getLogger(__name__)
+
+
+def create_batch_key(
+    operation: str,
+    kwargs: dict
+) -> Hashable:
+    """
+    Documents can share a request when operation and options match.
+    """
+    return (operation, tuple(sorted(kwargs.items())))
+
+
+class BatchMetrics():
+    """
+    Request/document counts for a batcher.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.documents = 0
+
+    def record(
+        self,
+        documents: int
+    ) -> None:
+        with self.lock:
+            self.requests += 1
+            self.documents += documents
+
+    def get_metrics(self) -> dict:
+        with self.lock:
+            return {
+                "requests": self.requests,
+                "documents": self.documents,
+                "avg_batch_size": self.documents / self.requests if self.requests else 0.0,
+                "requests_saved": self.documents - self.requests
+            }
+
+
+class TextAnalyticsBatcher():
+    """
+    Micro-batcher for a sync TextAnalyticsClient (thread-safe).
+    """
+
+    def __init__(
+        self,
+        client: Any,
+        window: float = TA_BATCH_WINDOW,
+        max_workers: int = TA_BATCH_WORKERS
+    ):
+        self.client = client
+        self.window = window
+        self.pending = OrderedDict()
+        self.condition = threading.Condition()
+        self.executor = ThreadPoolExecutor(
+            max_workers=max_workers,
+            thread_name_prefix="ta-batch"
+        )
+        self.dispatcher = None
+        self.metrics = BatchMetrics()
+
+    def submit(
+        self,
+        operation: str,
+        document: str,
+        **kwargs
+    ) -> Any:
+        """
+        Run client operation on a single document, batched with others.
+
+        Blocks until the batch completes; returns this document's result.
+        """
+        future = Future()
+        key = create_batch_key(operation, kwargs)
+        max_batch_size = MAX_BATCH_SIZES.get(operation, DEFAULT_MAX_BATCH_SIZE)
+
+        with self.condition:
+            if self.dispatcher is None:
+                self.dispatcher = threading.Thread(
+                    target=self.run,
+                    name="ta-batch-dispatcher",
+                    daemon=True
+                )
+                self.dispatcher.start()
+
+            if key not in self.pending:
+                self.pending[key] = (time.monotonic() + self.window, [])
+            _, batch = self.pending[key]
+            batch.append((document, future))
+
+            if len(batch) >= max_batch_size:
+                # Batch is full, send now:
+                self.pending.pop(key)
+                self.executor.submit(self.dispatch, key, batch)
+            else:
+                self.condition.notify()
+
+        return future.result()
+
+    def run(self) -> None:
+        """
+        Dispatch batches once their window closes (oldest first).
+        """
+        while True:
+            with self.condition:
+                while not self.pending:
+                    self.condition.wait()
+
+                key, (deadline, batch) = next(iter(self.pending.items()))
+                timeout = deadline - time.monotonic()
+                if timeout > 0:
+                    self.condition.wait(timeout)
+                    continue
+                self.pending.pop(key)
+
+            self.executor.submit(self.dispatch, key, batch)
+
+    def dispatch(
+        self,
+        key: Hashable,
+        batch: list
+    ) -> None:
+        """
+        Send batch and route results back to callers.
+        """
+        operation, kwargs = key
+        documents = [document for document, _ in batch]
+        self.metrics.record(len(documents))
+
+        try:
+            results = getattr(self.client, operation)(
+                documents=documents,
+                **dict(kwargs)
+            )
+            for (_, future), result in zip(batch, results):
+                future.set_result(result)
+
+        except Exception as e:
+            _logger.error(f"Batched {operation} failed: {e}")
+            for _, future in batch:
+                future.set_exception(e)
+
+    def get_metrics(self) -> dict:
+        return self.metrics.get_metrics()
+
+
+class AsyncTextAnalyticsBatcher():
+    """
+    Micro-batcher for an async TextAnalyticsClient (single event loop).
+    """
+
+    def __init__(
+        self,
+        client: Any,
+        window: float = TA_BATCH_WINDOW
+    ):
+        self.client = client
+        self.window = window
+        self.pending = dict()
+        self.metrics = BatchMetrics()
+
+    async def submit(
+        self,
+        operation: str,
+        document: str,
+        **kwargs
+    ) -> Any:
+        """
+        Run client operation on a single document, batched with others.
+        """
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        key = create_batch_key(operation, kwargs)
+        max_batch_size = MAX_BATCH_SIZES.get(operation, DEFAULT_MAX_BATCH_SIZE)
+
+        batch = self.pending.get(key)
+        if batch is None:
+            batch = self.pending[key] = []
+            loop.call_later(self.window, self.flush, key, batch)
+        batch.append((document, future))
+
+        if len(batch) >= max_batch_size:
+            # Batch is full, send now:
+            self.flush(key, batch)
+
+        return await future
+
+    def flush(
+        self,
+        key: Hashable,
+        batch: list
+    ) -> None:
+        """
+        Send batch unless it was already sent.
+        """
+        if self.pending.get(key) is not batch:
+            return
+        self.pending.pop(key)
+        asyncio.ensure_future(self.dispatch(key, batch))
+
+    async def dispatch(
+        self,
+        key: Hashable,
+        batch: list
+    ) -> None:
+        """
+        Send batch and route results back to callers.
+        """
+        operation, kwargs = key
+        documents = [document for document, _ in batch]
+        self.metrics.record(len(documents))
+
+        try:
+            results = await getattr(self.client, operation)(
+                documents=documents,
+                **dict(kwargs)
+            )
+            for (_, future), result in zip(batch, results):
+                # Caller may have been cancelled:
+                if not future.done():
+                    future.set_result(result)
+
+        except Exception as e:
+            _logger.error(f"Batched {operation} failed: {e}")
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+
+    def get_metrics(self) -> dict:
+        return self.metrics.get_metrics()
@@ -0,0 +1,171 @@
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT License.
+import os
+import json
+import logging
+import functools
+import threading
+
+"""
+Local token counting and token-budgeted chat history compaction.
+"""
+
+# Default budget for all deployments (0 for no budget):
+AOAI_TOKEN_BUDGET = int(os.environ.get("AOAI_TOKEN_BUDGET", "0"))
+# Per-deployment budgets, e.g. {"gpt-4o-mini": 8000}:
+AOAI_TOKEN_BUDGETS = json.loads(os.environ.get("AOAI_TOKEN_BUDGETS", "{}"))
+AOAI_TOKEN_ENCODING = os.environ.get("AOAI_TOKEN_ENCODING", "o200k_base")
+TOKEN_COUNT_CACHE_SIZE = int(os.environ.get("TOKEN_COUNT_CACHE_SIZE", "4096"))
+# "drop" oldest turns, or "summarize" them into a running summary:
+HISTORY_COMPACTION = os.environ.get("HISTORY_COMPACTION", "drop").lower()
+
+# Chat format overhead per message (role and separators):
+TOKENS_PER_MESSAGE = 3
+
+_logger = logging.getLogger(__name__)
+
+_encoding = None
+_encoding_lock = threading.Lock()
+
+
+def get_token_budget(
+    deployment: str
+) -> int | None:
+    """
+    Get prompt token budget for deployment (None for no budget).
+    """
+    budget = int(AOAI_TOKEN_BUDGETS.get(deployment, AOAI_TOKEN_BUDGET))
+    return budget if budget > 0 else None
+
+
+def get_encoding():
+    """
+    Load tiktoken encoding once (False when unavailable).
+    """
+    global _encoding
+    with _encoding_lock:
+        if _encoding is None:
+            try:
+                import tiktoken
+                _encoding = tiktoken.get_encoding(AOAI_TOKEN_ENCODING)
+            except Exception as e:
+                _logger.warning(f"tiktoken unavailable, approximating token counts: {e}")
+                _encoding = False
+    return _encoding
+
+
+@functools.lru_cache(maxsize=TOKEN_COUNT_CACHE_SIZE)
+def count_text_tokens(
+    text: str
+) -> int:
+    """
+    Count tokens in text (cached).
+    """
+    encoding = get_encoding()
+    if encoding:
+        return len(encoding.encode(text))
+
+    # Roughly 4 characters per token for English text:
+    return len(text) // 4 + 1
+
+
+def count_message_tokens(
+    message: dict
+) -> int:
+    """
+    Count tokens in a chat message.
+    """
+    tokens = TOKENS_PER_MESSAGE
+    for key in ("role", "content", "name"):
+        value = message.get(key)
+        if isinstance(value, str):
+            tokens += count_text_tokens(value)
+
+    for tool_call in message.get("tool_calls") or []:
+        function = tool_call.get("function", {})
+        tokens += count_text_tokens(function.get("name", ""))
+        tokens += count_text_tokens(function.get("arguments", ""))
+
+    return tokens
+
+
+def count_tokens(
+    messages: list[dict]
+) -> int:
+    """
+    Count tokens in chat messages.
+    """
+    return sum(count_message_tokens(m) for m in messages)
+
+
+def split_turns(
+    history: list[dict]
+) -> tuple[list[dict], list[list[dict]]]:
+    """
+    Split history into leading summary messages and turns.
+
+    A turn starts at a user message and includes every following
+    assistant and tool message, so tool calls are kept with their results.
+    """
+    summary = []
+    turns = []
+    for message in history:
+        if message.get("role") == "user" or (turns == [] and message.get("role") != "system"):
+            turns.append([message])
+        elif turns:
+            turns[-1].append(message)
+        else:
+            summary.append(message)
+    return summary, turns
+
+
+def compact_history(
+    history: list[dict],
+    budget: int
+) -> tuple[list[dict], list[dict]]:
+    """
+    Keep the most recent whole turns that fit in budget.
+
+    Returns kept history and dropped messages (including any prior summary,
+    so it can be folded into a new summary).
+    """
+    if count_tokens(history) <= budget:
+        return history, []
+
+    summary, turns = split_turns(history)
+    kept = []
+    used = 0
+    for turn in reversed(turns):
+        tokens = count_tokens(turn)
+        if used + tokens > budget:
+            break
+        kept.insert(0, turn)
+        used += tokens
+
+    dropped = summary + [m for turn in turns[:len(turns) - len(kept)] for m in turn]
+    return [m for turn in kept for m in turn], dropped
+
+
+def create_summary_messages(
+    prompt: str,
+    dropped: list[dict]
+) -> list[dict]:
+    """
+    Create chat messages asking to summarize dropped history.
+    """
+    transcript = "\n".join(
+        f'{m.get("role")}: {m.get("content")}' for m in dropped if m.get("content")
+    )
+    return [
+        {"role": "system", "content": prompt},
+        {"role": "user", "content": transcript}
+    ]
+
+
+def create_summary_message(
+    summary: str
+) -> dict:
+    """
+    Create history message carrying conversation summary.
+    """
+    return {"role": "system", "content": f"Conversation summary: {summary}"}
@@ -0,0 +1,136 @@
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT License.
+import os
+import json
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from utils import Lazy
+
+"""
+Concurrent execution settings and metrics for AOAI tool calls.
+
+Tool calls from one model response run concurrently (a shared bounded
+thread pool for sync clients, tasks for async clients); each call has
+a timeout so one slow runtime cannot stall the turn.
+
+A thread cannot be stopped, so a sync call that times out keeps its
+worker until the runtime returns (bounded by the dependency timeouts in
+resilience). These detached calls are counted in the metrics; while they
+hold all TOOL_CALL_WORKERS, new tool calls queue behind them.
+"""
+
+TOOL_CALL_WORKERS = int(os.environ.get("TOOL_CALL_WORKERS", "16"))
+# Seconds per tool call (0 for none):
+TOOL_CALL_TIMEOUT = float(os.environ.get("TOOL_CALL_TIMEOUT", "10"))
+# Per-tool overrides, e.g. {"get_cqa": 5}:
+TOOL_CALL_TIMEOUTS = json.loads(os.environ.get("TOOL_CALL_TIMEOUTS", "{}"))
+
+
+def get_tool_timeout(
+    name: str
+) -> float | None:
+    """
+    Timeout for tool name (None for no timeout).
+    """
+    timeout = float(TOOL_CALL_TIMEOUTS.get(name, TOOL_CALL_TIMEOUT))
+    return timeout if timeout > 0 else None
+
+
+def create_timeout_response(
+    name: str,
+    timeout: float
+) -> dict:
+    """
+    Tool response for a timed-out call (routed like a runtime failure).
+    """
+    return {
+        "error": f"{name} timed out after {timeout}s"
+    }
+
+
+def create_tool_executor() -> ThreadPoolExecutor:
+    return ThreadPoolExecutor(
+        max_workers=TOOL_CALL_WORKERS,
+        thread_name_prefix="tool-call"
+    )
+
+
+# Shared by sync clients:
+tool_executor = Lazy(create_tool_executor)
+
+
+class ToolCallMetrics():
+    """
+    Per-tool call counts, timeouts and latency.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.tools = {}
+        self.batches = 0
+        self.max_batch_size = 0
+        self.detached = 0
+        self.detached_running = 0
+
+    def record_batch(
+        self,
+        size: int
+    ) -> None:
+        with self.lock:
+            self.batches += 1
+            self.max_batch_size = max(self.max_batch_size, size)
+
+    def record(
+        self,
+        name: str,
+        latency: float,
+        timed_out: bool = False
+    ) -> None:
+        with self.lock:
+            tool = self.tools.setdefault(name, {"calls": 0, "timeouts": 0, "latency": 0.0, "max_latency": 0.0})
+            tool["calls"] += 1
+            tool["timeouts"] += int(timed_out)
+            tool["latency"] += latency
+            tool["max_latency"] = max(tool["max_latency"], latency)
+
+    def record_detached(
+        self,
+        future: Future
+    ) -> None:
+        """
+        Count a timed-out call still running on the tool executor.
+        """
+        with self.lock:
+            self.detached += 1
+            self.detached_running += 1
+        future.add_done_callback(self.finish_detached)
+
+    def finish_detached(
+        self,
+        future: Future
+    ) -> None:
+        with self.lock:
+            self.detached_running -= 1
+
+    def get_metrics(self) -> dict:
+        with self.lock:
+            return {
+                "workers": TOOL_CALL_WORKERS,
+                "batches": self.batches,
+                "max_batch_size": self.max_batch_size,
+                # Timed-out calls left running (each holds a worker until it returns):
+                "detached": self.detached,
+                "detached_running": self.detached_running,
+                "tools": {
+                    name: {
+                        "calls": tool["calls"],
+                        "timeouts": tool["timeouts"],
+                        "avg_ms": tool["latency"] / tool["calls"] * 1000,
+                        "max_ms": tool["max_latency"] * 1000
+                    }
+                    for name, tool in self.tools.items()
+                }
+            }
+
+
+metrics = ToolCallMetrics()
@@ -0,0 +1,531 @@
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT License.
+import os
+import json
+import time
+import bisect
+import logging
+import inspect
+import secrets
+import threading
+import functools
+import contextvars
+from contextlib import contextmanager
+from typing import Any, AsyncIterator, Callable, Iterator
+
+try:
+    from opentelemetry import trace as otel_trace
+    from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
+    from opentelemetry.sdk.resources import Resource
+    from opentelemetry.sdk.trace import TracerProvider
+    from opentelemetry.sdk.trace.export import BatchSpanProcessor
+except ImportError:
+    otel_trace = None
+
+"""
+Per-stage tracing spans and latency histograms.
+
+Pipeline stages (utterance extraction, language detection, PII, routing,
+retrieval, completions) run inside spans carrying attributes such as
+route, confidence, token counts and HTTP attempts. Every finished span
+is recorded in its stage's latency histogram (see /metrics) and passed
+to the configured exporter: a local JSON lines file, or OTLP (requires
+the opentelemetry-sdk and opentelemetry-exporter-otlp packages; the
+endpoint comes from OTEL_EXPORTER_OTLP_ENDPOINT).
+"""
+
+# none | json | otlp:
+TRACING_EXPORTER = os.environ.get("TRACING_EXPORTER", "none").lower()
+TRACING_JSON_PATH = os.environ.get("TRACING_JSON_PATH", "traces.jsonl")
+TRACING_SERVICE_NAME = os.environ.get("TRACING_SERVICE_NAME", "conversational-agent")
+# Histogram bucket upper bounds (milliseconds):
+LATENCY_BUCKETS_MS = [float(b) for b in os.environ.get(
+    "LATENCY_BUCKETS_MS", "5,10,25,50,100,250,500,1000,2500,5000,10000,30000"
+).split(",")]
+
+_logger = logging.getLogger(__name__)
+_current_span = contextvars.ContextVar("current_span", default=None)
+
+
+class Span():
+    """
+    Timed pipeline stage with attributes (child of the current span).
+    """
+
+    def __init__(
+        self,
+        name: str,
+        parent: "Span" = None,
+        attributes: dict = None
+    ):
+        self.name = name
+        self.parent = parent
+        self.trace_id = parent.trace_id if parent else secrets.token_hex(16)
+        self.span_id = secrets.token_hex(8)
+        self.attributes = dict(attributes or {})
+        self.start_time = time.time()
+        self.start = time.perf_counter()
+        self.duration = None
+        self.error = None
+        # Exporter state (e.g. the OpenTelemetry span):
+        self.handle = None
+
+    def set(
+        self,
+        **attributes: Any
+    ) -> None:
+        """
+        Set attributes (None values are skipped).
+        """
+        self.attributes.update({k: v for k, v in attributes.items() if v is not None})
+
+    def increment(
+        self,
+        attribute: str,
+        amount: int = 1
+    ) -> None:
+        self.attributes[attribute] = self.attributes.get(attribute, 0) + amount
+
+    def to_dict(self) -> dict:
+        return {
+            "name": self.name,
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent.span_id if self.parent else None,
+            "start_time": self.start_time,
+            "duration_ms": self.duration * 1000 if self.duration is not None else None,
+            "attributes": self.attributes,
+            "error": self.error
+        }
+
+
+class LatencyHistogram():
+    """
+    Cumulative latency histogram (fixed millisecond buckets).
+    """
+
+    def __init__(
+        self,
+        buckets: list[float]
+    ):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+        self.errors = 0
+
+    def record(
+        self,
+        milliseconds: float,
+        error: bool
+    ) -> None:
+        self.counts[bisect.bisect_left(self.buckets, milliseconds)] += 1
+        self.count += 1
+        self.sum += milliseconds
+        self.max = max(self.max, milliseconds)
+        self.errors += int(error)
+
+    def quantile(
+        self,
+        q: float
+    ) -> float | None:
+        """
+        Estimated quantile (upper bound of the bucket containing it,
+        the maximum beyond the last bucket).
+        """
+        if not self.count:
+            return None
+        rank = q * self.count
+        cumulative = 0
+        for bound, count in zip(self.buckets, self.counts):
+            cumulative += count
+            if cumulative >= rank:
+                return min(bound, self.max)
+        return self.max
+
+    def get_metrics(self) -> dict:
+        # (upper bound, cumulative count) pairs, in bound order:
+        cumulative = 0
+        buckets = []
+        for bound, count in zip(self.buckets + [float("inf")], self.counts):
+            cumulative += count
+            buckets.append(["+Inf" if bound == float("inf") else f"{bound:g}", cumulative])
+        return {
+            "count": self.count,
+            "errors": self.errors,
+            "avg_ms": self.sum / self.count if self.count else 0.0,
+            "max_ms": self.max,
+            "p50_ms": self.quantile(0.5),
+            "p95_ms": self.quantile(0.95),
+            "p99_ms": self.quantile(0.99),
+            "buckets_ms": buckets
+        }
+
+
+class StageHistograms():
+    """
+    Latency histogram per span name.
+    """
+
+    def __init__(
+        self,
+        buckets: list[float] = LATENCY_BUCKETS_MS
+    ):
+        self.lock = threading.Lock()
+        self.buckets = buckets
+        self.stages = {}
+
+    def record(
+        self,
+        span: Span
+    ) -> None:
+        with self.lock:
+            histogram = self.stages.get(span.name)
+            if histogram is None:
+                histogram = self.stages[span.name] = LatencyHistogram(self.buckets)
+            histogram.record(span.duration * 1000, span.error is not None)
+
+    def get_metrics(self) -> dict:
+        with self.lock:
+            return {name: histogram.get_metrics() for name, histogram in sorted(self.stages.items())}
+
+    def reset(self) -> None:
+        with self.lock:
+            self.stages = {}
+
+
+class JsonFileExporter():
+    """
+    Append finished spans to a JSON lines file.
+    """
+
+    def __init__(
+        self,
+        path: str
+    ):
+        self.lock = threading.Lock()
+        self.fp = open(path, "a")
+
+    def start(
+        self,
+        span: Span
+    ) -> None:
+        pass
+
+    def end(
+        self,
+        span: Span
+    ) -> None:
+        line = json.dumps(span.to_dict(), default=str)
+        with self.lock:
+            self.fp.write(line + "\n")
+            self.fp.flush()
+
+
+class OtlpExporter():
+    """
+    Mirror spans as OpenTelemetry spans, batched to an OTLP endpoint.
+    """
+
+    def __init__(
+        self,
+        service_name: str = TRACING_SERVICE_NAME
+    ):
+        if otel_trace is None:
+            raise ImportError("TRACING_EXPORTER=otlp requires opentelemetry-sdk and opentelemetry-exporter-otlp")
+        provider = TracerProvider(resource=Resource.create({"service.name": service_name}))
+        provider.add_span_processor(BatchSpanProcessor(OTLPSpanExporter()))
+        self.tracer = provider.get_tracer(__name__)
+
+    def start(
+        self,
+        span: Span
+    ) -> None:
+        context = None
+        if span.parent is not None and span.parent.handle is not None:
+            context = otel_trace.set_span_in_context(span.parent.handle)
+        span.handle = self.tracer.start_span(
+            span.name,
+            context=context,
+            start_time=int(span.start_time * 1e9)
+        )
+
+    def end(
+        self,
+        span: Span
+    ) -> None:
+        for key, value in span.attributes.items():
+            span.handle.set_attribute(key, value if isinstance(value, (str, bool, int, float)) else str(value))
+        if span.error is not None:
+            span.handle.set_status(otel_trace.Status(otel_trace.StatusCode.ERROR, span.error))
+        span.handle.end(end_time=int((span.start_time + span.duration) * 1e9))
+
+
+def create_exporter(
+    exporter: str = TRACING_EXPORTER
+) -> JsonFileExporter | OtlpExporter | None:
+    if exporter == "json":
+        return JsonFileExporter(TRACING_JSON_PATH)
+    if exporter == "otlp":
+        return OtlpExporter()
+    if exporter != "none":
+        raise ValueError(f"Unsupported tracing exporter: {exporter}")
+    return None
+
+
+histograms = StageHistograms()
+_exporter = create_exporter()
+
+
+def set_exporter(
+    exporter: Any
+) -> None:
+    """
+    Replace span exporter (object with start(span) and end(span); None to disable).
+    """
+    global _exporter
+    _exporter = exporter
+
+
+def get_current_span() -> Span | None:
+    return _current_span.get()
+
+
+def set_attributes(
+    **attributes: Any
+) -> None:
+    """
+    Set attributes on the current span (if any).
+    """
+    span = _current_span.get()
+    if span is not None:
+        span.set(**attributes)
+
+
+def increment(
+    attribute: str,
+    amount: int = 1
+) -> None:
+    """
+    Increment a counter attribute on the current span (if any).
+    """
+    span = _current_span.get()
+    if span is not None:
+        span.increment(attribute, amount)
+
+
+def set_error(
+    error: BaseException | str
+) -> None:
+    """
+    Mark the current span failed (for errors handled without raising).
+    """
+    span = _current_span.get()
+    if span is not None:
+        span.error = error if isinstance(error, str) else f"{type(error).__name__}: {error}"
+
+
+def set_result(
+    result: dict
+) -> dict:
+    """
+    Set routing result attributes (route, intent, confidence, error) on the current span.
+    """
+    error = result.get("error")
+    set_attributes(
+        route={"clu_result": "clu", "cqa_result": "cqa"}.get(result.get("kind")),
+        intent=result.get("intent"),
+        confidence=result.get("confidence"),
+        result_error=str(error) if error is not None else None
+    )
+    return result
+
+
+def start_span(
+    name: str,
+    attributes: dict,
+    parent: Span = None
+) -> tuple[Span, Any]:
+    """
+    Start a child of parent (default: the current span) without making it
+    current; returns it with its exporter.
+    """
+    current = Span(name, parent or _current_span.get(), attributes)
+    exporter = _exporter
+    if exporter is not None:
+        exporter.start(current)
+    return current, exporter
+
+
+def end_span(
+    current: Span,
+    exporter: Any
+) -> None:
+    current.duration = time.perf_counter() - current.start
+    histograms.record(current)
+    if exporter is not None:
+        try:
+            exporter.end(current)
+        except Exception as e:
+            _logger.warning(f"Span export failed: {e}")
+
+
+@contextmanager
+def span(
+    name: str,
+    **attributes: Any
+) -> Iterator[Span]:
+    """
+    Run the enclosed block as a span (also across awaits in one task).
+    """
+    current, exporter = start_span(name, attributes)
+    token = _current_span.set(current)
+    try:
+        yield current
+    except BaseException as e:
+        current.error = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        _current_span.reset(token)
+        end_span(current, exporter)
+
+
+def traced_iterator(
+    name: str,
+    iterator: Iterator,
+    **attributes: Any
+) -> Iterator:
+    """
+    Run the consumption of a lazy iterator (e.g. a stream) as a span.
+
+    The span (a child of the span current on creation) starts at the first
+    item requested and ends when the iterator is exhausted or closed; it is
+    current only while an item is produced.
+    """
+    return _traced_iterator(name, iterator, attributes, _current_span.get())
+
+
+def _traced_iterator(
+    name: str,
+    iterator: Iterator,
+    attributes: dict,
+    parent: Span | None
+) -> Iterator:
+    current = exporter = None
+    try:
+        while True:
+            if current is None:
+                current, exporter = start_span(name, attributes, parent)
+            token = _current_span.set(current)
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+            finally:
+                _current_span.reset(token)
+            yield item
+    except GeneratorExit:
+        raise
+    except BaseException as e:
+        current.error = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        if current is not None:
+            end_span(current, exporter)
+
+
+def traced_async_iterator(
+    name: str,
+    iterator: AsyncIterator,
+    **attributes: Any
+) -> AsyncIterator:
+    """
+    Run the consumption of a lazy async iterator as a span (see traced_iterator).
+    """
+    return _traced_async_iterator(name, iterator, attributes, _current_span.get())
+
+
+async def _traced_async_iterator(
+    name: str,
+    iterator: AsyncIterator,
+    attributes: dict,
+    parent: Span | None
+) -> AsyncIterator:
+    current = exporter = None
+    try:
+        while True:
+            if current is None:
+                current, exporter = start_span(name, attributes, parent)
+            token = _current_span.set(current)
+            try:
+                item = await iterator.__anext__()
+            except StopAsyncIteration:
+                return
+            finally:
+                _current_span.reset(token)
+            yield item
+    except GeneratorExit:
+        raise
+    except BaseException as e:
+        current.error = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        if current is not None:
+            end_span(current, exporter)
+
+
+def traced(
+    name: str
+) -> Callable[[Callable], Callable]:
+    """
+    Decorator running each call of a sync or async function as a span.
+    """
+    def decorate(function: Callable) -> Callable:
+        if inspect.iscoroutinefunction(function):
+            @functools.wraps(function)
+            async def async_wrapper(*args, **kwargs):
+                with span(name):
+                    return await function(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return function(*args, **kwargs)
+        return wrapper
+
+    return decorate
+
+
+def get_metrics() -> dict:
+    """
+    Latency histograms per stage.
+    """
+    return {
+        "exporter": TRACING_EXPORTER,
+        "stages": histograms.get_metrics()
+    }
+
+
+def format_prometheus() -> str:
+    """
+    Stage latency histograms in the Prometheus text format.
+    """
+    stages = histograms.get_metrics()
+    lines = [
+        "# HELP stage_latency_ms Pipeline stage latency in milliseconds.",
+        "# TYPE stage_latency_ms histogram"
+    ]
+    for name, histogram in stages.items():
+        for bound, count in histogram["buckets_ms"]:
+            lines.append(f'stage_latency_ms_bucket{{stage="{name}",le="{bound}"}} {count}')
+        lines.append(f'stage_latency_ms_sum{{stage="{name}"}} {histogram["avg_ms"] * histogram["count"]}')
+        lines.append(f'stage_latency_ms_count{{stage="{name}"}} {histogram["count"]}')
+    lines += [
+        "# HELP stage_errors_total Pipeline stage errors.",
+        "# TYPE stage_errors_total counter"
+    ]
+    for name, histogram in stages.items():
+        lines.append(f'stage_errors_total{{stage="{name}"}} {histogram["errors"]}')
+    return "\n".join(lines) + "\n"
@@ -1,12 +1,57 @@
 # Copyright (c) Microsoft Corporation.
 # Licensed under the MIT License.
 import os
+import time
 import uuid
-from typing import Callable
+import inspect
+import logging
+import threading
+from typing import Awaitable, Callable
 from azure.ai.textanalytics import TextAnalyticsClient
+from azure.ai.textanalytics.aio import TextAnalyticsClient as AsyncTextAnalyticsClient
+from cache import TTLCache, normalize_text
+from client_registry import get_credential, get_credential_async, get_transport, get_transport_async
+from intent_classifier import ClassifierMetrics, create_intent_classifier
+from pii_redacter import PIIContext
+from router.function_calling_router import FUNCTION_CALLING_MODE, get_snapshot_metrics
+from router.router_cache import create_router_cache
 from router.router_type import RouterType
-from router.router_utils import create_router
-from utils import get_azure_credential
+from router.router_utils import create_router, create_async_router, create_merged_router
+from router import triage_agent_router
+from speculation import SPECULATIVE_ROUTING_ENABLED, Speculator
+import tool_calls
+import tracing
+from ta_batcher import TA_BATCHING_ENABLED, AsyncTextAnalyticsBatcher, TextAnalyticsBatcher
+
+try:
+    import langdetect
+    langdetect.DetectorFactory.seed = 0
+except ImportError:
+    langdetect = None
+
+# remote | conversation (reuse conversation language) | fixed | local:
+LANGUAGE_DETECTION_MODE = os.environ.get("LANGUAGE_DETECTION_MODE", "remote").lower()
+LANGUAGE_FIXED = os.environ.get("LANGUAGE_FIXED", "en")
+LANGUAGE_CACHE_SIZE = int(os.environ.get("LANGUAGE_CACHE_SIZE", "4096"))
+LANGUAGE_CACHE_TTL = float(os.environ.get("LANGUAGE_CACHE_TTL", "3600"))
+# Local detection is unreliable on very short text:
+LOCAL_DETECTION_MIN_LENGTH = 20
+
+_logger = logging.getLogger(__name__)
+
+
+def detect_language_locally(
+    text: str
+) -> str | None:
+    """
+    Detect language in-process (None when unavailable or unsure).
+    """
+    if langdetect is None or len(text) < LOCAL_DETECTION_MIN_LENGTH:
+        return None
+    try:
+        return langdetect.detect(text).split("-")[0]
+    except langdetect.LangDetectException:
+        return None
 
 
 class UnifiedConversationOrchestrator():
@@ -19,74 +64,456 @@ class UnifiedConversationOrchestrator():
     def __init__(
         self,
         router_type: RouterType,
-        fallback_function: Callable[[str, str, str], dict]
+        fallback_function: Callable[[str, str, str], dict | Awaitable[dict]],
+        use_async: bool = False,
+        speculate_function: Callable[[str, str, str], None | Awaitable[None]] = None
     ):
         """
         Initialize orchestrator: create internal TA client and router.
+
+        With use_async, clients and router are async and only
+        orchestrate_async may be used. speculate_function (e.g. RAG
+        retrieval) runs alongside the router when speculative routing
+        is enabled.
         """
-        self.ta_client = TextAnalyticsClient(
-            endpoint=os.environ.get("LANGUAGE_ENDPOINT"),
-            credential=get_azure_credential()
-        )
+        self.use_async = use_async
+        if use_async:
+            self.ta_client = AsyncTextAnalyticsClient(
+                endpoint=os.environ.get("LANGUAGE_ENDPOINT"),
+                credential=get_credential_async(),
+                transport=get_transport_async()
+            )
+        else:
+            self.ta_client = TextAnalyticsClient(
+                endpoint=os.environ.get("LANGUAGE_ENDPOINT"),
+                credential=get_credential(),
+                transport=get_transport()
+            )
 
-        # Router is Callable[[str, str, str], dict]:
+        # Batch concurrent language detection calls:
+        self.ta_batcher = None
+        if TA_BATCHING_ENABLED:
+            batcher_type = AsyncTextAnalyticsBatcher if use_async else TextAnalyticsBatcher
+            self.ta_batcher = batcher_type(self.ta_client)
+
+        # Router is Callable[[str, str, str], dict] (or awaitable dict):
         self.router_type = router_type
-        self.router = create_router(
-            router_type=self.router_type
-        )
+        self.router_cache = create_router_cache(router_type)
+        # Merged mode: one completion extracts and routes all utterances (see route_message):
+        self.merged_routing = router_type == RouterType.FUNCTION_CALLING and FUNCTION_CALLING_MODE == "merged"
+        self.merged_router = None
+        if self.merged_routing:
+            self.router = None
+            self.merged_router = create_merged_router(use_async=use_async)
+        elif use_async:
+            self.router = create_async_router(
+                router_type=self.router_type,
+                cache=self.router_cache
+            )
+        else:
+            self.router = create_router(
+                router_type=self.router_type,
+                cache=self.router_cache
+            )
+
+        # Local pre-classifier (skips the router when confident):
+        self.intent_classifier = create_intent_classifier(router_type)
+        self.classifier_metrics = ClassifierMetrics()
 
         self.fallback_function = fallback_function
 
+        # Speculative fallback work (pointless without a router to race):
+        self.speculator = None
+        if SPECULATIVE_ROUTING_ENABLED and speculate_function is not None and router_type != RouterType.BYPASS:
+            self.speculator = Speculator(speculate_function)
+
+        # Language detection:
+        self.language_mode = LANGUAGE_DETECTION_MODE
+        self.language_cache = TTLCache(
+            maxsize=LANGUAGE_CACHE_SIZE,
+            ttl=LANGUAGE_CACHE_TTL
+        )
+        self.conversation_languages = TTLCache(
+            maxsize=LANGUAGE_CACHE_SIZE,
+            ttl=LANGUAGE_CACHE_TTL
+        )
+        self.local_detections = 0
+        self.local_detections_lock = threading.Lock()
+        if self.language_mode == "local" and langdetect is None:
+            _logger.warning("langdetect not installed, using remote language detection")
+
+    def lookup_language(
+        self,
+        text: str,
+        id: str = None
+    ) -> str | None:
+        """
+        Resolve language without a remote call (None if unknown).
+        """
+        language = None
+        if self.language_mode == "fixed":
+            language = LANGUAGE_FIXED
+        elif self.language_mode == "local":
+            language = detect_language_locally(text)
+
+        if language is not None:
+            with self.local_detections_lock:
+                self.local_detections += 1
+            return language
+
+        if self.language_mode == "conversation" and id is not None:
+            language = self.conversation_languages.get(id)
+            if language is not None:
+                return language
+
+        return self.language_cache.get(normalize_text(text))
+
+    def store_language(
+        self,
+        text: str,
+        id: str,
+        language: str,
+        latency: float
+    ) -> None:
+        """
+        Cache remotely detected language by text and conversation.
+        """
+        self.language_cache.set(normalize_text(text), language, latency=latency)
+        if id is not None:
+            self.conversation_languages.set(id, language)
+
+    def get_language_metrics(self) -> dict:
+        """
+        Get language detection hit rate and estimated latency saved.
+        """
+        text_metrics = self.language_cache.get_metrics()
+        conversation_metrics = self.conversation_languages.get_metrics()
+        remote_calls = text_metrics["misses"]
+        skipped = text_metrics["hits"] + conversation_metrics["hits"] + self.local_detections
+        lookups = skipped + remote_calls
+
+        return {
+            "mode": self.language_mode,
+            "remote_calls": remote_calls,
+            "skipped_calls": skipped,
+            "hit_ratio": skipped / lookups if lookups else 0.0,
+            "avg_remote_latency_ms": text_metrics["avg_miss_latency_ms"],
+            "latency_saved_ms": skipped * text_metrics["avg_miss_latency_ms"],
+            "text_cache": text_metrics,
+            "conversation_cache": conversation_metrics,
+            "batching": self.ta_batcher.get_metrics() if self.ta_batcher else None
+        }
+
+    def get_router_metrics(self) -> dict:
+        """
+        Get router cache, local pre-classifier, speculation, tool-call,
+        project snapshot and triage agent metrics.
+        """
+        return {
+            "router_type": self.router_type.name,
+            "cache": self.router_cache.get_metrics() if self.router_cache else None,
+            "local_classifier": self.classifier_metrics.get_metrics() if self.intent_classifier else None,
+            "speculation": self.speculator.get_metrics() if self.speculator else None,
+            "tool_calls": tool_calls.metrics.get_metrics(),
+            "project_snapshot": get_snapshot_metrics(),
+            "triage_agent": triage_agent_router.metrics.get_metrics() if self.router_type == RouterType.TRIAGE_AGENT else None
+        }
+
+    def invalidate_router_cache(self) -> None:
+        if self.router_cache is not None:
+            self.router_cache.invalidate()
+
+    def classify_locally(
+        self,
+        message: str,
+        language: str
+    ) -> dict | None:
+        """
+        Local routing result if the pre-classifier is confident, else None.
+        """
+        if self.intent_classifier is None:
+            return None
+        routing_result = self.intent_classifier.classify(message, language)
+        self.classifier_metrics.record(routing_result)
+        return routing_result
+
+    @tracing.traced("detect_language")
     def detect_language(
         self,
-        text: str
+        text: str,
+        id: str = None
     ) -> str:
         """
         Detect language of input text using Azure AI Lanuage.
+
+        Cached by text and conversation id; see LANGUAGE_DETECTION_MODE.
         """
-        result = self.ta_client.detect_language(documents=[text])
-        language = result[0].primary_language.iso6391_name
+        language = self.lookup_language(text=text, id=id)
+        tracing.set_attributes(mode=self.language_mode, cached=language is not None)
+        if language is not None:
+            tracing.set_attributes(language=language)
+            return language
+
+        start = time.perf_counter()
+        if self.ta_batcher is not None:
+            result = self.ta_batcher.submit("detect_language", text)
+        else:
+            result = self.ta_client.detect_language(documents=[text])[0]
+        language = result.primary_language.iso6391_name
+        tracing.set_attributes(language=language)
+        self.store_language(text, id, language, time.perf_counter() - start)
         return language
 
-    def orchestrate(
+    @tracing.traced("detect_language")
+    async def detect_language_async(
         self,
-        message: str,
+        text: str,
         id: str = None
+    ) -> str:
+        """
+        Detect language of input text using Azure AI Lanuage (async).
+
+        Cached by text and conversation id; see LANGUAGE_DETECTION_MODE.
+        """
+        language = self.lookup_language(text=text, id=id)
+        tracing.set_attributes(mode=self.language_mode, cached=language is not None)
+        if language is not None:
+            tracing.set_attributes(language=language)
+            return language
+
+        start = time.perf_counter()
+        if self.ta_batcher is not None:
+            result = await self.ta_batcher.submit("detect_language", text)
+        else:
+            result = (await self.ta_client.detect_language(documents=[text]))[0]
+        language = result.primary_language.iso6391_name
+        tracing.set_attributes(language=language)
+        self.store_language(text, id, language, time.perf_counter() - start)
+        return language
+
+    def create_response(
+        self,
+        message: str,
+        id: str,
+        routing_result: dict
     ) -> dict:
         """
-        Orchestrate message with registered router/fallback-function.
+        Create orchestration response for a successful route.
         """
-        if id is None:
-            id = str(uuid.uuid4())
+        orchestration_response = {
+            "id": id,
+            "query": message,
+            "router_type": self.router_type.name
+        }
 
-        language = self.detect_language(text=message)
+        routing_result.pop("error")
+        route = "clu" if routing_result["kind"] == "clu_result" else "cqa"
+        orchestration_response["route"] = route
+        tracing.set_attributes(route=route)
+        orchestration_response["result"] = routing_result
 
-        # Router expects a message, language, and id:
-        routing_result = self.router(message, language, id)
+        return orchestration_response
 
+    def create_fallback_response(
+        self,
+        message: str,
+        id: str,
+        routing_result: dict,
+        fallback_result: str
+    ) -> dict:
+        """
+        Create orchestration response for a fallback route.
+        """
         orchestration_response = {
             "id": id,
             "query": message,
-            "router_type": self.router_type.name
+            "router_type": self.router_type.name,
+            "route": "fallback",
+            "result": fallback_result
         }
 
+        if routing_result is not None:
+            orchestration_response["attempted_route"] = routing_result
+
+        return orchestration_response
+
+    def route_message(
+        self,
+        message: str,
+        id: str,
+        pii_context: PIIContext = None
+    ) -> list[tuple[str, dict]] | None:
+        """
+        Split and route a message with the merged router.
+
+        Returns (utterance, routing result) pairs, or None on harmful content.
+        pii_context is the request's PII context (None if not enabled).
+        """
+        language = self.detect_language(text=message, id=id)
+        with tracing.span("route", router_type=self.router_type.name, merged=True):
+            routing_results = self.merged_router(message, language, id, pii_context=pii_context)
+        if routing_results is None:
+            return None
+        return [(result.pop("utterance"), result) for result in routing_results]
+
+    async def route_message_async(
+        self,
+        message: str,
+        id: str,
+        pii_context: PIIContext = None
+    ) -> list[tuple[str, dict]] | None:
+        """
+        Split and route a message with the merged router (async).
+        """
+        language = await self.detect_language_async(text=message, id=id)
+        with tracing.span("route", router_type=self.router_type.name, merged=True):
+            routing_results = await self.merged_router(message, language, id, pii_context=pii_context)
+        if routing_results is None:
+            return None
+        return [(result.pop("utterance"), result) for result in routing_results]
+
+    @tracing.traced("orchestrate")
+    def orchestrate(
+        self,
+        message: str,
+        id: str = None,
+        fallback_function: Callable = None,
+        routing_result: dict = None,
+        pii_context: PIIContext = None
+    ) -> dict:
+        """
+        Orchestrate message with registered router/fallback-function.
+
+        fallback_function overrides the registered one (e.g. streaming);
+        routing_result skips routing (e.g. from route_message).
+        pii_context is the request's PII context, passed to the router,
+        speculation and fallback (None if not enabled).
+        """
+        if id is None:
+            id = str(uuid.uuid4())
+        fallback_function = fallback_function or self.fallback_function
+
+        language = self.detect_language(text=message, id=id)
+
+        # Router expects a message, language, id, and PII context:
+        speculation = None
+        if routing_result is None:
+            routing_result = self.classify_locally(message, language)
+            tracing.set_attributes(local_classifier=routing_result is not None)
+        if routing_result is None:
+            if self.speculator is not None:
+                speculation = self.speculator.start(message, language, id, pii_context=pii_context)
+            with tracing.span("route", router_type=self.router_type.name):
+                routing_result = self.router(message, language, id, pii_context=pii_context)
+                if routing_result is not None:
+                    tracing.set_result(routing_result)
+
         if routing_result is None or routing_result["error"] is not None:
-            # Fallback-function expects a message, language, and message id:
-            fallback_result = self.fallback_function(
-                message,
-                language,
-                id)
+            if speculation is not None:
+                self.speculator.use(speculation)
 
-            orchestration_response["route"] = "fallback"
-            orchestration_response["result"] = fallback_result
+            # Fallback-function expects a message, language, message id, and PII context:
+            tracing.set_attributes(route="fallback")
+            if inspect.isgeneratorfunction(fallback_function):
+                # Streamed: the span covers consuming the stream:
+                fallback_result = tracing.traced_iterator(
+                    "fallback",
+                    fallback_function(message, language, id, pii_context=pii_context),
+                    streamed=True
+                )
+            else:
+                with tracing.span("fallback"):
+                    fallback_result = fallback_function(
+                        message,
+                        language,
+                        id,
+                        pii_context=pii_context)
 
-            if routing_result is not None:
-                orchestration_response["attempted_route"] = routing_result
+            return self.create_fallback_response(
+                message=message,
+                id=id,
+                routing_result=routing_result,
+                fallback_result=fallback_result
+            )
 
-        else:
-            routing_result.pop("error")
-            route = "clu" if routing_result["kind"] == "clu_result" else "cqa"
-            orchestration_response["route"] = route
-            orchestration_response["result"] = routing_result
+        if speculation is not None:
+            self.speculator.discard(speculation)
 
-        return orchestration_response
+        return self.create_response(
+            message=message,
+            id=id,
+            routing_result=routing_result
+        )
+
+    @tracing.traced("orchestrate")
+    async def orchestrate_async(
+        self,
+        message: str,
+        id: str = None,
+        fallback_function: Callable = None,
+        routing_result: dict = None,
+        pii_context: PIIContext = None
+    ) -> dict:
+        """
+        Orchestrate message with registered async router/fallback-function.
+
+        fallback_function overrides the registered one (e.g. streaming);
+        routing_result skips routing (e.g. from route_message_async).
+        pii_context is the request's PII context, passed to the router,
+        speculation and fallback (None if not enabled).
+        """
+        if id is None:
+            id = str(uuid.uuid4())
+        fallback_function = fallback_function or self.fallback_function
+
+        language = await self.detect_language_async(text=message, id=id)
+
+        # Router expects a message, language, id, and PII context:
+        speculation = None
+        if routing_result is None:
+            routing_result = self.classify_locally(message, language)
+            tracing.set_attributes(local_classifier=routing_result is not None)
+        if routing_result is None:
+            if self.speculator is not None:
+                speculation = self.speculator.start_async(message, language, id, pii_context=pii_context)
+            with tracing.span("route", router_type=self.router_type.name):
+                routing_result = await self.router(message, language, id, pii_context=pii_context)
+                if routing_result is not None:
+                    tracing.set_result(routing_result)
+
+        if routing_result is None or routing_result["error"] is not None:
+            if speculation is not None:
+                await self.speculator.use_async(speculation)
+
+            # Fallback-function expects a message, language, message id, and PII context:
+            tracing.set_attributes(route="fallback")
+            if inspect.isasyncgenfunction(fallback_function):
+                # Streamed: the span covers consuming the stream:
+                fallback_result = tracing.traced_async_iterator(
+                    "fallback",
+                    fallback_function(message, language, id, pii_context=pii_context),
+                    streamed=True
+                )
+            else:
+                with tracing.span("fallback"):
+                    fallback_result = await fallback_function(
+                        message,
+                        language,
+                        id,
+                        pii_context=pii_context)
+
+            return self.create_fallback_response(
+                message=message,
+                id=id,
+                routing_result=routing_result,
+                fallback_result=fallback_result
+            )
+
+        if speculation is not None:
+            self.speculator.discard(speculation)
+
+        return self.create_response(
+            message=message,
+            id=id,
+            routing_result=routing_result
+        )
@@ -1,7 +1,14 @@
 # Copyright (c) Microsoft Corporation.
 # Licensed under the MIT License.
 import os
+import asyncio
+import threading
+import contextlib
+import contextvars
+from typing import Any, AsyncIterator, Callable, Coroutine, Iterator
 from azure.identity import DefaultAzureCredential, ManagedIdentityCredential
+from azure.identity.aio import DefaultAzureCredential as AsyncDefaultAzureCredential
+from azure.identity.aio import ManagedIdentityCredential as AsyncManagedIdentityCredential
 
 
 def get_azure_credential():
@@ -14,3 +21,125 @@ def get_azure_credential():
         )
 
     return DefaultAzureCredential()
+
+
+def get_azure_credential_async():
+    use_mi_auth = os.environ.get('USE_MI_AUTH', 'false').lower() == 'true'
+
+    if use_mi_auth:
+        mi_client_id = os.environ['MI_CLIENT_ID']
+        return AsyncManagedIdentityCredential(
+            client_id=mi_client_id
+        )
+
+    return AsyncDefaultAzureCredential()
+
+
+_event_loop = None
+_event_loop_lock = threading.Lock()
+
+
+def get_event_loop() -> asyncio.AbstractEventLoop:
+    """
+    Get background event loop, starting it on first use.
+
+    Async clients bind their connection pools to a single loop,
+    so all async work is submitted to this one long-lived loop.
+    """
+    global _event_loop
+    with _event_loop_lock:
+        if _event_loop is None:
+            _event_loop = asyncio.new_event_loop()
+            thread = threading.Thread(
+                target=_event_loop.run_forever,
+                name="async-pipeline",
+                daemon=True
+            )
+            thread.start()
+    return _event_loop
+
+
+def run_coroutine(
+    coro: Coroutine[Any, Any, Any]
+) -> Any:
+    """
+    Run coroutine on background event loop and wait for its result.
+
+    The coroutine runs in a copy of the caller's context (e.g. its tracing span).
+    """
+    future = contextvars.copy_context().run(asyncio.run_coroutine_threadsafe, coro, get_event_loop())
+    return future.result()
+
+
+def iterate_async(
+    iterator: AsyncIterator[Any],
+    maxsize: int = 64
+) -> Iterator[Any]:
+    """
+    Iterate async iterator on background event loop from sync code.
+
+    At most maxsize items are buffered ahead of the consumer; closing
+    the returned iterator (e.g. when a streaming client disconnects)
+    cancels the async iteration.
+    """
+    loop = get_event_loop()
+    items = asyncio.Queue(maxsize=maxsize)
+    end = object()
+
+    async def pump() -> None:
+        try:
+            # Closed on cancellation too, so the iterator's cleanup runs:
+            async with contextlib.aclosing(iterator):
+                async for item in iterator:
+                    await items.put(item)
+        except Exception as e:
+            await items.put(e)
+        await items.put(end)
+
+    future = contextvars.copy_context().run(asyncio.run_coroutine_threadsafe, pump(), loop)
+    try:
+        while True:
+            item = asyncio.run_coroutine_threadsafe(items.get(), loop).result()
+            if item is end:
+                return
+            if isinstance(item, Exception):
+                raise item
+            yield item
+    finally:
+        future.cancel()
+
+
+class Lazy():
+    """
+    Value created by factory on first use, once per process.
+
+    Lets each server worker build its own clients after fork.
+    """
+
+    def __init__(
+        self,
+        factory: Callable[[], Any]
+    ):
+        self.factory = factory
+        self.value = None
+        self.initialized = False
+        self.lock = threading.Lock()
+
+    def get(self) -> Any:
+        if not self.initialized:
+            with self.lock:
+                if not self.initialized:
+                    self.value = self.factory()
+                    self.initialized = True
+        return self.value
+
+    def set(
+        self,
+        value: Any
+    ) -> None:
+        """
+        Override value (e.g. with a stub).
+        """
+        with self.lock:
+            self.value = value
+            self.initialized = True
@@ -0,0 +1,76 @@
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT License.
+import os
+import sys
+import json
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from pii_prescreen import (  # noqa: E402
+    PATTERN_DETECTORS,
+    find_card_numbers,
+    is_clean,
+    is_luhn_valid,
+    recognize_locally
+)
+
+FIXTURES_PATH = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "..", "benchmarks", "data", "pii_fixtures.json"
+)
+
+with open(FIXTURES_PATH, "r") as fp:
+    FIXTURES = json.load(fp)
+
+CATEGORIES = sorted({entity["category"] for fixture in FIXTURES for entity in fixture["entities"]})
+
+
+def test_luhn_check():
+    assert is_luhn_valid("4111111111111111")
+    assert is_luhn_valid("79927398713")
+    assert not is_luhn_valid("4111111111111112")
+    assert not is_luhn_valid("79927398710")
+
+
+def test_card_numbers_require_valid_checksum():
+    assert find_card_numbers("card 4111 1111 1111 1111 please") == ["4111 1111 1111 1111"]
+    assert find_card_numbers("card 4111-1111-1111-1112 please") == []
+    # Too short for a card number:
+    assert find_card_numbers("order 79927398713") == []
+
+
+def test_no_false_negatives():
+    # Text with an entity is never clean for that entity's category:
+    for fixture in FIXTURES:
+        for entity in fixture["entities"]:
+            assert not is_clean(fixture["text"], [entity["category"]]), (fixture["text"], entity)
+        if fixture["entities"]:
+            assert not is_clean(fixture["text"], CATEGORIES), fixture["text"]
+
+
+def test_common_words_are_clean():
+    assert is_clean("thanks!", CATEGORIES)
+    assert is_clean("that's great, thanks for the help", CATEGORIES)
+    # Open-class categories need every word in the vocabulary:
+    assert not is_clean("how long does shipping take to Canada", ["ORGANIZATION"])
+    assert is_clean("how long does shipping take to Canada", list(PATTERN_DETECTORS))
+    # Pattern categories are screened by their candidate characters:
+    assert not is_clean("I bought 2 tents", ["ORDERID"])
+    assert not is_clean("reach me @ home", ["EMAIL"])
+
+
+def test_local_recognition_finds_pattern_entities():
+    for fixture in FIXTURES:
+        for entity in fixture["entities"]:
+            if entity["category"] not in PATTERN_DETECTORS:
+                continue
+            found = [e.text for e in recognize_locally(fixture["text"], [entity["category"]]).entities]
+            assert entity["text"] in found, (fixture["text"], entity)
+
+
+def test_local_recognition_reports_span_once():
+    # The card number also matches the order id and phone patterns:
+    result = recognize_locally(
+        "pay with 4111111111111111",
+        ["CREDITCARDNUMBER", "PHONENUMBER", "ORDERID"]
+    )
+    assert [(e.text, e.category) for e in result.entities] == [("4111111111111111", "CREDITCARDNUMBER")]
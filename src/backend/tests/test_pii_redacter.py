@@ -0,0 +1,100 @@
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT License.
+import os
+import sys
+import json
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+import pii_redacter  # noqa: E402
+from pii_redacter import PIIContext, RedactionMapping  # noqa: E402
+
+FIXTURES_PATH = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "..", "benchmarks", "data", "pii_fixtures.json"
+)
+
+with open(FIXTURES_PATH, "r") as fp:
+    FIXTURES = json.load(fp)
+
+
+@pytest.fixture
+def local_recognition(monkeypatch):
+    """
+    Recognize pattern categories offline.
+    """
+    monkeypatch.setattr(pii_redacter, "PII_RECOGNITION_MODE", "local")
+    monkeypatch.setattr(pii_redacter, "CATEGORIES", ["EMAIL", "PHONENUMBER", "ORDERID"])
+
+
+def test_longest_entity_wins():
+    mapping = RedactionMapping({
+        "{PII_PERSON_1}": "John",
+        "{PII_PERSON_2}": "John Smith"
+    })
+    assert mapping.redact("John Smith met John") == "{PII_PERSON_2} met {PII_PERSON_1}"
+
+
+def test_repeated_entity_uses_first_key():
+    mapping = RedactionMapping({
+        "{PII_ORDERID_1}": "123456",
+        "{PII_ORDERID_2}": "123456"
+    })
+    assert mapping.redact("123456 or 123456") == "{PII_ORDERID_1} or {PII_ORDERID_1}"
+
+
+def test_keys_sharing_prefix_reconstruct():
+    # {PII_ORDERID_1} is a prefix of {PII_ORDERID_10} up to the closing brace:
+    mapping = RedactionMapping({f"{{PII_ORDERID_{i}}}": str(100000 + i) for i in range(1, 12)})
+    text = "orders 100001, 100010 and 100011"
+    redacted = mapping.redact(text)
+    assert redacted == "orders {PII_ORDERID_1}, {PII_ORDERID_10} and {PII_ORDERID_11}"
+    assert mapping.reconstruct(redacted) == text
+
+
+def test_empty_mapping_is_identity():
+    mapping = RedactionMapping({})
+    assert mapping.redact("John") == "John"
+    assert mapping.reconstruct("{PII_PERSON_1}") == "{PII_PERSON_1}"
+
+
+def test_fixture_round_trips():
+    for fixture in FIXTURES:
+        mapping = RedactionMapping({
+            f"{{PII_{entity['category']}_{i}}}": entity["text"]
+            for i, entity in enumerate(fixture["entities"], start=1)
+        })
+        redacted = mapping.redact(fixture["text"])
+        for entity in fixture["entities"]:
+            assert entity["text"] not in redacted, (fixture["text"], entity)
+        assert mapping.reconstruct(redacted) == fixture["text"]
+
+
+def test_context_round_trip(local_recognition):
+    context = PIIContext("conversation")
+    try:
+        text = "call me at 425-555-0123 about order 12345678"
+        redacted = context.redact(text)
+        assert "425-555-0123" not in redacted and "12345678" not in redacted
+        assert context.reconstruct(redacted) == text
+    finally:
+        context.close()
+
+
+def test_context_is_covered(local_recognition):
+    context = PIIContext("conversation")
+    try:
+        assert not context.is_covered("order 12345678")
+        context.redact("call me at 425-555-0123 about order 12345678")
+
+        # Contained in recognized text:
+        assert context.is_covered("order 12345678")
+        # Only known entities besides clean text:
+        assert context.is_covered("is 12345678 shipped")
+        # A new entity:
+        assert not context.is_covered("order 12345678 and 87654321")
+        # Known entity is a prefix of a longer number:
+        assert not context.is_covered("call 425-555-01234")
+    finally:
+        context.close()
@@ -0,0 +1,189 @@
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT License.
+import os
+import sys
+import types
+import asyncio
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+import resilience  # noqa: E402
+from resilience import (  # noqa: E402
+    CLOSED,
+    HALF_OPEN,
+    OPEN,
+    CircuitBreaker,
+    CircuitOpenError,
+    DependencyPolicy,
+    DependencyTimeoutError,
+    RetriesExhaustedError
+)
+
+
+class StatusError(Exception):
+    """
+    SDK-like HTTP error with status code and response headers.
+    """
+
+    def __init__(
+        self,
+        status_code: int,
+        headers: dict = None
+    ):
+        super().__init__(f"status {status_code}")
+        self.status_code = status_code
+        self.response = types.SimpleNamespace(headers=headers or {})
+
+
+def failing(*errors):
+    """
+    Function raising errors in turn (then returning "ok"), counting calls.
+    """
+    remaining = list(errors)
+
+    def function(**kwargs):
+        function.calls += 1
+        if remaining:
+            raise remaining.pop(0)
+        return "ok"
+
+    function.calls = 0
+    return function
+
+
+def create_policy(
+    max_retries: int = 2,
+    failure_threshold: int = 3
+) -> DependencyPolicy:
+    return DependencyPolicy(
+        "test",
+        timeout=0,
+        max_retries=max_retries,
+        create_kwargs=lambda timeout: {},
+        breaker=CircuitBreaker(failure_threshold=failure_threshold, reset_timeout=30)
+    )
+
+
+@pytest.fixture(autouse=True)
+def no_backoff(monkeypatch):
+    monkeypatch.setattr(resilience, "RESILIENCE_ENABLED", True)
+    monkeypatch.setattr(resilience, "RETRY_BACKOFF_BASE", 0.0)
+
+
+def test_circuit_transitions():
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=30)
+    assert breaker.allow() == CLOSED
+
+    breaker.record_failure()
+    assert breaker.get_state() == CLOSED
+    breaker.record_failure()
+    assert breaker.get_state() == OPEN
+    assert breaker.allow() is None
+
+    # One trial call after the reset timeout:
+    breaker.opened_at -= breaker.reset_timeout
+    assert breaker.get_state() == HALF_OPEN
+    assert breaker.allow() == HALF_OPEN
+    assert breaker.allow() is None
+
+    # A failed trial reopens the circuit:
+    breaker.record_failure()
+    assert breaker.get_state() == OPEN
+    assert breaker.allow() is None
+
+    # A successful trial closes it:
+    breaker.opened_at -= breaker.reset_timeout
+    assert breaker.allow() == HALF_OPEN
+    breaker.record_success()
+    assert breaker.get_state() == CLOSED
+    assert breaker.allow() == CLOSED
+
+
+def test_released_trial_allows_another():
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=30)
+    breaker.record_failure()
+    breaker.opened_at -= breaker.reset_timeout
+    assert breaker.allow() == HALF_OPEN
+    breaker.release()
+    assert breaker.allow() == HALF_OPEN
+
+
+def test_open_circuit_skips_calls():
+    policy = create_policy(max_retries=0, failure_threshold=2)
+    function = failing(StatusError(503), StatusError(503))
+    for _ in range(2):
+        with pytest.raises(RetriesExhaustedError):
+            policy.call(function)
+
+    with pytest.raises(CircuitOpenError):
+        policy.call(function)
+    assert function.calls == 2
+    assert policy.counts["skipped"] == 1
+
+    # Trial call closes the circuit:
+    policy.breaker.opened_at -= policy.breaker.reset_timeout
+    assert policy.call(function) == "ok"
+    assert policy.breaker.get_state() == CLOSED
+
+
+def test_transient_errors_are_retried():
+    policy = create_policy(max_retries=2)
+    function = failing(StatusError(503), StatusError(429, {"retry-after-ms": "1"}))
+    assert policy.call(function) == "ok"
+    assert function.calls == 3
+    assert policy.counts["retries"] == 2
+    assert policy.counts["retry_after"] == 1
+
+
+def test_retries_exhausted():
+    policy = create_policy(max_retries=2)
+    function = failing(*[StatusError(503)] * 3)
+    with pytest.raises(RetriesExhaustedError) as info:
+        policy.call(function)
+    assert info.value.attempts == 3
+    assert function.calls == 3
+    assert policy.counts["failures"] == 1
+
+
+def test_long_retry_after_fails_fast():
+    policy = create_policy(max_retries=2)
+    retry_after = str(resilience.RETRY_BACKOFF_MAX + 60)
+    function = failing(StatusError(429, {"retry-after": retry_after}))
+    with pytest.raises(RetriesExhaustedError):
+        policy.call(function)
+    assert function.calls == 1
+    assert policy.counts["retries"] == 0
+    assert policy.counts["failures"] == 1
+
+
+def test_client_errors_are_not_retried():
+    policy = create_policy(max_retries=2, failure_threshold=1)
+    error = StatusError(400)
+    function = failing(error)
+    with pytest.raises(StatusError) as info:
+        policy.call(function)
+    assert info.value is error
+    assert function.calls == 1
+    assert policy.counts["errors"] == 1
+    # The dependency responded, so the circuit stays closed:
+    assert policy.breaker.get_state() == CLOSED
+
+
+def test_async_timeout():
+    policy = DependencyPolicy(
+        "test",
+        timeout=0.01,
+        max_retries=1,
+        create_kwargs=lambda timeout: {},
+        breaker=CircuitBreaker(failure_threshold=3, reset_timeout=30)
+    )
+
+    async def slow():
+        await asyncio.sleep(1)
+
+    with pytest.raises(DependencyTimeoutError) as info:
+        asyncio.run(policy.call_async(slow))
+    assert info.value.attempts == 2
+    assert policy.counts["timeouts"] == 2
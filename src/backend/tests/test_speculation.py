@@ -0,0 +1,29 @@
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT License.
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from speculation import SpeculationBudget  # noqa: E402
+
+
+def test_fractional_rate_allows_speculation():
+    budget = SpeculationBudget(0.5)
+    assert budget.acquire()
+    assert not budget.acquire()
+
+    # One token refills after 1 / rate seconds:
+    budget.updated -= 2.0
+    assert budget.acquire()
+    assert not budget.acquire()
+
+
+def test_rate_limits_bursts():
+    budget = SpeculationBudget(3)
+    assert [budget.acquire() for _ in range(4)] == [True, True, True, False]
+
+
+def test_zero_rate_is_unlimited():
+    budget = SpeculationBudget(0)
+    assert all(budget.acquire() for _ in range(100))
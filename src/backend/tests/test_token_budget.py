@@ -0,0 +1,130 @@
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT License.
+import os
+import sys
+import logging
+import importlib
+
+import pytest
+
+SRC = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src")
+sys.path.insert(0, SRC)
+
+from session_store import InMemorySessionStore  # noqa: E402
+from token_budget import compact_history, count_tokens, split_turns  # noqa: E402
+
+
+def tool_call(id: str) -> dict:
+    return {"id": id, "type": "function", "function": {"name": "get_cqa", "arguments": "{}"}}
+
+
+def create_history() -> list[dict]:
+    """
+    Summary, then turns with and without tool calls.
+    """
+    return [
+        {"role": "system", "content": "Conversation summary: earlier turns"},
+        {"role": "user", "content": "where is my order " * 10},
+        {"role": "assistant", "content": None, "tool_calls": [tool_call("a"), tool_call("b")]},
+        {"role": "tool", "tool_call_id": "a", "name": "get_cqa", "content": "shipped " * 20},
+        {"role": "tool", "tool_call_id": "b", "name": "get_cqa", "content": "in transit " * 20},
+        {"role": "assistant", "content": "It is on its way."},
+        {"role": "user", "content": "thanks"},
+        {"role": "assistant", "content": "You're welcome."},
+        {"role": "user", "content": "what is the return policy " * 5},
+        {"role": "assistant", "content": None, "tool_calls": [tool_call("c")]},
+        {"role": "tool", "tool_call_id": "c", "name": "get_cqa", "content": "30 days " * 10}
+    ]
+
+
+def test_split_turns():
+    history = create_history()
+    summary, turns = split_turns(history)
+    assert summary == history[:1]
+    assert [len(turn) for turn in turns] == [5, 2, 3]
+    assert all(turn[0]["role"] == "user" for turn in turns)
+
+
+def test_split_turns_without_leading_user():
+    # A trimmed window may start mid-turn:
+    history = create_history()[3:]
+    summary, turns = split_turns(history)
+    assert summary == []
+    assert turns[0][0]["role"] == "tool"
+    assert [len(turn) for turn in turns] == [3, 2, 3]
+
+
+def test_compaction_keeps_tool_results_with_their_call():
+    history = create_history()
+    for budget in range(0, count_tokens(history) + 1, 5):
+        kept, dropped = compact_history(history, budget)
+        # Whole turns are dropped oldest first, summary included:
+        assert dropped + kept == history
+        assert count_tokens(kept) <= budget
+        if kept:
+            assert kept[0]["role"] == "user"
+
+        call_ids = {
+            call["id"] for message in kept for call in message.get("tool_calls") or []
+        }
+        for message in kept:
+            if message["role"] == "tool":
+                assert message["tool_call_id"] in call_ids
+
+
+def test_compaction_drops_oldest_turns_and_summary():
+    history = create_history()
+    last_turn = history[8:]
+    kept, dropped = compact_history(history, count_tokens(last_turn))
+    assert kept == last_turn
+    assert dropped == history[:8]
+
+
+def test_no_compaction_within_budget():
+    history = create_history()
+    assert compact_history(history, count_tokens(history)) == (history, [])
+
+
+@pytest.fixture
+def aoai_client(monkeypatch):
+    # Prompts are loaded relative to the source directory:
+    monkeypatch.chdir(SRC)
+    return importlib.import_module("aoai_client")
+
+
+def test_summarize_keeps_one_summary(aoai_client):
+    class Session(aoai_client.ChatSessionMixin):
+        def __init__(self):
+            self.deployment = "test"
+            self.logger = logging.getLogger("test")
+            self.init_session(
+                system_message="You are a helpful assistant.",
+                session_store=InMemorySessionStore("test", max_messages=100),
+                token_budget=300,
+                history_compaction="summarize"
+            )
+
+    def count_summaries(messages: list[dict]) -> int:
+        return sum(
+            1 for m in messages
+            if m["role"] == "system" and m["content"].startswith("Conversation summary:")
+        )
+
+    session = Session()
+    summaries = 0
+    for i in range(8):
+        message = f"question {i} " + "about tents " * 20
+        messages, dropped = session.start_turn("c", session.get_session_messages("c"), message)
+        if dropped:
+            # Earlier summary is dropped too, to be folded into the new one:
+            assert count_summaries(dropped) == min(summaries, 1)
+            messages = session.insert_summary("c", messages, len(messages) - 1, f"summary {i}")
+            summaries += 1
+
+        assert count_summaries(messages) == min(summaries, 1)
+        assert messages[0]["content"] == "You are a helpful assistant."
+        assert messages[-1] == {"role": "user", "content": message}
+        session.save_turn("c", message, messages[-1:] + [{"role": "assistant", "content": "answer " * 20}])
+
+    assert summaries > 1
+    assert count_summaries(session.session_store.get("c")) == 1
@@ -7,6 +7,7 @@ const Chat = () => {
     const [messages, setMessages] = useState([]);
     const [isTyping, setIsTyping] = useState(false);
     const messageEndRef = useRef(null);
+    const conversationId = useRef(crypto.randomUUID());
     const welcomeMessage = 'Ask a question...';
 
     const scrollToBottom = () => {
@@ -22,23 +23,54 @@ const Chat = () => {
             method: "POST",
             headers: {
                 "Content-Type": "application/json",
-                "Accept": "application/json"
+                "Accept": "text/event-stream"
             },
             body: JSON.stringify({
-                message: userMessageContent
+                message: userMessageContent,
+                conversation_id: conversationId.current
             })
         }
     };
 
-    const parseSystemResponse = (systemResponse) => {
-        const messages = systemResponse["messages"]
-        return messages
-    }
+    const readSystemEvents = async function* (response) {
+        // Parse server-sent events from streamed response body:
+        const reader = response.body.getReader();
+        const decoder = new TextDecoder();
+        let buffer = "";
+
+        while (true) {
+            const { done, value } = await reader.read();
+            if (done) {
+                break;
+            }
+
+            buffer += decoder.decode(value, { stream: true });
+            const events = buffer.split("\n\n");
+            buffer = events.pop();
+            for (const event of events) {
+                if (event.startsWith("data: ")) {
+                    yield JSON.parse(event.slice("data: ".length));
+                }
+            }
+        }
+    };
+
+    const updateSystemMessage = (streamId, index, update) => {
+        setMessages((prevMessages) => prevMessages.map((msg) =>
+            (msg.streamId === streamId && msg.index === index)
+                ? { ...msg, content: update(msg.content) }
+                : msg
+        ));
+    };
 
     const chatWithSystem = async (userMessageContent) => {
+        const streamId = crypto.randomUUID();
+        const start = performance.now();
+        let firstTokenLogged = false;
+
         try {
             const response = await fetch(
-                `/chat`,
+                `/chat/stream`,
                 createSystemInput(userMessageContent)
             );
 
@@ -46,11 +78,38 @@ const Chat = () => {
                 throw new Error("Oops! Bad chat response.");
             }
 
-            const systemResponse = await response.json();
-            const systemMessages = parseSystemResponse(systemResponse);
-            console.log(systemMessages)
+            for await (const event of readSystemEvents(response)) {
+                if (event.type === "start") {
+                    // Reserve one system message per utterance:
+                    const placeholders = Array.from({ length: event.count }, (_, index) => (
+                        { role: "System", content: "", streamId: streamId, index: index }
+                    ));
+                    setMessages((prevMessages) => [...prevMessages, ...placeholders]);
+                    continue;
+                }
 
-            return systemMessages;
+                if (!firstTokenLogged && (event.type === "token" || event.type === "message")) {
+                    console.log(`Time to first token: ${Math.round(performance.now() - start)} ms`);
+                    firstTokenLogged = true;
+                }
+
+                if (event.type === "token") {
+                    updateSystemMessage(streamId, event.index, (content) => content + event.content);
+                } else if (event.type === "message") {
+                    updateSystemMessage(streamId, event.index, () => event.content);
+                } else if (event.type === "error") {
+                    if (event.index === undefined) {
+                        // The whole request failed:
+                        setMessages((prevMessages) => [
+                            ...prevMessages, { role: "System", content: event.content }
+                        ]);
+                    } else {
+                        updateSystemMessage(streamId, event.index, () => event.content);
+                    }
+                } else if (event.type === "end") {
+                    break;
+                }
+            }
         } catch (error) {
             console.error("Error while processing chat: ", error)
         }
@@ -62,21 +121,15 @@ const Chat = () => {
         ]);
 
         setIsTyping(true);
-        const systemMessages = await chatWithSystem(userMessageContent);
+        await chatWithSystem(userMessageContent);
         setIsTyping(false);
-
-        for (const msg of systemMessages) {
-            setMessages((prevMessages) => [
-                ...prevMessages, { role: "System", content: msg }
-            ]);
-        }
     };
 
     return (
         <div className="chat-container">
             <div className="chat-messages">
                 {messages.length == 0 && (<div className="message.content">{welcomeMessage}</div>)}
-                {messages.map((message, index) => (
+                {messages.filter((message) => message.content !== "").map((message, index) => (
                     <div key={index} tabindex="0" className={message.role === 'user' ? "message.user" : "message.agent"}>
                         <div className="message">
                             <h3 className="message-header">{message.role}</h3>